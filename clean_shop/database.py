@@ -0,0 +1,65 @@
+"""
+SQLite settings for running the shop under several worker processes.
+
+Everything is read from the environment so a deployment can tune it
+without code changes; SQLITE_TUNING=0 gives back Django's stock
+configuration (rollback journal, deferred transactions, a new connection
+per request), which is what `manage.py benchmark_sqlite` compares against.
+"""
+import os
+
+
+def _env(name, default):
+    return os.environ.get(name, str(default))
+
+
+def sqlite_pragmas():
+    """PRAGMAs run on every new connection, in order."""
+    return {
+        # القرّاء لا ينتظرون الكاتب، والكاتب لا ينتظر القرّاء
+        'journal_mode': _env('SQLITE_JOURNAL_MODE', 'WAL'),
+        # مع WAL يبقى NORMAL آمناً من تلف القاعدة؛ قد تضيع آخر معاملة عند انقطاع الكهرباء فقط
+        'synchronous': _env('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': _env('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'mmap_size': _env('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        # بالسالب = كيلوبايت: 64MB لكل اتصال
+        'cache_size': _env('SQLITE_CACHE_SIZE', -64 * 1024),
+        'temp_store': _env('SQLITE_TEMP_STORE', 'MEMORY'),
+    }
+
+
+def sqlite_database(base_dir, name=None):
+    database = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name or _env('SQLITE_PATH', base_dir / 'db.sqlite3'),
+    }
+    if _env('SQLITE_TUNING', 1) != '1':
+        return database
+
+    pragmas = sqlite_pragmas()
+    database.update({
+        # إعادة استخدام الاتصال بين الطلبات بدل فتحه وتطبيق الـ PRAGMAs كل مرة
+        'CONN_MAX_AGE': int(_env('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items()),
+            # BEGIN IMMEDIATE: المعاملة تأخذ قفل الكتابة من أولها فتنتظر دورها (busy_timeout)
+            # بدل أن تفشل بـ "database is locked" عند ترقية قفل القراءة في منتصف الشراء
+            'transaction_mode': _env('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+            'timeout': int(pragmas['busy_timeout']) / 1000,
+        },
+    })
+    return database
+
+
+def sqlite_replicas(base_dir):
+    """
+    {'replica1': {...}, ...} from SQLITE_REPLICAS (comma-separated file paths).
+    SQLite has no replication of its own: the files are refreshed from the
+    primary with `manage.py sync_replicas`. Under tests they mirror `default`.
+    """
+    paths = [path.strip() for path in _env('SQLITE_REPLICAS', '').split(',') if path.strip()]
+    replicas = {}
+    for i, path in enumerate(paths, start=1):
+        replicas[f'replica{i}'] = {**sqlite_database(base_dir, name=path), 'TEST': {'MIRROR': 'default'}}
+    return replicas
@@ -1,5 +1,8 @@
+import os
 from pathlib import Path
 
+from .database import sqlite_database, sqlite_replicas
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'change-me-in-production'
@@ -24,7 +27,10 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
 
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'products.middleware.CachedAuthenticationMiddleware',  # AuthenticationMiddleware + كاش للمستخدم
+    'products.middleware.InstrumentationMiddleware',  # بعد المصادقة حتى يعرف من هو staff
+    'products.middleware.ReplicaPinningMiddleware',
+    'products.middleware.AnonymousCartMiddleware',  # سلة الزائر (كوكي) تُدمج في سلة المستخدم عند الدخول
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -50,13 +56,64 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'clean_shop.wsgi.application'
 
+# WAL و busy_timeout وإعادة استخدام الاتصالات؛ كل شيء قابل للتعديل بمتغيرات البيئة (clean_shop/database.py)
 DATABASES = {
+    'default': sqlite_database(BASE_DIR),
+    **sqlite_replicas(BASE_DIR),
+}
+
+# ---------------- Read replicas ----------------
+# قراءات الكتالوج تذهب للنسخ (replicas)؛ السلة والطلبات والحسابات وكل كتابة تبقى على الأساسية
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['products.routers.PrimaryReplicaRouter']
+REPLICA_READ_MODELS = {
+    'products.product',
+    'products.productsearchindex',
+    'products.dailysales',
+    'products.dailyproductsales',
+}
+# بعد أي كتابة يقرأ نفس المتصفح من الأساسية لهذه المدة (ثوانٍ) حتى يرى ما كتبه
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 15))
+
+# ---------------- Cache ----------------
+# الكاشات التي يجب أن يراها كل workers (gunicorn/uvicorn) تُحفظ كملفات هنا افتراضياً؛
+# LocMem يبقى لكل عملية وحدها، فيُستخدم في الاختبارات فقط (clean_shop/test_runner.py)
+CACHE_DIR = Path(os.environ.get('CACHE_DIR', BASE_DIR / 'var' / 'cache'))
+
+# كاش الكتالوج: ملفات مشتركة حتى يُسقط invalidate_products الصفحات القديمة في كل الـ workers،
+# لا في العملية التي حفظت المنتج وحدها
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 600))
+# FileBasedCache ليس LRU: عند بلوغ MAX_ENTRIES يحذف ملفات عشوائية (1/CULL_FREQUENCY منها، الثلث افتراضياً)
+# بغض النظر عن آخر استخدام، فقد تسقط صفحات ساخنة؛ ارفع الحد بدل الاعتماد على الإزالة
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'products.cache.CountingFileBasedCache',
+        'LOCATION': os.environ.get('CATALOG_CACHE_DIR', CACHE_DIR / 'catalog'),
+        'TIMEOUT': CATALOG_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', 5000))},
+    },
 }
 
+# ---------------- Sessions ----------------
+# cached_db: القراءة من الكاش والكتابة للقاعدة أيضاً؛ signed_cookies: بدون قاعدة بيانات إطلاقاً
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('SESSION_BACKEND', 'cached_db')
+SESSION_CACHE_ALIAS = 'sessions'
+# فيه أيضاً كاش request.user (products/auth.py)، لذلك يجب أن يكون مشتركاً بين الـ workers:
+# وإلا يبقى المستخدم داخلاً (أو staff) في worker آخر بعد الخروج أو سحب الصلاحية
+# الإزالة عند MAX_ENTRIES عشوائية هنا أيضاً؛ مع cached_db تكلّف الجلسة المحذوفة قراءة من القاعدة فقط
+CACHES['sessions'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.environ.get('SESSION_CACHE_DIR', CACHE_DIR / 'sessions'),
+    'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', 20000))},
+}
+# الرسائل في كوكي بدل الجلسة: messages.success لا يكتب في django_session
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 AUTH_PASSWORD_VALIDATORS = []
 
 LANGUAGE_CODE = 'ar'
@@ -71,8 +128,71 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# توليد النسخ المصغّرة للصور في threads خلفية بعد الحفظ
+PRODUCT_IMAGE_ASYNC = os.environ.get('PRODUCT_IMAGE_ASYNC', '1') == '1'
+PRODUCT_IMAGE_WORKERS = int(os.environ.get('PRODUCT_IMAGE_WORKERS', 2))
+
+# ---------------- Background jobs ----------------
+# رسائل التأكيد ومزامنة الـ ERP تُنفَّذ في `manage.py run_jobs` بعد نجاح الطلب، لا داخله
+# JOBS_EAGER=1 ينفّذ المهمة فور إضافتها (للتطوير بدون worker)
+JOBS_EAGER = os.environ.get('JOBS_EAGER', '0') == '1'
+JOBS_BACKOFF_SECONDS = int(os.environ.get('JOBS_BACKOFF_SECONDS', 10))
+JOBS_BACKOFF_MAX_SECONDS = int(os.environ.get('JOBS_BACKOFF_MAX_SECONDS', 3600))
+# مهمة "قيد التنفيذ" أقدم من هذا تعني أن الـ worker توقف؛ تعود للطابور
+JOBS_LOCK_TIMEOUT = int(os.environ.get('JOBS_LOCK_TIMEOUT', 600))
+ERP_INVENTORY_URL = os.environ.get('ERP_INVENTORY_URL', '')
+ERP_TIMEOUT = float(os.environ.get('ERP_TIMEOUT', 10))
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'shop@localhost')
+
+# ---------------- Inventory ----------------
+# دفتر حركات وحجوزات مؤقتة بدل تعديل Product.stock عند كل بيع (products/inventory.py)
+# الحجز يبقى هذه المدة بعد آخر تعديل على السلة، ثم يعيده `manage.py reap_reservations`
+INVENTORY_HOLD_SECONDS = int(os.environ.get('INVENTORY_HOLD_SECONDS', 15 * 60))
+# المتاح لكل منتج موزّع على عدة صفوف حتى لا ينتظر كل المشترين نفس الصف
+INVENTORY_SHARDS = int(os.environ.get('INVENTORY_SHARDS', 8))
+# 0: مبيعات الطلب تُرحَّل إلى Product.stock في reap_reservations فقط (لا كتابة على المنتج أثناء العرض)
+INVENTORY_POST_ON_COMMIT = os.environ.get('INVENTORY_POST_ON_COMMIT', '1') == '1'
+# عدّاد المتاح لكل منتج: مشترك بين الـ workers، وإلا يبقى صفر قديم في worker لم يرَ الإرجاع
+INVENTORY_CACHE_ALIAS = 'inventory'
+INVENTORY_COUNTER_TIMEOUT = int(os.environ.get('INVENTORY_COUNTER_TIMEOUT', 60))
+CACHES['inventory'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.environ.get('INVENTORY_CACHE_DIR', CACHE_DIR / 'inventory'),
+}
+
+# ---------------- Metrics ----------------
+# زمن كل view وعدد استعلاماتها؛ تُعرض بصيغة Prometheus على /metrics/ للـ staff
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+# أقصى عدد استعلامات لكل view (باسم الـ URL)؛ التجاوز يُسجَّل في السجل، ويرفع خطأ أثناء الاختبارات
+QUERY_BUDGETS = {
+    'home_page': 6,
+    'view_cart': 8,
+    # يشمل حجز أسطر السلة التي لم تُحجز عند الإضافة، وأول حجز لمنتج ينشئ شرائح مخزونه
+    'checkout': 35,
+    'my_orders': 5,
+    'api_products': 5,
+    'api_product_detail': 5,
+    'api_cart': 8,
+    'api_orders': 5,
+    'api_order_detail': 5,
+    'api_sales_report': 5,
+    'api_product_availability': 3,
+    'async_api_products': 5,
+    'async_api_product_detail': 5,
+    'async_api_cart': 8,
+    'async_api_orders': 5,
+}
+# الاختبارات تشغّله دائماً (clean_shop/test_runner.py)
+QUERY_BUDGET_RAISE = os.environ.get('QUERY_BUDGET_RAISE', '0') == '1'
+# ?_profile=1 يعيد تقرير cProfile بدل الصفحة (staff فقط)
+REQUEST_PROFILING = os.environ.get('REQUEST_PROFILING', '1' if DEBUG else '0') == '1'
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# كاشات في الذاكرة وحدود الاستعلامات كأخطاء أثناء `manage.py test`
+TEST_RUNNER = 'clean_shop.test_runner.ShopTestRunner'
+
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
@@ -81,4 +201,9 @@ LOGOUT_REDIRECT_URL = '/'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [],
     'DEFAULT_PERMISSION_CLASSES': [],
+    # نفس بايتات JSONRenderer؛ يستخدم orjson إذا كان مثبتاً
+    'DEFAULT_RENDERER_CLASSES': [
+        'products.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
\ No newline at end of file
@@ -0,0 +1,29 @@
+"""
+Test runner for `manage.py test`.
+
+The production caches are files shared by every worker; the test run is a
+single process, so it swaps them for LocMem (nothing left on disk between
+runs) and turns the per-view query budgets into failures.
+"""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# الكاشات نفسها بنفس الأسماء، لكن في ذاكرة العملية
+TEST_CACHES = {
+    'catalog': {'BACKEND': 'products.cache.CountingLocMemCache', 'LOCATION': 'catalog'},
+    'sessions': {'BACKEND': 'products.cache.AsyncLocMemCache', 'LOCATION': 'sessions'},
+    'inventory': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'inventory'},
+}
+
+
+class ShopTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        caches = {alias: {**config, **TEST_CACHES.get(alias, {})} for alias, config in settings.CACHES.items()}
+        self._test_settings = override_settings(CACHES=caches, QUERY_BUDGET_RAISE=True)
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,22 +1,224 @@
-from django.contrib import admin
-from .models import Product, Order, OrderItem, Cart, CartItem
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Now, Round
+
+from . import inventory
+from .cache import invalidate_products
+from .models import Product, Order, OrderItem, Cart, CartItem, Job, StockMovement, StockReservation
+from .pagination import EstimatedCountPaginator
+from .search import search_products
+
+
+# ---------------- Shared ----------------
+# جداول الطلبات والأسطر قد تصل للملايين: لا COUNT(*) كامل، ولا قوائم منسدلة
+# تحمّل كل المنتجات، وكل عمود في القائمة يأتي من نفس الاستعلام (list_select_related)
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class ReadOnlyAdmin(LargeTableAdmin):
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class InStockFilter(admin.SimpleListFilter):
+    title = "التوفر"
+    parameter_name = 'available'
+
+    def lookups(self, request, model_admin):
+        return [('1', "متوفر"), ('0', "نفد")]
+
+    def queryset(self, request, queryset):
+        # stock > 0 يطابق شرط الفهارس الجزئية على المنتجات
+        if self.value() == '1':
+            return queryset.filter(stock__gt=0)
+        if self.value() == '0':
+            return queryset.filter(stock__lte=0)
+        return queryset
+
+
+# ---------------- Products ----------------
+class ProductActionForm(ActionForm):
+    value = forms.DecimalField(label="القيمة", required=False, max_digits=12, decimal_places=2)
+    # لإجراءات المخزون: عدد صحيح، فلا تُقطع الكسور بصمت
+    units = forms.IntegerField(label="الوحدات", required=False)
+
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ("name", "price", "description")
+class ProductAdmin(LargeTableAdmin):
+    list_display = ("name", "sku", "price", "stock", "updated_at")
+    list_filter = (InStockFilter,)
+    # المخزون يتغير عبر دفتر الحركات فقط (إجراءات المخزون أدناه)
+    readonly_fields = ("stock",)
+    search_fields = ("name",)
+    action_form = ProductActionForm
+    actions = ["set_price", "change_price_percent", "set_stock", "add_stock"]
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # حقول النموذج فقط: المخزون والنسخ المصغّرة يكتبهما الدفتر ومولّد النسخ أثناء التعديل
+        obj.save(update_fields=[*form.changed_data, 'updated_at'])
+
+    def get_search_results(self, request, queryset, search_term):
+        # فهرس FTS5 بدل LIKE '%...%' على كل الجدول؛ يخدم البحث والـ autocomplete معاً
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        by_sku = queryset.filter(sku=term)
+        if by_sku.exists():
+            return by_sku, False
+        return search_products(queryset, term), False
+
+    # ---- Bulk actions: UPDATE واحد مهما كان عدد المنتجات المحددة ----
+    def action_value(self, request, minimum=None, field='value'):
+        form_field = ProductActionForm.base_fields[field]
+        try:
+            value = form_field.clean(request.POST.get(field))
+        except ValidationError:
+            value = None
+        if value is None:
+            self.message_user(request, f"أدخل {form_field.label} في الحقل بجانب الإجراء.", messages.ERROR)
+            return None
+        if minimum is not None and value < minimum:
+            self.message_user(request, f"القيمة يجب ألا تقل عن {minimum}.", messages.ERROR)
+            return None
+        return value
+
+    def bulk_update(self, request, queryset, **values):
+        ids = list(queryset.values_list('id', flat=True))
+        with transaction.atomic():
+            # update() لا يطلق post_save: نحدّث updated_at والكاش يدوياً
+            updated = Product.objects.filter(id__in=ids).update(**values, updated_at=Now())
+            transaction.on_commit(lambda: invalidate_products(ids))
+        self.message_user(request, f"تم تحديث {updated} منتج.", messages.SUCCESS)
+
+    def adjust_stock(self, request, queryset, count, kind):
+        # حركة في دفتر المخزون لكل منتج يتغير (products/inventory.py)، لا UPDATE مباشر
+        ids = list(queryset.values_list('id', flat=True))
+        with transaction.atomic():
+            current = inventory.on_hand(ids)
+            inventory.adjust(
+                {pid: count(units) - units for pid, units in current.items()},
+                kind=kind, reference=f'admin:{request.user.username}'[:64],
+            )
+        self.message_user(request, f"تم تحديث {len(current)} منتج.", messages.SUCCESS)
+
+    @admin.action(description="تحديد السعر")
+    def set_price(self, request, queryset):
+        value = self.action_value(request, minimum=0)
+        if value is not None:
+            self.bulk_update(request, queryset, price=value)
+
+    @admin.action(description="تغيير السعر بنسبة مئوية")
+    def change_price_percent(self, request, queryset):
+        value = self.action_value(request, minimum=-99)
+        if value is not None:
+            self.bulk_update(request, queryset, price=Round(F('price') * (1 + value / 100), 2))
+
+    @admin.action(description="تحديد المخزون")
+    def set_stock(self, request, queryset):
+        value = self.action_value(request, minimum=0, field='units')
+        if value is not None:
+            self.adjust_stock(request, queryset, lambda units: value, StockMovement.ADJUSTMENT)
+
+    @admin.action(description="إضافة للمخزون (أو خصم بقيمة سالبة)")
+    def add_stock(self, request, queryset):
+        value = self.action_value(request, field='units')
+        if value is not None:
+            kind = StockMovement.RECEIPT if value > 0 else StockMovement.ADJUSTMENT
+            self.adjust_stock(request, queryset, lambda units: max(units + value, 0), kind)
+
+
+# ---------------- Orders ----------------
+# أسطر الطلب للعرض فقط: Order.total وتجميعات المبيعات اليومية محسوبة منها عند الطلب،
+# وتعديلها هنا يتركهما قديمين بلا تنبيه
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    fields = readonly_fields = ("product", "quantity", "unit_price")
+    can_delete = False
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ("id", "customer_name", "created_at")
+class OrderAdmin(LargeTableAdmin):
+    list_display = ("id", "customer_name", "user", "total", "created_at")
+    list_select_related = ("user",)
+    list_filter = ("created_at",)
+    search_fields = ("=id", "=phone")
+    raw_id_fields = ("user",)
+    readonly_fields = ("total",)
+    inlines = [OrderItemInline]
+
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ("order", "product", "quantity")
+class OrderItemAdmin(ReadOnlyAdmin):
+    list_display = ("order", "product", "quantity", "unit_price")
+    # __str__ الطلب يقرأ المستخدم، و__str__ السطر يقرأ المنتج
+    list_select_related = ("order__user", "product")
+    search_fields = ("=order__id",)
+
 
+# ---------------- Carts ----------------
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
-    list_display = ("id", "created_at")
+class CartAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "created_at")
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
+
 
 @admin.register(CartItem)
-class CartItemAdmin(admin.ModelAdmin):
-    list_display = ("cart", "product", "quantity")
\ No newline at end of file
+class CartItemAdmin(LargeTableAdmin):
+    list_display = ("cart", "product", "quantity")
+    list_select_related = ("cart__user", "product")
+    search_fields = ("=cart__id",)
+    raw_id_fields = ("cart",)
+    autocomplete_fields = ("product",)
+
+
+# ---------------- Inventory ----------------
+@admin.register(StockMovement)
+class StockMovementAdmin(ReadOnlyAdmin):
+    # الدفتر للإضافة فقط: التصحيح حركة جديدة (إجراءات المخزون في المنتجات)
+    list_display = ("id", "product", "delta", "kind", "reference", "posted", "created_at")
+    list_select_related = ("product",)
+    list_filter = ("kind",)
+    search_fields = ("=product__id", "=reference")
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(ReadOnlyAdmin):
+    # تعديل الحجز أو حذفه من هنا لا يعيد الكمية للمتاح؛ ينتهي وحده ويعيده الـ reaper
+    list_display = ("cart", "product", "quantity", "expires_at")
+    list_select_related = ("cart__user", "product")
+    search_fields = ("=cart__id", "=product__id")
+
+
+# ---------------- Jobs ----------------
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = ("id", "name", "status", "attempts", "run_at", "finished_at")
+    # status مفهرس مع run_at؛ فلتر name يحتاج DISTINCT على كل الجدول
+    list_filter = ("status",)
+    search_fields = ("=idempotency_key",)
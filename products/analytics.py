@@ -0,0 +1,132 @@
+"""
+Sales rollups. Checkout adds each order to DailySales/DailyProductSales in
+the same transaction, so reports read a few hundred pre-aggregated rows
+instead of scanning OrderItem. `rebuild_rollups` recomputes them from
+history (management command: rebuild_sales_rollups).
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyProductSales, DailySales, OrderItem
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+# ---------------- Incremental updates ----------------
+def record_order(order, items, sign=1):
+    """
+    Add (or with sign=-1, remove) one order and its lines to the rollups.
+    Orders without lines are not sales and are never counted.
+    """
+    if not items:
+        return
+    day = timezone.localdate(order.created_at)
+    units, revenue = defaultdict(int), defaultdict(Decimal)
+    for item in items:
+        units[item.product_id] += item.quantity
+        revenue[item.product_id] += item.total_price()
+
+    with transaction.atomic():
+        # نفس أسلوب سطور السلة: إنشاء الصف الناقص ثم زيادة بـ F() بدون قراءة ثم كتابة
+        DailySales.objects.bulk_create([DailySales(date=day)], ignore_conflicts=True)
+        DailySales.objects.filter(date=day).update(
+            orders=F('orders') + sign,
+            units=F('units') + sign * sum(units.values()),
+            revenue=F('revenue') + sign * sum(revenue.values(), Decimal('0')),
+        )
+        DailyProductSales.objects.bulk_create(
+            [DailyProductSales(date=day, product_id=pid) for pid in units],
+            ignore_conflicts=True,
+        )
+        DailyProductSales.objects.filter(date=day, product_id__in=units).update(
+            units=F('units') + Case(
+                *[When(product_id=pid, then=Value(sign * n)) for pid, n in units.items()],
+                output_field=IntegerField(),
+            ),
+            revenue=F('revenue') + Case(
+                *[When(product_id=pid, then=Value(sign * r)) for pid, r in revenue.items()],
+                output_field=MONEY,
+            ),
+        )
+        if sign < 0:
+            # لا نترك صفوفاً صفرية: الملخص يطابق ما ينتجه rebuild_rollups
+            DailyProductSales.objects.filter(date=day, product_id__in=units, units=0).delete()
+            DailySales.objects.filter(date=day, orders=0).delete()
+
+
+# ---------------- Rebuild from history ----------------
+def rebuild_rollups(start=None, end=None, batch_size=5000):
+    """Recompute the rollups for [start, end] (local dates, both optional). Returns the number of days."""
+    days = DailySales.objects.all()
+    product_days = DailyProductSales.objects.all()
+    items = OrderItem.objects.annotate(day=TruncDate('order__created_at'))
+    if start:
+        days = days.filter(date__gte=start)
+        product_days = product_days.filter(date__gte=start)
+        items = items.filter(day__gte=start)
+    if end:
+        days = days.filter(date__lte=end)
+        product_days = product_days.filter(date__lte=end)
+        items = items.filter(day__lte=end)
+    line_total = Sum(F('unit_price') * F('quantity'), output_field=MONEY)
+
+    with transaction.atomic():
+        days.delete()
+        product_days.delete()
+
+        rows = (
+            items.values_list('day', 'product_id')
+            .annotate(units=Sum('quantity'), revenue=line_total)
+            .order_by('day', 'product_id')
+            .iterator(chunk_size=batch_size)
+        )
+        while batch := [
+            DailyProductSales(date=day, product_id=pid, units=units, revenue=revenue)
+            for day, pid, units, revenue in islice(rows, batch_size)
+        ]:
+            DailyProductSales.objects.bulk_create(batch)
+
+        totals = [
+            DailySales(date=day, orders=orders, units=units, revenue=revenue)
+            for day, orders, units, revenue in items.values_list('day')
+            .annotate(orders=Count('order_id', distinct=True), units=Sum('quantity'), revenue=line_total)
+            .order_by('day')
+        ]
+        DailySales.objects.bulk_create(totals, batch_size=batch_size)
+    return len(totals)
+
+
+# ---------------- Reports ----------------
+def sales_report(start, end, top=10):
+    """Daily series and best sellers for [start, end], read from the rollups only."""
+    days = {
+        row['date']: row
+        for row in DailySales.objects.filter(date__range=(start, end))
+        .values('date', 'orders', 'units', 'revenue')
+    }
+    series = []
+    day = start
+    while day <= end:
+        # الأيام بدون مبيعات تظهر بأصفار حتى يبقى الرسم متصلاً
+        series.append(days.get(day, {'date': day, 'orders': 0, 'units': 0, 'revenue': Decimal('0.00')}))
+        day += timedelta(days=1)
+
+    top_products = list(
+        DailyProductSales.objects.filter(date__range=(start, end))
+        .values('product_id', name=F('product__name'))
+        .annotate(units=Sum('units'), revenue=Sum('revenue'))
+        .order_by('-revenue', 'product_id')[:top]
+    )
+    totals = {
+        'orders': sum(d['orders'] for d in series),
+        'units': sum(d['units'] for d in series),
+        'revenue': sum((d['revenue'] for d in series), Decimal('0.00')),
+    }
+    return {'from': start, 'to': end, 'totals': totals, 'days': series, 'top_products': top_products}
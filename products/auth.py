@@ -0,0 +1,69 @@
+"""
+Per-user cache for request.user. With the cached_db session engine this
+takes the django_session and auth_user reads off every page: the session
+comes from the cache, and so does the user as long as the session's auth
+hash still matches it (a password change or a different user under the
+same id is a miss). Saving or deleting a user drops their entry.
+
+The entry lives in the sessions cache, which has to be shared by every
+worker (file-based by default): with a per-process cache, a logout or a
+demotion is only seen by the worker that handled it.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+
+USER_CACHE_TIMEOUT = 300
+
+
+def user_cache():
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+def user_cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def get_cached_user(request):
+    session = request.session
+    user_id, backend_path, session_hash = (
+        session.get(SESSION_KEY), session.get(BACKEND_SESSION_KEY), session.get(HASH_SESSION_KEY)
+    )
+    if user_id is None or not session_hash or backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+
+    user = user_cache().get(user_cache_key(user_id))
+    if user is not None and constant_time_compare(session_hash, user.get_session_auth_hash()):
+        user.backend = backend_path
+        return user
+
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        user_cache().set(user_cache_key(user.pk), user, USER_CACHE_TIMEOUT)
+    return user
+
+
+async def aget_cached_user(request):
+    """get_cached_user() for async views (request.auser())."""
+    session = request.session
+    user_id, backend_path, session_hash = (
+        await session.aget(SESSION_KEY), await session.aget(BACKEND_SESSION_KEY), await session.aget(HASH_SESSION_KEY)
+    )
+    if user_id is None or not session_hash or backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return await auth.aget_user(request)
+
+    user = await user_cache().aget(user_cache_key(user_id))
+    if user is not None and constant_time_compare(session_hash, user.get_session_auth_hash()):
+        user.backend = backend_path
+        return user
+
+    user = await auth.aget_user(request)
+    if user.is_authenticated:
+        await user_cache().aset(user_cache_key(user.pk), user, USER_CACHE_TIMEOUT)
+    return user
+
+
+def forget_user(user_id):
+    user_cache().delete(user_cache_key(user_id))
@@ -0,0 +1,373 @@
+"""
+Helpers shared by the benchmark management commands. Everything runs
+against a throwaway test database, never the configured one.
+"""
+import io
+import json
+import random
+import socket
+import statistics
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from http.client import HTTPConnection
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.wsgi import get_wsgi_application
+from django.test import Client
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+from PIL import Image
+
+from .analytics import rebuild_rollups
+from .images import generate_variants
+from .models import Cart, CartItem, Order, OrderItem, Product
+
+
+WORDS = [
+    'قلم', 'دفتر', 'حقيبة', 'مصباح', 'كوب', 'ساعة', 'هاتف', 'شاحن', 'سماعة', 'كتاب',
+    'مكتبة', 'إضاءة', 'أزرق', 'أحمر', 'خشبي', 'جلد', 'قطن', 'مستشفى', 'سيارة', 'طاولة',
+    'lamp', 'cable', 'wooden', 'leather', 'cotton', 'charger', 'bottle', 'desk', 'chair', 'phone',
+]
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    old_config = setup_databases(verbosity=verbosity, interactive=False, aliases={'default'})
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=verbosity)
+
+
+def seed_products(count, batch_size=5000, seed=0, images=()):
+    """`images`: (name, variants) pairs from seed_images(), assigned round robin."""
+    rng = random.Random(seed)
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        products = []
+        for i in range(size):
+            product = Product(
+                name=' '.join(rng.choices(WORDS, k=3)) + f' {created + i}',
+                description=' '.join(rng.choices(WORDS, k=12)),
+                price=Decimal(rng.randint(100, 50000)) / 100,
+                stock=rng.randint(0, 50),
+            )
+            if images:
+                product.image, product.image_variants = images[(created + i) % len(images)]
+            products.append(product)
+        Product.objects.bulk_create(products)
+        created += size
+    return created
+
+
+def seed_images(count=8, seed=0):
+    """Write `count` distinct JPEGs to default_storage and render their variants once."""
+    rng = random.Random(seed)
+    images = []
+    for i in range(count):
+        buffer = io.BytesIO()
+        color = tuple(rng.randint(0, 255) for _ in range(3))
+        Image.new('RGB', (1600, 1200), color).save(buffer, 'JPEG')
+        name = default_storage.save(f'product_images/bench-{i}.jpg', ContentFile(buffer.getvalue()))
+        images.append((name, generate_variants(name)))
+    return images
+
+
+def seed_users(count, batch_size=5000, prefix='bench'):
+    # تجزئة كلمة المرور مرة واحدة: PBKDF2 لكل مستخدم يستغرق أطول من الإدخال نفسه
+    password = make_password('bench-pass')
+    users = [User(username=f'{prefix}{i}', password=password) for i in range(count)]
+    return User.objects.bulk_create(users, batch_size=batch_size)
+
+
+def seed_carts(users, lines=3, batch_size=5000, seed=0):
+    rng = random.Random(seed)
+    product_ids = list(Product.objects.values_list('id', flat=True))
+    carts = Cart.objects.bulk_create([Cart(user=user) for user in users], batch_size=batch_size)
+    CartItem.objects.bulk_create(
+        [
+            CartItem(cart=cart, product_id=pid, quantity=rng.randint(1, 3))
+            for cart in carts
+            for pid in rng.sample(product_ids, min(lines, len(product_ids)))
+        ],
+        batch_size=batch_size,
+    )
+    return carts
+
+
+def seed_orders(users, count, lines=3, days=90, batch_size=5000, seed=0):
+    """`count` historical orders spread over the last `days` days; rebuilds the sales rollups."""
+    rng = random.Random(seed)
+    prices = dict(Product.objects.values_list('id', 'price'))
+    product_ids = list(prices)
+    now = timezone.now()
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        orders, lines_by_order = [], []
+        for _ in range(size):
+            chosen = {pid: rng.randint(1, 3) for pid in rng.sample(product_ids, min(lines, len(product_ids)))}
+            orders.append(Order(
+                user=rng.choice(users), customer_name='عميل', phone='0599', address='الخليل',
+                total=sum(prices[pid] * qty for pid, qty in chosen.items()),
+            ))
+            lines_by_order.append(chosen)
+        orders = Order.objects.bulk_create(orders)
+        # created_at يأخذ وقت الإدخال (auto_now_add)؛ نوزّعه على الأيام السابقة بتحديث واحد لكل دفعة
+        for order in orders:
+            order.created_at = now - timedelta(days=rng.randint(0, days - 1), seconds=rng.randint(0, 86399))
+        Order.objects.bulk_update(orders, ['created_at'])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=pid, quantity=qty, unit_price=prices[pid])
+            for order, chosen in zip(orders, lines_by_order)
+            for pid, qty in chosen.items()
+        ])
+        created += size
+    rebuild_rollups()
+    return created
+
+
+def measure(func, repeat=20, warmup=2):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'samples': len(samples),
+    }
+
+
+# ---------------- Transports ----------------
+class ClientTransport:
+    """In-process requests through django.test.Client (no sockets, no CSRF checks)."""
+    name = 'client'
+
+    def __init__(self, user=None):
+        self.client = Client()
+        if user is not None:
+            self.client.force_login(user)
+
+    def request(self, method, path, data=None):
+        return getattr(self.client, method.lower())(path, data).status_code
+
+    def close(self):
+        pass
+
+
+class HTTPTransport:
+    """Plain HTTP/1.0 requests to a running server, keeping its cookies (session, CSRF)."""
+    name = 'http'
+
+    def __init__(self, address, session_key=None):
+        self.address = address
+        self.cookies = {'sessionid': session_key} if session_key else {}
+
+    def request(self, method, path, data=None):
+        headers = {'Host': 'localhost', 'Cookie': '; '.join(f'{k}={v}' for k, v in self.cookies.items())}
+        body = None
+        if method == 'POST':
+            body = urlencode(data or {})
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['X-CSRFToken'] = self.cookies.get('csrftoken', '')
+        elif data:
+            path = f'{path}?{urlencode(data)}'
+        connection = HTTPConnection(*self.address)
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            for header in response.headers.get_all('Set-Cookie') or []:
+                self.cookies.update({k: morsel.value for k, morsel in SimpleCookie(header).items()})
+            return response.status
+        finally:
+            connection.close()
+
+    def close(self):
+        pass
+
+
+class WSGITransport(HTTPTransport):
+    """Real HTTP against wsgiref serving the project's WSGI application in a thread."""
+    name = 'wsgi'
+
+    def __init__(self, user=None):
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        self.server = make_server('127.0.0.1', 0, get_wsgi_application(), handler_class=QuietHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        # جلسة حقيقية عبر Client ثم نرسل الكوكي مع كل طلب HTTP
+        session_key = ClientTransport(user).client.cookies['sessionid'].value if user is not None else None
+        super().__init__(self.server.server_address, session_key)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+TRANSPORTS = {'client': ClientTransport, 'wsgi': WSGITransport}
+
+
+# ---------------- Real servers (gunicorn / uvicorn) ----------------
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+@contextmanager
+def server_process(argv, env, port, cwd=None):
+    """Run a server command until the block exits; yields its address."""
+    server = subprocess.Popen(argv, env=env, cwd=cwd)
+    try:
+        if not wait_for_port(port):
+            raise RuntimeError(f"server did not start: {' '.join(argv)}")
+        yield ('127.0.0.1', port)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+@contextmanager
+def slow_clients(address, count, path, seconds=2.0, pieces=20):
+    """
+    `count` clients that each take `seconds` to send a request, like phones
+    on a bad network. A sync worker is stuck reading each one; an event
+    loop keeps serving everyone else meanwhile.
+    """
+    stop = threading.Event()
+    request = f'GET {path} HTTP/1.0\r\nHost: localhost\r\nUser-Agent: slow-client\r\n\r\n'.encode()
+    size = -(-len(request) // pieces)
+
+    def client():
+        while not stop.is_set():
+            try:
+                with socket.create_connection(address, timeout=seconds * 10) as sock:
+                    for i in range(0, len(request), size):
+                        sock.sendall(request[i:i + size])
+                        stop.wait(seconds / pieces)
+                    while sock.recv(65536):
+                        pass
+            except OSError:
+                stop.wait(0.1)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=seconds * 10)
+
+
+def http_load(address, sessions, next_path, duration, seed=0):
+    """
+    One thread per session key, each sending GETs from `next_path(rng)`
+    back to back for `duration` seconds. Returns latency percentiles,
+    request and error (5xx / connection failure) counts and throughput.
+    """
+    samples, errors = [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(session_key, rng):
+        http = HTTPTransport(address, session_key)
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                status = http.request('GET', next_path(rng))
+            except OSError:
+                status = 599
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                samples.append(elapsed)
+                if status >= 500:
+                    errors.append(status)
+
+    started = time.monotonic()
+    threads = [
+        threading.Thread(target=client, args=(key, random.Random(seed + i))) for i, key in enumerate(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.monotonic() - started
+
+    stats = summarize(samples) if samples else {'p50_ms': 0, 'p95_ms': 0, 'p99_ms': 0}
+    ok = len(samples) - len(errors)
+    return {**stats, 'requests': len(samples), 'errors': len(errors), 'throughput_rps': round(ok / wall, 1)}
+
+
+# ---------------- Result files ----------------
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_results(path, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def find_regressions(baseline, current, tolerance=0.2, metric='p95_ms'):
+    """
+    Compare two result files scenario by scenario. A scenario regresses when
+    `metric` grows by more than `tolerance` (a fraction) or it runs more
+    queries per request than before.
+    """
+    regressions = []
+    for key, before in baseline['scenarios'].items():
+        after = current['scenarios'].get(key)
+        if after is None:
+            continue
+        if after[metric] > before[metric] * (1 + tolerance):
+            regressions.append(f"{key}: {metric} {before[metric]} -> {after[metric]}")
+        if (after['queries_per_request'] or 0) > (before['queries_per_request'] or 0):
+            regressions.append(
+                f"{key}: queries/request {before['queries_per_request']} -> {after['queries_per_request']}"
+            )
+    return regressions
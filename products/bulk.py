@@ -0,0 +1,208 @@
+"""
+Streaming import/export shared by the management commands and the staff
+endpoints. Rows are read, validated and written in fixed-size batches, so
+memory stays flat however large the feed or the order history is.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .cache import invalidate_products
+from .inventory import set_on_hand
+from .models import Product, StockMovement
+from .search import index_products
+from .serializers import ProductImportSerializer
+
+EXPORT_FIELDS = ['id', 'sku', 'name', 'description', 'price', 'stock', 'created_at', 'updated_at']
+UPSERT_FIELDS = ['name', 'description', 'price']
+MAX_REPORTED_ERRORS = 100
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+# ---------------- Reading ----------------
+def iter_rows(stream, fmt):
+    """Yield (line number, dict) from a binary or text stream."""
+    if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(stream, 'mode', ''):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_num, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_num, json.loads(line)
+            except ValueError as e:
+                yield line_num, {'__error__': str(e)}
+    else:
+        raise UnsupportedFormat(fmt)
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# ---------------- Import ----------------
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, error):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': error})
+
+    def as_dict(self):
+        return {'imported': self.imported, 'failed': self.failed, 'errors': self.errors}
+
+
+def _upsert(valid_rows):
+    # المخزون لا يُكتب مباشرة: المنتج الجديد يبدأ من صفر والفرق حركة في دفتر المخزون.
+    # صف بلا مخزون (feed أسعار فقط مثلاً) لا يلمس المخزون ولا الدفتر
+    skus = [row['sku'] for row in valid_rows]
+    stock = {row['sku']: row['stock'] for row in valid_rows if 'stock' in row}
+    products = [Product(**{k: v for k, v in row.items() if k != 'stock'}) for row in valid_rows]
+    with transaction.atomic():
+        existing = set(Product.objects.filter(sku__in=stock).values_list('sku', flat=True))
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=[*UPSERT_FIELDS, 'updated_at'],
+        )
+        # bulk_create لا يطلق إشارات post_save: نحدّث فهرس البحث والكاش يدوياً
+        rows = list(
+            Product.objects.filter(sku__in=skus)
+            .values_list('id', 'name', 'description', 'sku')
+        )
+        index_products([row[:3] for row in rows])
+        # set_on_hand يضيف مزامنة الـ ERP للمنتجات التي تغيّر مخزونها فقط. المنتج الجديد
+        # يبدأ برصيد افتتاحي كما في open_stock_ledger، والموجود تسوية على ما في الدفتر
+        for kind, new in ((StockMovement.OPENING, True), (StockMovement.ADJUSTMENT, False)):
+            counts = {pid: stock[sku] for pid, _, _, sku in rows if sku in stock and (sku not in existing) == new}
+            set_on_hand(counts, kind=kind, reference='import')
+        ids = [row[0] for row in rows]
+        transaction.on_commit(lambda: invalidate_products(ids))
+
+
+def import_rows(rows, batch_size=1000):
+    """rows: iterable of (line number, dict). Invalid rows are skipped and reported."""
+    result = ImportResult()
+    # نسخة واحدة من الـ serializer لكل الصفوف: بناء الحقول مكلف إذا تكرر لكل صف
+    serializer = ProductImportSerializer()
+    for batch in _batches(rows, batch_size):
+        valid = {}
+        for line, row in batch:
+            if '__error__' in row:
+                result.add_error(line, row['__error__'])
+                continue
+            try:
+                data = serializer.run_validation(row)
+            except ValidationError as e:
+                result.add_error(line, e.detail)
+                continue
+            # آخر صف لنفس الـ SKU داخل الدفعة هو المعتمد
+            valid[data['sku']] = data
+        if valid:
+            _upsert(valid.values())
+            result.imported += len(valid)
+    return result
+
+
+# ---------------- Export ----------------
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _export_values(queryset, chunk_size):
+    return queryset.order_by('id').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def _plain(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if value is None:
+        return None
+    return str(value) if not isinstance(value, int) else value
+
+
+def export_rows(queryset, fmt, chunk_size=2000):
+    """Yield the export as text chunks (one row each) for StreamingHttpResponse or a file."""
+    values = _export_values(queryset, chunk_size)
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in values:
+            yield writer.writerow(['' if v is None else _plain(v) for v in row])
+    elif fmt == 'jsonl':
+        for row in values:
+            yield json.dumps(dict(zip(EXPORT_FIELDS, map(_plain, row))), ensure_ascii=False) + '\n'
+    else:
+        raise UnsupportedFormat(fmt)
+
+
+# ---------------- Order export ----------------
+ORDER_FIELDS = ['order_id', 'created_at', 'username', 'customer_name', 'phone', 'address', 'order_total']
+LINE_FIELDS = ['product_id', 'sku', 'product_name', 'quantity', 'unit_price', 'line_total']
+_ORDER_COLUMNS = ['id', 'created_at', 'user__username', 'customer_name', 'phone', 'address', 'total']
+_LINE_COLUMNS = ['items__product_id', 'items__product__sku', 'items__product__name', 'items__quantity', 'items__unit_price']
+
+
+def _order_values(queryset, chunk_size):
+    # استعلام واحد مع JOIN للأسطر والمنتجات، يُقرأ على دفعات (server-side cursor حيث يدعمه المحرك)
+    return (
+        queryset.order_by('id', 'items__id')
+        .values_list(*_ORDER_COLUMNS, *_LINE_COLUMNS)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def _split(row):
+    order = [_plain(v) for v in row[:len(_ORDER_COLUMNS)]]
+    product_id, sku, name, quantity, unit_price = row[len(_ORDER_COLUMNS):]
+    if product_id is None:
+        return order, None
+    line = [product_id, sku, name, quantity, _plain(unit_price), _plain(unit_price * quantity)]
+    return order, line
+
+
+def export_order_rows(queryset, fmt, chunk_size=2000):
+    """CSV: one row per order line. JSONL: one order per line with nested items."""
+    values = _order_values(queryset, chunk_size)
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(ORDER_FIELDS + LINE_FIELDS)
+        for row in values:
+            order, line = _split(row)
+            yield writer.writerow(
+                ['' if v is None else v for v in order + (line or [''] * len(LINE_FIELDS))]
+            )
+    elif fmt == 'jsonl':
+        current = None
+        for row in values:
+            order, line = _split(row)
+            if current is None or current['order_id'] != order[0]:
+                if current is not None:
+                    yield json.dumps(current, ensure_ascii=False) + '\n'
+                current = dict(zip(ORDER_FIELDS, order), items=[])
+            if line:
+                current['items'].append(dict(zip(LINE_FIELDS, line)))
+        if current is not None:
+            yield json.dumps(current, ensure_ascii=False) + '\n'
+    else:
+        raise UnsupportedFormat(fmt)
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.utils import make_template_fragment_key
+
+
+# ---------------- Hit / miss counters ----------------
+# django.core.cache.caches يعطي نسخة لكل thread، لذلك العدادات مشتركة على مستوى الوحدة.
+# العدادات لكل عملية (worker) وحدها رغم أن الكاش نفسه ملفات مشتركة: كل worker يرى نسبته فقط،
+# و cache_stats يذكر pid العملية التي أجابت. عدّها في الكاش المشترك يضيف كتابة ملف لكل قراءة
+_stats = {}
+_stats_lock = threading.Lock()
+_missing = object()
+
+
+def _count(location, hits=0, misses=0):
+    with _stats_lock:
+        entry = _stats.setdefault(location, {'hits': 0, 'misses': 0})
+        entry['hits'] += hits
+        entry['misses'] += misses
+
+
+def cache_stats(alias=None):
+    alias = alias or settings.CATALOG_CACHE_ALIAS
+    location = caches[alias]._stats_location
+    with _stats_lock:
+        entry = dict(_stats.get(location, {'hits': 0, 'misses': 0}))
+    lookups = entry['hits'] + entry['misses']
+    entry['hit_ratio'] = round(entry['hits'] / lookups, 4) if lookups else None
+    entry['pid'] = os.getpid()
+    return entry
+
+
+def reset_cache_stats(alias=None):
+    alias = alias or settings.CATALOG_CACHE_ALIAS
+    with _stats_lock:
+        _stats.pop(caches[alias]._stats_location, None)
+
+
+class CountingCacheMixin:
+    """Counts hits and misses on top of a stock backend (get_many() goes through get())."""
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        self._stats_location = f'{type(self).__name__}:{location}'
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version=version)
+        if value is _missing:
+            _count(self._stats_location, misses=1)
+            return default
+        _count(self._stats_location, hits=1)
+        return value
+
+    def get_uncounted(self, key, default=None, version=None):
+        return super().get(key, default, version=version)
+
+    async def aget_uncounted(self, key, default=None, version=None):
+        return await sync_to_async(self.get_uncounted)(key, default, version=version)
+
+
+class AsyncLocMemCache(LocMemCache):
+    """
+    LocMemCache whose async methods run inline. BaseCache wraps every aget()
+    in sync_to_async, a thread hop per call, which a dict lookup under a
+    lock doesn't need.
+    """
+
+    async def aget(self, key, default=None, version=None):
+        return self.get(key, default, version=version)
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set(key, value, timeout, version=version)
+
+    async def aadd(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.add(key, value, timeout, version=version)
+
+    async def adelete(self, key, version=None):
+        return self.delete(key, version=version)
+
+
+class CountingLocMemCache(CountingCacheMixin, AsyncLocMemCache):
+    async def aget_uncounted(self, key, default=None, version=None):
+        return self.get_uncounted(key, default, version=version)
+
+
+class CountingFileBasedCache(CountingCacheMixin, FileBasedCache):
+    pass
+
+
+# ---------------- Catalog keys ----------------
+LIST_VERSION_KEY = 'products:list-version'
+CARD_FRAGMENT = 'product_card'
+
+
+def catalog_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def list_version():
+    # رقم "جيل" لقوائم المنتجات؛ أي تعديل على منتج يغيّره فتسقط كل الصفحات القديمة معاً
+    cache = catalog_cache()
+    get = getattr(cache, 'get_uncounted', cache.get)
+    version = get(LIST_VERSION_KEY)
+    if version is None:
+        version = str(time.time_ns())
+        cache.add(LIST_VERSION_KEY, version, timeout=None)
+        version = get(LIST_VERSION_KEY, version)
+    return version
+
+
+async def alist_version():
+    cache = catalog_cache()
+    get = getattr(cache, 'aget_uncounted', cache.aget)
+    version = await get(LIST_VERSION_KEY)
+    if version is None:
+        version = str(time.time_ns())
+        await cache.aadd(LIST_VERSION_KEY, version, timeout=None)
+        version = await get(LIST_VERSION_KEY, version)
+    return version
+
+
+def _url_digest(url):
+    return hashlib.md5(url.encode(), usedforsecurity=False).hexdigest()
+
+
+def product_list_key(url):
+    return f'products:list:{list_version()}:{_url_digest(url)}'
+
+
+async def aproduct_list_key(url):
+    return f'products:list:{await alist_version()}:{_url_digest(url)}'
+
+
+def product_facets_key(query, filters):
+    # لا يدخل فيه الترتيب ولا الـ cursor: نفس الأعداد لكل صفحات البحث والفلاتر نفسها
+    params = repr((query, sorted(filters.items())))
+    return f'products:facets:{list_version()}:{_url_digest(params)}'
+
+
+def product_detail_key(product_id):
+    return f'products:detail:{product_id}'
+
+
+def product_card_keys(product_id):
+    return [make_template_fragment_key(CARD_FRAGMENT, [product_id, is_staff]) for is_staff in (True, False)]
+
+
+def invalidate_products(product_ids):
+    """
+    Drop the products' cached pages and start a new list generation. Only
+    the workers sharing the catalog cache see it: file-based by default,
+    LocMem (one process) only in tests.
+    """
+    cache = catalog_cache()
+    keys = []
+    for product_id in product_ids:
+        keys.append(product_detail_key(product_id))
+        keys.extend(product_card_keys(product_id))
+    cache.delete_many(keys)
+    cache.set(LIST_VERSION_KEY, str(time.time_ns()), timeout=None)
@@ -0,0 +1,116 @@
+"""
+Carts for visitors who aren't logged in. The lines live in a small signed
+cookie ("12:1,40:3"), so browsing and adding to the cart never writes to
+the database. AnonymousCartMiddleware merges them into the user's Cart
+with one bulk statement as soon as the visitor logs in.
+"""
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.db import transaction
+
+from .inventory import hold
+from .models import Cart, CartItem, Product
+
+COOKIE_NAME = 'cart'
+COOKIE_SALT = 'products.cart'
+COOKIE_MAX_AGE = 30 * 24 * 60 * 60
+MAX_LINES = 50
+MAX_QUANTITY = 99
+
+
+class AnonymousCart:
+    def __init__(self, lines=None):
+        self.lines = dict(lines or {})
+        self.changed = False
+
+    @classmethod
+    def from_request(cls, request):
+        value = request.get_signed_cookie(COOKIE_NAME, default='', salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE)
+        lines = {}
+        # الكوكي موقّعة، لكن نتحقق من الشكل حتى لا يكسر تنسيق قديم الصفحة
+        for part in filter(None, value.split(',')):
+            try:
+                product_id, quantity = map(int, part.split(':'))
+            except ValueError:
+                continue
+            if product_id > 0 and 0 < quantity <= MAX_QUANTITY:
+                lines[product_id] = quantity
+        return cls(list(lines.items())[:MAX_LINES])
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    def add(self, product_id, quantity=1):
+        if product_id not in self.lines and len(self.lines) >= MAX_LINES:
+            return False
+        self.lines[product_id] = min(self.lines.get(product_id, 0) + quantity, MAX_QUANTITY)
+        self.changed = True
+        return True
+
+    def remove(self, product_id):
+        if self.lines.pop(product_id, None) is None:
+            return False
+        self.changed = True
+        return True
+
+    def clear(self):
+        self.lines = {}
+        self.changed = True
+
+    def items(self):
+        """Unsaved CartItem rows with their products, in the order they were added."""
+        return self._items(Product.objects.in_bulk(self.lines))
+
+    async def aitems(self):
+        return self._items(await Product.objects.ain_bulk(self.lines))
+
+    def _items(self, products):
+        return [
+            CartItem(product=products[pid], quantity=quantity)
+            for pid, quantity in self.lines.items()
+            if pid in products
+        ]
+
+    @staticmethod
+    def total_price(items):
+        return sum((item.total_price() for item in items), Decimal('0'))
+
+    @staticmethod
+    def as_cart(items, user_id=None):
+        """Read-only Cart look-alike (id, user_id, items.all(), total_price()) for products.serializers.Fieldset."""
+        return SimpleNamespace(
+            id=None, user_id=user_id, items=SimpleNamespace(all=lambda: items),
+            total_price=lambda: AnonymousCart.total_price(items),
+        )
+
+    def save(self, response):
+        if not self.changed:
+            return
+        if self.lines:
+            value = ','.join(f'{pid}:{quantity}' for pid, quantity in self.lines.items())
+            response.set_signed_cookie(
+                COOKIE_NAME, value, salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE, httponly=True, samesite='Lax',
+            )
+        else:
+            clear_anonymous_cart(response)
+
+
+def merge_into_user_cart(user, cart):
+    """Add the anonymous lines to `user`'s Cart in one bulk insert + update. Returns the Cart."""
+    existing = set(Product.objects.filter(id__in=cart.lines).values_list('id', flat=True))
+    lines = {pid: quantity for pid, quantity in cart.lines.items() if pid in existing}
+    with transaction.atomic():
+        user_cart, created = Cart.objects.get_or_create(user=user)
+        CartItem.objects.add_quantities(user_cart, lines)
+        # الدخول لا يفشل بسبب المخزون: يُحجز المتوفر، والباقي يُرفض عند الطلب
+        hold(user_cart.id, list(lines), strict=False)
+    return user_cart
+
+
+def clear_anonymous_cart(response):
+    response.delete_cookie(COOKIE_NAME, samesite='Lax')
+
+
+def has_anonymous_cart(request):
+    return COOKIE_NAME in request.COOKIES
@@ -0,0 +1,46 @@
+from django.db import transaction
+
+from .analytics import record_order
+from .cache import invalidate_products
+from .inventory import OutOfStock, hold, sell
+from .jobs import enqueue
+from .models import Product, CartItem, OrderItem
+
+
+class EmptyCart(Exception):
+    pass
+
+
+def place_order(order, cart):
+    """
+    Turn `cart` into `order` in one transaction: hold whatever the cart's
+    reservations don't already cover (products.inventory), insert the
+    lines with bulk_create, turn the holds into sale movements, add the
+    order to the sales rollups and empty the cart. Product rows are only
+    read, never locked or updated; the sales are posted to Product.stock
+    after commit. Nothing is written if any line is short on stock. The
+    confirmation email and ERP sync are queued in the same transaction.
+    """
+    with transaction.atomic():
+        # الحجز يطابق أسطر السلة: حجز منتهي لم يمسحه الـ reaper بعد ما زال يُحتسب،
+        # والناقص يُحجز الآن أو OutOfStock
+        quantities = hold(cart.id, strict=True)
+        if not quantities:
+            raise EmptyCart()
+        products = list(Product.objects.filter(id__in=quantities).order_by('id').only('id', 'name', 'price'))
+        items = [
+            OrderItem(order=order, product=p, quantity=quantities[p.id], unit_price=p.price)
+            for p in products
+        ]
+        order.total = sum(item.total_price() for item in items)
+        order.save()
+        OrderItem.objects.bulk_create(items)
+        sell(cart.id, quantities, reference=f'order:{order.id}')
+        record_order(order, items)
+        CartItem.objects.filter(cart=cart).delete()
+        # البريد ومزامنة الـ ERP في worker منفصل: الطلب لا ينتظرهما. المهام تُحفظ
+        # في نفس المعاملة فلا تضيع إذا توقفت العملية بعد الالتزام مباشرة
+        enqueue('order_confirmation', {'order_id': order.id}, key=f'order-confirmation:{order.id}')
+        enqueue('erp_inventory_sync', {'product_ids': list(quantities)}, key=f'erp-sync:order:{order.id}')
+        transaction.on_commit(lambda: invalidate_products(list(quantities)))
+    return order
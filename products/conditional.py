@@ -0,0 +1,91 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    raw = ':'.join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+
+
+def not_modified_response(request, etag, last_modified):
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def add_validators(response, etag, last_modified):
+    if response.status_code == 200:
+        if etag:
+            response.headers['ETag'] = etag
+        if last_modified is not None:
+            response.headers['Last-Modified'] = http_date(int(last_modified.timestamp()))
+    return response
+
+
+def validators_queryset(queryset):
+    return queryset.prefetch_related(None).order_by()
+
+
+def list_validators(stats):
+    if stats['last'] is None:
+        return make_etag('empty'), None
+    return make_etag(stats['last'].isoformat(), stats['count']), stats['last']
+
+
+LIST_STATS = {'last': Max('updated_at'), 'count': Count('id')}
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified for GET on DRF views. Validators come from a cheap
+    query (an indexed MAX/COUNT or a single column), so a 304 is answered
+    without loading or serializing anything.
+    """
+
+    def get_validators(self):
+        """Return (etag, last_modified datetime); either may be None."""
+        return None, None
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return add_validators(super().get(request, *args, **kwargs), etag, last_modified)
+
+
+class AsyncConditionalGetMixin:
+    """ConditionalGetMixin for async views: the validators come from aaggregate() / afirst()."""
+
+    async def get_validators(self):
+        return None, None
+
+    async def get(self, request, *args, **kwargs):
+        etag, last_modified = await self.get_validators()
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return add_validators(await super().get(request, *args, **kwargs), etag, last_modified)
+
+
+class ListValidatorsMixin(ConditionalGetMixin):
+    def get_validators(self):
+        queryset = validators_queryset(self.filter_queryset(self.get_queryset()))
+        return list_validators(queryset.aggregate(**LIST_STATS))
+
+
+class DetailValidatorsMixin(ConditionalGetMixin):
+    # علاقات يضم الرد بياناتها (مثل 'items__product'): MAX(updated_at) لكل منها يدخل في الـ ETag
+    nested_validators = ()
+
+    def get_validators(self):
+        lookup = {self.lookup_field: self.kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        queryset = validators_queryset(self.filter_queryset(self.get_queryset())).filter(**lookup)
+        nested = {f'{path}_updated_at': Max(f'{path}__updated_at') for path in self.nested_validators}
+        stamps = queryset.annotate(**nested).values_list('updated_at', *nested).first()
+        if stamps is None:
+            return None, None
+        last = max(stamp for stamp in stamps if stamp is not None)
+        return make_etag(lookup[self.lookup_field], *(stamp and stamp.isoformat() for stamp in stamps)), last
@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+from django.db.models import Count, Q
+
+
+# حدود الفئات شاملة للطرفين، وكل فئة تبدأ بعد نهاية السابقة بقرش
+PRICE_BUCKETS = [
+    (None, Decimal('9.99')),
+    (Decimal('10'), Decimal('49.99')),
+    (Decimal('50'), Decimal('99.99')),
+    (Decimal('100'), Decimal('499.99')),
+    (Decimal('500'), None),
+]
+
+
+def price_q(low=None, high=None):
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lte=high)
+    return q
+
+
+def stock_q(in_stock):
+    return Q(stock__gt=0) if in_stock else Q()
+
+
+def base_filters(queryset, data):
+    """Filters that also narrow the facet counts."""
+    if data.get('created_after'):
+        queryset = queryset.filter(created_at__gte=data['created_after'])
+    return queryset
+
+
+def filter_products(queryset, data):
+    queryset = base_filters(queryset, data)
+    return queryset.filter(price_q(data.get('min_price'), data.get('max_price')) & stock_q(data.get('in_stock')))
+
+
+def _count(q):
+    return Count('id', filter=q) if q else Count('id')
+
+
+def product_facets(queryset, data):
+    """
+    Price-bucket and in-stock counts in a single aggregate query. Each facet
+    ignores its own filter (so other buckets stay visible) but applies the
+    others.
+    """
+    queryset = base_filters(queryset, data)
+    by_price = price_q(data.get('min_price'), data.get('max_price'))
+    by_stock = stock_q(data.get('in_stock'))
+
+    aggregates = {
+        'total': _count(by_price & by_stock),
+        'in_stock': _count(by_price & Q(stock__gt=0)),
+    }
+    for i, (low, high) in enumerate(PRICE_BUCKETS):
+        aggregates[f'price_{i}'] = _count(price_q(low, high) & by_stock)
+    counts = queryset.order_by().aggregate(**aggregates)
+
+    return {
+        'total': counts['total'],
+        'in_stock': counts['in_stock'],
+        'price_ranges': [
+            {'min': low, 'max': high, 'count': counts[f'price_{i}']}
+            for i, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+    }
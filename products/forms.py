@@ -1,4 +1,7 @@
+from datetime import timedelta
+
 from django import forms
+from django.utils import timezone
 from .models import Product, Order
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
@@ -36,4 +39,49 @@ class CustomerRegisterForm(UserCreationForm):
             'email': forms.EmailInput(attrs={'placeholder': 'البريد الإلكتروني', 'class': 'form-control'}),
             'password1': forms.PasswordInput(attrs={'placeholder': 'كلمة المرور', 'class': 'form-control'}),
             'password2': forms.PasswordInput(attrs={'placeholder': 'تأكيد كلمة المرور', 'class': 'form-control'}),
-        }
\ No newline at end of file
+        }
+# ---------------- Catalog Filter Form ----------------
+class ProductFilterForm(forms.Form):
+    min_price = forms.DecimalField(required=False, min_value=0, decimal_places=2)
+    max_price = forms.DecimalField(required=False, min_value=0, decimal_places=2)
+    in_stock = forms.BooleanField(required=False)
+    created_after = forms.DateTimeField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        low, high = cleaned_data.get('min_price'), cleaned_data.get('max_price')
+        if low is not None and high is not None and low > high:
+            raise forms.ValidationError("الحد الأدنى للسعر أكبر من الحد الأعلى.")
+        return cleaned_data
+
+# ---------------- Order Export Form ----------------
+class OrderExportForm(forms.Form):
+    created_from = forms.DateField(required=False)
+    created_to = forms.DateField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('created_from'), cleaned_data.get('created_to')
+        if start and end and start > end:
+            raise forms.ValidationError("تاريخ البداية بعد تاريخ النهاية.")
+        return cleaned_data
+
+# ---------------- Sales Report Form ----------------
+class SalesReportForm(forms.Form):
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    top = forms.IntegerField(required=False, min_value=1, max_value=100)
+
+    default_days = 30
+    max_days = 366
+
+    def clean(self):
+        cleaned_data = super().clean()
+        end = cleaned_data.get('date_to') or timezone.localdate()
+        start = cleaned_data.get('date_from') or end - timedelta(days=self.default_days - 1)
+        if start > end:
+            raise forms.ValidationError("تاريخ البداية بعد تاريخ النهاية.")
+        if (end - start).days >= self.max_days:
+            raise forms.ValidationError("الفترة أطول من سنة.")
+        cleaned_data.update(date_from=start, date_to=end, top=cleaned_data.get('top') or 10)
+        return cleaned_data
@@ -0,0 +1,148 @@
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.functions import Now
+from PIL import Image, ImageOps
+
+from .cache import invalidate_products
+from .models import Product
+from .routers import routing_scope
+
+logger = logging.getLogger(__name__)
+
+# أقصى عرض لكل نسخة؛ الصورة لا تُكبَّر أبداً
+VARIANTS = {
+    'thumb': 160,
+    'card': 480,
+    'detail': 1200,
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+VARIANTS_DIR = 'product_images/variants'
+
+
+# ---------------- Rendering (no database access) ----------------
+def _render(image, width, fmt):
+    copy = image.copy()
+    if copy.width > width:
+        copy.thumbnail((width, copy.height), Image.LANCZOS)
+    pil_format, options = FORMATS[fmt]
+    if pil_format == 'JPEG' and copy.mode != 'RGB':
+        copy = copy.convert('RGB')
+    buffer = io.BytesIO()
+    copy.save(buffer, pil_format, **options)
+    return buffer.getvalue(), copy.width
+
+
+def generate_variants(source_name, storage=default_storage):
+    """
+    Render every variant of `source_name` and store it under a name derived
+    from the source's content hash, so re-uploads of the same file reuse the
+    existing files and URLs can be cached forever. Safe to run in a worker
+    process: it only touches storage.
+    """
+    with storage.open(source_name, 'rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    variants = {'source': source_name, 'hash': digest}
+    for variant, width in VARIANTS.items():
+        variants[variant] = {}
+        for fmt in FORMATS:
+            name = f'{VARIANTS_DIR}/{digest}-{variant}.{fmt}'
+            if not storage.exists(name):
+                content, rendered_width = _render(image, width, fmt)
+                name = storage.save(name, ContentFile(content))
+            else:
+                rendered_width = min(width, image.width)
+            variants[variant][fmt] = {'name': name, 'width': rendered_width}
+    return variants
+
+
+# ---------------- Saving results ----------------
+def store_variants(product_id, variants):
+    # لا نكتب النتيجة إذا تغيّرت الصورة أثناء المعالجة
+    updated = Product.objects.filter(pk=product_id, image=variants['source']).update(
+        image_variants=variants, updated_at=Now()
+    )
+    if updated:
+        transaction.on_commit(lambda: invalidate_products([product_id]))
+    return bool(updated)
+
+
+def process_product_image(product_id):
+    source = Product.objects.filter(pk=product_id).values_list('image', flat=True).first()
+    if not source:
+        return False
+    try:
+        variants = generate_variants(source)
+    except Exception:
+        logger.exception("Could not generate image variants for product %s", product_id)
+        return False
+    return store_variants(product_id, variants)
+
+
+# ---------------- Scheduling ----------------
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PRODUCT_IMAGE_WORKERS, thread_name_prefix='product-images'
+        )
+    return _executor
+
+
+def _run_in_worker(product_id):
+    from django.db import close_old_connections
+
+    try:
+        # الصورة حُفظت للتو على الأساسية؛ النسخ قد لا تكون وصلتها بعد
+        with routing_scope(pinned=True):
+            process_product_image(product_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(product_id):
+    """Generate variants after the current transaction commits, off the request thread."""
+    if settings.PRODUCT_IMAGE_ASYNC:
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_worker, product_id))
+    else:
+        transaction.on_commit(lambda: process_product_image(product_id))
+
+
+def needs_variants(product):
+    source = (product.image_variants or {}).get('source')
+    return bool(product.image) and source != product.image.name
+
+
+def variant_url(product, variant, fmt='jpeg'):
+    try:
+        return default_storage.url(product.image_variants[variant][fmt]['name'])
+    except (KeyError, TypeError):
+        return None
+
+
+def variant_srcset(product, fmt):
+    variants = product.image_variants or {}
+    parts = []
+    for variant in VARIANTS:
+        entry = variants.get(variant, {}).get(fmt)
+        if entry:
+            parts.append(f"{default_storage.url(entry['name'])} {entry['width']}w")
+    return ', '.join(parts)
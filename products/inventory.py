@@ -0,0 +1,399 @@
+"""
+Stock as a ledger plus reservations, so a flash sale doesn't queue every
+buyer on the same Product row.
+
+* StockMovement is the append-only ledger and Product.stock its posted
+  balance. Receipts and adjustments are posted straight away; sales are
+  posted after the order commits (post_movements), so checkout never
+  updates or locks a Product row.
+* Putting a product in a cart holds the units (StockReservation) for
+  INVENTORY_HOLD_SECONDS. `manage.py reap_reservations` returns expired
+  holds in batches.
+* What can still be held (on hand minus held) lives in InventoryShard
+  rows, INVENTORY_SHARDS per product. A hold is a conditional
+  UPDATE ... WHERE available >= n on one of them: buyers rarely wait on
+  the same row, and the total can't go below zero, so nothing is oversold.
+* available() serves that number from a cache shared by the workers;
+  every change moves the cached counter with incr/decr after commit. The
+  counter is only a hint: a hold that it let through is checked against
+  the shards, and a 0 is checked against the database (in_stock) before
+  a buyer is turned away.
+"""
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, F, IntegerField, Sum, Q, Value, When
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .cache import invalidate_products
+from .jobs import enqueue
+from .models import CartItem, InventoryShard, Product, StockMovement, StockReservation
+
+
+class OutOfStock(Exception):
+    def __init__(self, products):
+        super().__init__(', '.join(p.name for p in products))
+        self.products = products
+
+
+def _products():
+    # المخزون يُقرأ من الأساسية دائماً: النسخ قد تتأخر عن آخر حركة
+    return Product.objects.using(DEFAULT_DB_ALIAS)
+
+
+def _per_product(values, field='id'):
+    return Case(
+        *[When(**{field: pid}, then=Value(value)) for pid, value in values.items()],
+        output_field=IntegerField(),
+    )
+
+
+# ---------------- Ledger ----------------
+def on_hand(product_ids):
+    """{product_id: units on hand}: the posted stock plus the movements not posted yet."""
+    totals = dict(_products().filter(id__in=product_ids).values_list('id', 'stock'))
+    pending = (
+        StockMovement.objects.filter(posted=False, product_id__in=totals)
+        .values_list('product_id').annotate(total=Sum('delta')).order_by()
+    )
+    for pid, delta in pending:
+        totals[pid] += delta
+    return totals
+
+
+def adjust(deltas, kind=StockMovement.ADJUSTMENT, reference=''):
+    """
+    Change the stock on hand by {product_id: delta}: one posted movement
+    per product, and the same change to what can still be held.
+    """
+    deltas = {pid: delta for pid, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    ids = list(deltas)
+    with transaction.atomic():
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=pid, delta=delta, kind=kind, reference=reference, posted=True)
+            for pid, delta in deltas.items()
+        ])
+        # update() لا يطلق post_save: الكاش ومزامنة الـ ERP يدوياً
+        _products().filter(id__in=ids).update(stock=F('stock') + _per_product(deltas), updated_at=Now())
+        _rebalance(deltas)
+        _bump_on_commit(deltas)
+        enqueue('erp_inventory_sync', {'product_ids': ids})
+        transaction.on_commit(lambda: invalidate_products(ids))
+
+
+def set_on_hand(counts, kind=StockMovement.ADJUSTMENT, reference=''):
+    """Stocktake: {product_id: units counted}. Records the difference from what the ledger says."""
+    with transaction.atomic():
+        current = on_hand(counts)
+        adjust({pid: counts[pid] - units for pid, units in current.items()}, kind, reference)
+
+
+def post_movements(product_ids=None, batch_size=1000):
+    """
+    Fold movements that aren't posted yet into Product.stock, a batch per
+    transaction. Returns the number of movements posted.
+    """
+    posted = 0
+    while True:
+        pending = StockMovement.objects.filter(posted=False)
+        if product_ids is not None:
+            pending = pending.filter(product_id__in=product_ids)
+        with transaction.atomic():
+            candidates = list(pending.order_by('id').values_list('id', 'product_id')[:batch_size])
+            if not candidates:
+                return posted
+            # قفل المنتجات ثم إعادة القراءة: ترحيلان متزامنان لا يضيفان نفس الحركة مرتين
+            ids = sorted({pid for _, pid in candidates})
+            list(_products().select_for_update().filter(id__in=ids).order_by('id').values_list('id', flat=True))
+            rows = list(
+                StockMovement.objects.filter(id__in=[mid for mid, _ in candidates], posted=False)
+                .values_list('id', 'product_id', 'delta')
+            )
+            totals = defaultdict(int)
+            for _, pid, delta in rows:
+                totals[pid] += delta
+            StockMovement.objects.filter(id__in=[mid for mid, _, _ in rows]).update(posted=True)
+            changed = {pid: delta for pid, delta in totals.items() if delta}
+            if changed:
+                _products().filter(id__in=changed).update(
+                    stock=F('stock') + _per_product(changed), updated_at=Now(),
+                )
+                transaction.on_commit(lambda ids=list(changed): invalidate_products(ids))
+        posted += len(rows)
+
+
+# ---------------- Shards ----------------
+def _distribute(total, count):
+    # العجز (حجوزات أكثر من المخزون بعد تسوية) في الشريحة 0 وحدها، والباقي أصفار
+    if total <= 0:
+        return [total] + [0] * (count - 1)
+    share, extra = divmod(total, count)
+    return [share + (i < extra) for i in range(count)]
+
+
+def _shards(product_ids):
+    """{product_id: [(shard, available), ...]}, creating the shards of products held for the first time."""
+    rows = defaultdict(list)
+    for pid, shard, value in InventoryShard.objects.filter(product_id__in=product_ids).values_list(
+        'product_id', 'shard', 'available',
+    ):
+        rows[pid].append((shard, value))
+    missing = [pid for pid in product_ids if pid not in rows]
+    if missing:
+        # قفل المنتج: تسوية متزامنة لا تضيع بين قراءة المخزون وإنشاء الشرائح.
+        # لا حجوزات لمنتج بلا شرائح، فالمتاح هو المخزون كله
+        list(_products().select_for_update().filter(id__in=missing).order_by('id').values_list('id', flat=True))
+        created = [
+            InventoryShard(product_id=pid, shard=shard, available=value)
+            for pid, units in on_hand(missing).items()
+            for shard, value in enumerate(_distribute(units, settings.INVENTORY_SHARDS))
+        ]
+        # طلب متزامن أنشأها قبلنا: قيمنا تصبح مجرد تقدير، والـ UPDATE المشروط يصحح
+        InventoryShard.objects.bulk_create(created, ignore_conflicts=True)
+        for shard in created:
+            rows[shard.product_id].append((shard.shard, shard.available))
+    return rows
+
+
+def _take(product_id, quantity, rows=None):
+    """Take up to `quantity` units from the product's shards; returns how many it got."""
+    shards = InventoryShard.objects.filter(product_id=product_id)
+    taken = 0
+    for attempt in range(3):
+        if rows is None or attempt:
+            rows = list(shards.filter(available__gt=0).values_list('shard', 'available'))
+        rows = [row for row in rows if row[1] > 0]
+        if not rows:
+            break
+        # ترتيب عشوائي حتى يتوزع المشترون على الصفوف؛ الشرائح التي تكفي وحدها أولاً،
+        # وإلا الأكبر فالأصغر حتى تكفي أقل عدد من التحديثات
+        need = quantity - taken
+        random.shuffle(rows)
+        rows.sort(key=lambda row: (row[1] < need, 0 if row[1] >= need else -row[1]))
+        for shard, seen in rows:
+            amount = min(seen, quantity - taken)
+            # الشرط على available يمنع البيع الزائد مهما تزامنت الطلبات
+            if shards.filter(shard=shard, available__gte=amount).update(available=F('available') - amount):
+                taken += amount
+                if taken == quantity:
+                    return taken
+    return taken
+
+
+def _give(product_id, quantity):
+    shards = InventoryShard.objects.filter(product_id=product_id)
+    # العجز في الشريحة 0 يُسدَّد أولاً، وإلا قد تُحجز وحدات غير موجودة من شريحة أخرى
+    if not shards.filter(shard=0, available__lt=0).update(available=F('available') + quantity):
+        shards.filter(shard=random.randrange(settings.INVENTORY_SHARDS)).update(available=F('available') + quantity)
+
+
+def _rebalance(deltas):
+    # توريد أو تسوية: نقفل شرائح المنتج ونوزّع المجموع الجديد عليها من جديد
+    shards = list(
+        InventoryShard.objects.select_for_update()
+        .filter(product_id__in=deltas).order_by('product_id', 'shard')
+    )
+    by_product = defaultdict(list)
+    for shard in shards:
+        by_product[shard.product_id].append(shard)
+    for pid, rows in by_product.items():
+        total = sum(shard.available for shard in rows) + deltas[pid]
+        for shard, value in zip(rows, _distribute(total, len(rows))):
+            shard.available = value
+    InventoryShard.objects.bulk_update(shards, ['available'])
+
+
+# ---------------- Reservations ----------------
+def hold(cart_id, product_ids=None, strict=True, ttl=None):
+    """
+    Make the cart's reservations match its lines (all of them, or only
+    `product_ids`) and push their expiry INVENTORY_HOLD_SECONDS (or `ttl`)
+    ahead. With strict=True a line that can't be held in full raises
+    OutOfStock and nothing changes; otherwise it holds what's left.
+    Returns {product_id: units held}.
+    """
+    ttl = settings.INVENTORY_HOLD_SECONDS if ttl is None else ttl
+    with transaction.atomic():
+        lines = CartItem.objects.filter(cart_id=cart_id)
+        # قفل الحجوزات: الـ reaper يتخطاها ولا يعيد كمية نعدّلها الآن
+        held = StockReservation.objects.select_for_update().filter(cart_id=cart_id)
+        if product_ids is not None:
+            lines = lines.filter(product_id__in=product_ids)
+            held = held.filter(product_id__in=product_ids)
+        wanted = dict(lines.values_list('product_id', 'quantity'))
+        current = dict(held.values_list('product_id', 'quantity'))
+        shards = _shards(sorted(pid for pid, quantity in wanted.items() if quantity > current.get(pid, 0)))
+
+        result, short, changes = {}, [], {}
+        for pid in sorted(wanted.keys() | current.keys()):
+            want, have = wanted.get(pid, 0), current.get(pid, 0)
+            if want > have:
+                got = _take(pid, want - have, shards[pid])
+                if got < want - have:
+                    short.append(pid)
+                result[pid] = have + got
+            elif want < have:
+                _give(pid, have - want)
+                result[pid] = want
+            else:
+                result[pid] = have
+            changes[pid] = have - result[pid]
+        if short and strict:
+            # العدّاد سمح بما لم يعد متاحاً: يُقرأ من القاعدة في المرة القادمة
+            for pid in short:
+                forget(pid)
+            raise OutOfStock(list(Product.objects.filter(id__in=short).order_by('id').only('id', 'name')))
+
+        released = [pid for pid, quantity in result.items() if not quantity]
+        if released:
+            StockReservation.objects.filter(cart_id=cart_id, product_id__in=released).delete()
+        expires_at = timezone.now() + timedelta(seconds=ttl)
+        StockReservation.objects.bulk_create(
+            [
+                StockReservation(cart_id=cart_id, product_id=pid, quantity=quantity, expires_at=expires_at)
+                for pid, quantity in result.items() if quantity
+            ],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity', 'expires_at'],
+        )
+        _bump_on_commit(changes)
+    return {pid: quantity for pid, quantity in result.items() if quantity}
+
+
+def sell(cart_id, quantities, reference=''):
+    """
+    Turn the cart's holds on {product_id: quantity} into SALE movements.
+    Call hold(cart_id) first in the same transaction so they cover the
+    quantities. The movements are posted to Product.stock after commit
+    (INVENTORY_POST_ON_COMMIT), or later by reap_reservations.
+    """
+    StockReservation.objects.filter(cart_id=cart_id, product_id__in=quantities).delete()
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=pid, delta=-quantity, kind=StockMovement.SALE, reference=reference)
+        for pid, quantity in quantities.items()
+    ])
+    if settings.INVENTORY_POST_ON_COMMIT:
+        # معاملة قصيرة منفصلة؛ إذا فشلت تبقى الحركات غير مرحّلة ويرحّلها الـ reaper
+        ids = list(quantities)
+        transaction.on_commit(lambda: post_movements(ids), robust=True)
+
+
+def release_expired(batch_size=500, now=None):
+    """
+    Delete holds that expired or whose cart is gone, a batch per
+    transaction, and make their units available again. Returns how many
+    holds were released.
+    """
+    now = now or timezone.now()
+    released = 0
+    for stale in (Q(expires_at__lte=now), Q(cart__isnull=True)):
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    StockReservation.objects.select_for_update(skip_locked=True)
+                    .filter(stale).order_by('id')
+                    .values_list('id', 'product_id', 'quantity')[:batch_size]
+                )
+                if not rows:
+                    break
+                StockReservation.objects.filter(id__in=[rid for rid, _, _ in rows]).delete()
+                returned = defaultdict(int)
+                for _, pid, quantity in rows:
+                    returned[pid] += quantity
+                for pid, quantity in returned.items():
+                    _give(pid, quantity)
+                _bump_on_commit(returned)
+            released += len(rows)
+    return released
+
+
+# ---------------- Cached counter ----------------
+# العدّاد للعرض والرفض السريع فقط؛ الحجز نفسه يتحقق من الشرائح، فخطأ مؤقت فيه لا يسبب بيعاً زائداً
+def _counter_cache():
+    return caches[settings.INVENTORY_CACHE_ALIAS]
+
+
+def counter_key(product_id):
+    return f'inventory:available:{product_id}'
+
+
+def _missed_key(product_id):
+    return f'inventory:missed:{product_id}'
+
+
+def available(product_ids):
+    """{product_id: units that can still be put in a cart}, from the cache when it has them."""
+    cache = _counter_cache()
+    keys = {counter_key(pid): pid for pid in product_ids}
+    found = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = [pid for pid in product_ids if pid not in found]
+    if missing:
+        missed = [_missed_key(pid) for pid in missing]
+        before = cache.get_many(missed)
+        loaded = _available_in_db(missing)
+        for pid, value in loaded.items():
+            # add لا set: لا نكتب فوق عدّاد حرّكه طلب آخر أثناء القراءة
+            cache.add(counter_key(pid), value, settings.INVENTORY_COUNTER_TIMEOUT)
+        # تغيير وصل والعدّاد غائب (_bump): ما قرأناه قد يسبقه، فلا نُبقيه في الكاش
+        after = cache.get_many(missed)
+        stale = [counter_key(pid) for pid, key in zip(missing, missed) if before.get(key) != after.get(key)]
+        if stale:
+            cache.delete_many(stale)
+        found.update(loaded)
+    return {pid: max(value, 0) for pid, value in found.items()}
+
+
+def in_stock(product_id):
+    """
+    Whether the product can still be put in a cart. A 0 from the counter is
+    read again from the database before saying no, so a counter that missed
+    a release doesn't turn buyers away.
+    """
+    if available([product_id]).get(product_id):
+        return True
+    units = _available_in_db([product_id]).get(product_id, 0)
+    _counter_cache().set(counter_key(product_id), units, settings.INVENTORY_COUNTER_TIMEOUT)
+    return units > 0
+
+
+def _available_in_db(product_ids):
+    totals = dict(
+        InventoryShard.objects.filter(product_id__in=product_ids)
+        .values_list('product_id').annotate(total=Sum('available')).order_by()
+    )
+    # منتج بلا شرائح لم يُحجز منه شيء بعد
+    rest = [pid for pid in product_ids if pid not in totals]
+    if rest:
+        totals.update(on_hand(rest))
+    return totals
+
+
+def _bump_on_commit(changes):
+    changes = {pid: delta for pid, delta in changes.items() if delta}
+    if changes:
+        transaction.on_commit(lambda: _bump(changes))
+
+
+def _bump(changes):
+    cache = _counter_cache()
+    for pid, delta in changes.items():
+        try:
+            cache.incr(counter_key(pid), delta)
+        except ValueError:
+            # ليس في الكاش: أول قراءة تملؤه من القاعدة. قراءة جارية الآن قد تضيف قيمة
+            # سبقت هذا التغيير، فنعلّمها لتتخلى عنها، ونحذف ما أضافته قبلنا
+            cache.set(_missed_key(pid), time.time_ns(), settings.INVENTORY_COUNTER_TIMEOUT)
+            cache.delete(counter_key(pid))
+
+
+def forget(product_id):
+    _counter_cache().delete(counter_key(product_id))
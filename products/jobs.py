@@ -0,0 +1,138 @@
+"""
+A small database-backed job queue: no broker, just the Job table.
+
+    @task('order_confirmation')
+    def send_confirmation(order_id): ...
+
+    enqueue('order_confirmation', {'order_id': 7}, key='order-confirmation:7')
+
+Inside a transaction `enqueue` is an outbox: the job commits or rolls back
+with the rows it refers to, and no worker can see it earlier.
+
+`manage.py run_jobs` claims due jobs with a conditional UPDATE (safe with
+several workers, and on SQLite without SKIP LOCKED), runs them on a thread
+pool and retries failures with exponential backoff. Handlers get the
+payload as keyword arguments and must tolerate running more than once.
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Job
+from .routers import routing_scope
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+
+
+def task(name, max_attempts=5):
+    def register(func):
+        func.job_name = name
+        func.max_attempts = max_attempts
+        _tasks[name] = func
+        return func
+    return register
+
+
+def get_task(name):
+    return _tasks[name]
+
+
+# ---------------- Enqueueing ----------------
+def enqueue(name, payload=None, key=None, delay=None):
+    """Insert a job. Returns it, or None if a job with the same `key` already exists."""
+    job = Job(
+        name=name,
+        payload=payload or {},
+        idempotency_key=key,
+        max_attempts=get_task(name).max_attempts,
+        run_at=timezone.now() + (delay or timedelta(0)),
+    )
+    try:
+        # savepoint: تعارض المفتاح لا يُفسد المعاملة المحيطة
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return None
+    if settings.JOBS_EAGER:
+        transaction.on_commit(lambda: run_job(job))
+    return job
+
+
+def enqueue_on_commit(name, payload=None, key=None, delay=None):
+    """
+    Enqueue after the surrounding transaction commits; nothing is queued if
+    it rolls back. A failed insert is logged instead of failing a request
+    whose own writes are already committed.
+    """
+    transaction.on_commit(lambda: enqueue(name, payload, key, delay), robust=True)
+
+
+# ---------------- Claiming and running ----------------
+def release_stale(timeout=None):
+    """Put back jobs whose worker died mid-run."""
+    timeout = timeout or timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=timezone.now() - timeout).update(
+        status=Job.PENDING, locked_by='', locked_at=None,
+    )
+
+
+def claim(worker, limit):
+    now = timezone.now()
+    ids = list(
+        Job.objects.filter(status=Job.PENDING, run_at__lte=now, name__in=list(_tasks))
+        .order_by('run_at', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    # UPDATE مشروط: إن سبقنا worker آخر لنفس الصف لا يتغير شيء ولا نأخذه
+    Job.objects.filter(id__in=ids, status=Job.PENDING).update(status=Job.RUNNING, locked_by=worker, locked_at=now)
+    return list(Job.objects.filter(id__in=ids, status=Job.RUNNING, locked_by=worker, locked_at=now))
+
+
+def backoff(attempts):
+    base = settings.JOBS_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=min(base, settings.JOBS_BACKOFF_MAX_SECONDS) * random.uniform(0.9, 1.1))
+
+
+def run_job(job):
+    """Run one claimed job and record the outcome. Returns True on success."""
+    job.attempts += 1
+    try:
+        get_task(job.name)(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s (%s) failed, attempt %s/%s", job.id, job.name, job.attempts, job.max_attempts)
+        status = Job.FAILED if job.attempts >= job.max_attempts else Job.PENDING
+        Job.objects.filter(pk=job.pk).update(
+            status=status,
+            attempts=job.attempts,
+            last_error=error[-5000:],
+            run_at=timezone.now() + backoff(job.attempts),
+            locked_by='',
+            locked_at=None,
+            finished_at=timezone.now() if status == Job.FAILED else None,
+        )
+        job.status = status
+        return False
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.DONE, attempts=job.attempts, locked_by='', locked_at=None, finished_at=timezone.now(),
+    )
+    job.status = Job.DONE
+    return True
+
+
+def run_in_thread(job):
+    try:
+        # ما كُتب قبل الإضافة للطابور قد لا يكون وصل النسخ بعد
+        with routing_scope(pinned=True):
+            return run_job(job)
+    finally:
+        close_old_connections()
@@ -0,0 +1,163 @@
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from products.benchmarks import (
+    free_port, http_load, save_results, seed_carts, seed_products, seed_users, server_process, slow_clients,
+)
+from products.models import Product
+from products.search import rebuild_index
+
+# نفس المسارات بنسختيها: views متزامنة تحت gunicorn (WSGI) و async تحت uvicorn (ASGI)
+SERVERS = {
+    'wsgi': {
+        'module': 'gunicorn',
+        'argv': lambda port, workers: [
+            'gunicorn', 'clean_shop.wsgi:application',
+            '--workers', str(workers), '--bind', f'127.0.0.1:{port}', '--log-level', 'error',
+        ],
+        'prefix': 'api',
+        'env': {},
+    },
+    'asgi': {
+        'module': 'uvicorn',
+        'argv': lambda port, workers: [
+            'uvicorn', 'clean_shop.asgi:application', '--workers', str(workers),
+            '--host', '127.0.0.1', '--port', str(port), '--log-level', 'error', '--no-access-log', '--lifespan', 'off',
+        ],
+        'prefix': 'async_api',
+        # تحت ASGI لكل طلب سياق واتصال خاص؛ الاتصالات الدائمة لا تُعاد وتتراكم
+        'env': {'DB_CONN_MAX_AGE': '0'},
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "يقارن APIs القراءة المتزامنة تحت gunicorn مع نسخها async تحت uvicorn: "
+        "الإنتاجية وزمن الاستجابة (p50/p95/p99) عند عدة مستويات من العملاء المتزامنين، "
+        "مع عملاء بطيئين وبدونهم."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument(
+            '--concurrency', type=int, action='append', dest='levels',
+            help="عدد العملاء المتزامنين (يمكن تكراره؛ الافتراضي 8 و32 و128)",
+        )
+        parser.add_argument('--duration', type=float, default=10, help="ثوانٍ لكل مستوى")
+        parser.add_argument('--products', type=int, default=5_000)
+        parser.add_argument('--server', action='append', dest='servers', choices=list(SERVERS))
+        parser.add_argument(
+            '--slow-clients', type=int, default=4,
+            help="تكرار كل مستوى مع هذا العدد من العملاء البطيئين (طلب يُرسل خلال ثانيتين)؛ 0 للإلغاء",
+        )
+        parser.add_argument('--cold', action='store_true', help="بدون كاش الكتالوج: كل طلب يصل لقاعدة البيانات")
+        parser.add_argument('--output', help="ملف JSON لحفظ النتائج")
+        # داخلي: يُستدعى في عملية فرعية لتجهيز القاعدة المؤقتة
+        parser.add_argument('--prepare', metavar='FILE', help="(داخلي) تجهيز البيانات وكتابة الجلسات والمنتجات في FILE")
+        parser.add_argument('--clients', type=int, default=0, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['prepare']:
+            return self.prepare(options)
+        servers = options['servers'] or list(SERVERS)
+        for name in servers:
+            if importlib.util.find_spec(SERVERS[name]['module']) is None:
+                raise CommandError(f"هذا القياس يحتاج {SERVERS[name]['module']}: pip install {SERVERS[name]['module']}")
+        levels = sorted(options['levels'] or [8, 32, 128])
+
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                'SQLITE_PATH': os.path.join(tmp, 'db.sqlite3'),
+                'QUERY_BUDGET_RAISE': '0',
+            }
+            if options['cold']:
+                env['CATALOG_CACHE_TIMEOUT'] = '0'
+            data = self.setup_database(env, tmp, options['products'], max(levels))
+            for name in servers:
+                results[name] = self.run_server(name, env, data, levels, options)
+
+        for run in results[servers[0]]:
+            for name in servers:
+                stats = results[name][run]
+                self.stdout.write(
+                    f"{name:<5} c={run:<10} {stats['throughput_rps']:>8.1f} req/s  p50={stats['p50_ms']:>7.1f}ms "
+                    f"p95={stats['p95_ms']:>7.1f}ms p99={stats['p99_ms']:>7.1f}ms  أخطاء={stats['errors']}"
+                )
+        if options['output']:
+            save_results(options['output'], {'workers': options['workers'], 'cold': options['cold'], 'servers': results})
+            self.stdout.write(self.style.SUCCESS(f"النتائج في {options['output']}"))
+
+    # ---------------- Setup ----------------
+    def setup_database(self, env, tmp, products, clients):
+        manage = [sys.executable, str(settings.BASE_DIR / 'manage.py')]
+        data_file = os.path.join(tmp, 'bench.json')
+        subprocess.run([*manage, 'migrate', '--noinput', '-v0'], env=env, check=True)
+        subprocess.run(
+            [*manage, 'benchmark_async', '--prepare', data_file, '--products', str(products), '--clients', str(clients)],
+            env=env, check=True,
+        )
+        with open(data_file) as f:
+            return json.load(f)
+
+    def prepare(self, options):
+        seed_products(options['products'])
+        rebuild_index()
+        users = seed_users(options['clients'])
+        seed_carts(users)
+        sessions = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            sessions.append(client.cookies['sessionid'].value)
+        products = list(Product.objects.order_by('?').values_list('id', flat=True)[:500])
+        with open(options['prepare'], 'w') as f:
+            json.dump({'sessions': sessions, 'products': products}, f)
+
+    # ---------------- One server ----------------
+    def run_server(self, name, env, data, levels, options):
+        server = SERVERS[name]
+        prefix = server['prefix']
+        list_url = reverse(f'{prefix}_products')
+        cart_url = reverse(f'{prefix}_cart')
+        detail_urls = [reverse(f'{prefix}_product_detail', args=[pid]) for pid in data['products']]
+        sorts = ['newest', 'price', '-price']
+
+        # مزيج قراءة: قائمة (بترتيبات وأحجام مختلفة)، تفاصيل منتج، والسلة
+        def next_path(rng):
+            roll = rng.random()
+            if roll < 0.4:
+                return f'{list_url}?sort={rng.choice(sorts)}&page_size={rng.choice([12, 24, 48])}'
+            if roll < 0.8:
+                return rng.choice(detail_urls)
+            return cart_url
+
+        port = free_port()
+        argv = [sys.executable, '-m', *server['argv'](port, options['workers'])]
+        results = {}
+        try:
+            with server_process(argv, {**env, **server['env']}, port, cwd=settings.BASE_DIR) as address:
+                http_load(address, data['sessions'][:4], next_path, duration=1)  # تسخين
+                for level in levels:
+                    sessions = data['sessions'][:level]
+                    results[str(level)] = http_load(address, sessions, next_path, options['duration'])
+                    if options['slow_clients']:
+                        with slow_clients(address, options['slow_clients'], list_url):
+                            results[f"{level}+{options['slow_clients']}slow"] = http_load(
+                                address, sessions, next_path, options['duration'],
+                            )
+        except RuntimeError:
+            raise CommandError(f"لم يبدأ {server['module']} في الوقت المحدد.")
+        return results
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from products.benchmarks import benchmark_database, measure, seed_products, summarize
+from products.models import Product
+from products.search import rebuild_index, search_products
+
+
+class Command(BaseCommand):
+    help = "يقارن البحث عبر FTS5 مع icontains على كتالوج مولَّد (قاعدة بيانات مؤقتة)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=24)
+        parser.add_argument(
+            '--query', action='append', dest='queries',
+            help="عبارة بحث (يمكن تكرارها)",
+        )
+
+    def handle(self, *args, **options):
+        queries = options['queries'] or ['مصباح', 'مستشفي', 'lam', 'قلم أزرق', '4242']
+        page = options['page_size']
+        with benchmark_database():
+            seed_products(options['products'])
+            rebuild_index()
+            self.stdout.write(f"{options['products']} منتج، {options['repeat']} تكرار لكل قياس\n")
+            for query in queries:
+                fts = search_products(Product.objects.all(), query)
+                scan = Product.objects.filter(Q(name__icontains=query) | Q(description__icontains=query))
+                results = {
+                    'fts page': measure(lambda: list(fts.order_by('search_rank', 'id')[:page]), options['repeat']),
+                    'icontains page': measure(lambda: list(scan.order_by('-created_at', '-id')[:page]), options['repeat']),
+                    'fts count': measure(fts.count, options['repeat']),
+                    'icontains count': measure(scan.count, options['repeat']),
+                }
+                self.stdout.write(f"q={query!r}: fts={fts.count()} icontains={scan.count()} rows")
+                for label, samples in results.items():
+                    stats = summarize(samples)
+                    self.stdout.write(
+                        f"  {label:<16} p50={stats['p50_ms']:>9.3f}ms  p95={stats['p95_ms']:>9.3f}ms"
+                    )
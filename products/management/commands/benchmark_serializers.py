@@ -0,0 +1,65 @@
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+
+from products.benchmarks import (
+    benchmark_database, measure, seed_carts, seed_images, seed_orders, seed_products, seed_users, summarize,
+)
+from products.models import Cart, Order, Product
+from products.renderers import FastJSONRenderer, orjson
+from products.serializers import CartSerializer, OrderSerializer, ProductSerializer, read_serializer_class
+
+
+class Command(BaseCommand):
+    help = (
+        "يقارن serializers الـ DRF مع نسخها السريعة (products.serializers.FAST_SERIALIZERS): "
+        "تحويل الكائنات المحمّلة مسبقاً إلى JSON فقط، بدون قاعدة البيانات (قاعدة بيانات مؤقتة)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000, help="عدد المنتجات في القائمة")
+        parser.add_argument('--carts', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--images', type=int, default=4, help="صور مولَّدة تُوزَّع على المنتجات؛ 0 بدون صور")
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        media = tempfile.TemporaryDirectory()
+        with media, override_settings(MEDIA_ROOT=media.name), benchmark_database():
+            images = seed_images(options['images']) if options['images'] else ()
+            seed_products(options['products'], images=images)
+            users = seed_users(max(options['carts'], 1))
+            seed_carts(users[:options['carts']])
+            seed_orders(users, options['orders'])
+            # كل شيء يُحمَّل مرة واحدة: القياس للتحويل والترميز فقط
+            cases = {
+                'products': (ProductSerializer, list(Product.objects.order_by('id'))),
+                'carts': (CartSerializer, list(Cart.objects.with_items().with_total().order_by('id'))),
+                'orders': (OrderSerializer, list(Order.objects.with_items().order_by('id'))),
+            }
+            encoder = 'orjson' if orjson else 'json (orjson غير مثبت)'
+            self.stdout.write(f"{options['repeat']} تكرار لكل قياس، المُرمِّز السريع: {encoder}\n")
+            for label, (serializer_class, objects) in cases.items():
+                self.compare(label, serializer_class, objects, options['repeat'])
+
+    def compare(self, label, serializer_class, objects, repeat):
+        fast_class = read_serializer_class(serializer_class)
+        drf = lambda: JSONRenderer().render(serializer_class(objects, many=True).data)
+        fast = lambda: FastJSONRenderer().render(fast_class(objects, many=True).data)
+        if drf() != fast():
+            raise CommandError(f"{fast_class.__name__}: المخرجات تختلف عن {serializer_class.__name__}")
+
+        results = {
+            serializer_class.__name__: summarize(measure(drf, repeat)),
+            fast_class.__name__: summarize(measure(fast, repeat)),
+            f'{fast_class.__name__} (بدون ترميز)': summarize(measure(lambda: fast_class(objects, many=True).data, repeat)),
+        }
+        self.stdout.write(f"{label}: {len(objects)} صف، {len(drf()) / 1024:.0f} KiB")
+        baseline = results[serializer_class.__name__]['p50_ms']
+        for name, stats in results.items():
+            self.stdout.write(
+                f"  {name:<40} p50={stats['p50_ms']:>9.3f}ms  p95={stats['p95_ms']:>9.3f}ms  "
+                f"×{baseline / stats['p50_ms']:.1f}"
+            )
@@ -0,0 +1,151 @@
+import subprocess
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from products.benchmarks import (
+    TRANSPORTS, benchmark_database, find_regressions, load_results, save_results,
+    seed_carts, seed_images, seed_orders, seed_products, seed_users, summarize,
+)
+from products.cache import catalog_cache
+from products.metrics import registry
+from products.models import Cart, CartItem, Product
+from products.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "يقيس زمن المسارات الأساسية للمتجر على بيانات مولَّدة (قاعدة بيانات مؤقتة) ويحفظ النتائج JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10_000)
+        parser.add_argument('--users', type=int, default=1_000)
+        parser.add_argument('--orders', type=int, default=20_000)
+        parser.add_argument('--images', type=int, default=8, help="عدد الصور المختلفة الموزعة على المنتجات (0 بدون صور)")
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--transport', choices=[*TRANSPORTS, 'all'], default='all')
+        parser.add_argument('--scenario', action='append', dest='scenarios', help="تشغيل سيناريو محدد فقط (يمكن تكراره)")
+        parser.add_argument('--cold', action='store_true', help="تفريغ كاش الكتالوج قبل كل طلب")
+        parser.add_argument('--output', help="ملف JSON لحفظ النتائج")
+        parser.add_argument('--baseline', help="ملف JSON سابق للمقارنة؛ أي تراجع يُفشل الأمر")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="نسبة الزيادة المسموحة في p95")
+
+    def handle(self, *args, **options):
+        transports = list(TRANSPORTS) if options['transport'] == 'all' else [options['transport']]
+        media = tempfile.TemporaryDirectory()
+        settings = override_settings(
+            MEDIA_ROOT=media.name, METRICS_ENABLED=True, QUERY_BUDGET_RAISE=False, PRODUCT_IMAGE_ASYNC=False,
+        )
+        with media, settings, benchmark_database():
+            started = time.perf_counter()
+            user, product = self.seed(options)
+            self.stdout.write(f"تجهيز البيانات: {time.perf_counter() - started:.1f}s")
+
+            scenarios = self.scenarios(user, product)
+            if options['scenarios']:
+                unknown = set(options['scenarios']) - set(scenarios)
+                if unknown:
+                    raise CommandError(f"سيناريو غير معروف: {', '.join(sorted(unknown))}")
+                scenarios = {name: scenarios[name] for name in options['scenarios']}
+
+            results = {}
+            for transport_name in transports:
+                transport = TRANSPORTS[transport_name](user)
+                try:
+                    for name, scenario in scenarios.items():
+                        stats = self.run(transport, scenario, options)
+                        results[f'{name}[{transport_name}]'] = stats
+                        self.stdout.write(
+                            f"{name + '[' + transport_name + ']':<28} p50={stats['p50_ms']:>8.2f}ms "
+                            f"p95={stats['p95_ms']:>8.2f}ms p99={stats['p99_ms']:>8.2f}ms "
+                            f"{stats['throughput_rps']:>8.1f} req/s  {stats['queries_per_request']:>5.1f} q/req"
+                        )
+                finally:
+                    transport.close()
+
+        report = {'meta': self.meta(options), 'scenarios': results}
+        if options['output']:
+            save_results(options['output'], report)
+            self.stdout.write(f"حُفظت النتائج في {options['output']}")
+        if options['baseline']:
+            regressions = find_regressions(load_results(options['baseline']), report, options['tolerance'])
+            if regressions:
+                raise CommandError("تراجع في الأداء:\n" + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS("لا يوجد تراجع مقارنة بخط الأساس."))
+
+    # ---------------- Data ----------------
+    def seed(self, options):
+        images = seed_images(options['images']) if options['images'] else ()
+        seed_products(options['products'], images=images)
+        rebuild_index()
+        users = seed_users(max(options['users'], 1))
+        seed_carts(users[1:])
+        seed_orders(users, options['orders'])
+        user = users[0]
+        # منتجات ثابتة للسلة والشراء بمخزون لا ينفد خلال القياس
+        product = Product.objects.order_by('id').first()
+        Product.objects.filter(id__in=self.checkout_products()).update(stock=10 ** 9)
+        return user, product
+
+    @staticmethod
+    def checkout_products():
+        return list(Product.objects.order_by('id').values_list('id', flat=True)[:3])
+
+    # ---------------- Scenarios ----------------
+    def scenarios(self, user, product):
+        cart_ids = self.checkout_products()
+
+        def fill_cart():
+            cart, _ = Cart.objects.get_or_create(user=user)
+            CartItem.objects.set_quantities(cart, {pid: 1 for pid in cart_ids})
+
+        checkout_form = {'customer_name': 'عميل', 'phone': '0599', 'address': 'الخليل'}
+        return {
+            'catalog_page': ('GET', reverse('home_page'), None, None, 'home_page'),
+            'product_api_list': ('GET', reverse('api_products'), None, None, 'api_products'),
+            'product_api_detail': ('GET', reverse('api_product_detail', args=[product.id]), None, None, 'api_product_detail'),
+            'add_to_cart': ('GET', reverse('add_to_cart', args=[product.id]), None, None, 'add_to_cart'),
+            'cart_page': ('GET', reverse('view_cart'), None, fill_cart, 'view_cart'),
+            'checkout': ('POST', reverse('checkout'), checkout_form, fill_cart, 'checkout'),
+            'my_orders': ('GET', reverse('my_orders'), None, None, 'my_orders'),
+        }
+
+    def run(self, transport, scenario, options):
+        method, path, data, setup, view = scenario
+        if method == 'POST':
+            # كوكي CSRF للطلبات عبر HTTP الحقيقي
+            transport.request('GET', path)
+        samples = []
+        for i in range(options['warmup'] + options['repeat']):
+            if setup:
+                setup()
+            if options['cold']:
+                catalog_cache().clear()
+            if i == options['warmup']:
+                registry.reset()
+            start = time.perf_counter()
+            status = transport.request(method, path, data)
+            elapsed = time.perf_counter() - start
+            if status >= 400:
+                raise CommandError(f"{method} {path} أعاد {status}")
+            if i >= options['warmup']:
+                samples.append(elapsed * 1000)
+        requests, queries, _ = registry.snapshot(view)
+        stats = summarize(samples)
+        stats['throughput_rps'] = round(len(samples) / (sum(samples) / 1000), 1)
+        stats['queries_per_request'] = round(queries / requests, 2) if requests else None
+        return stats
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        keys = ['products', 'users', 'orders', 'images', 'repeat', 'warmup', 'cold']
+        return {'commit': commit, 'created_at': timezone.now().isoformat(), **{k: options[k] for k in keys}}
@@ -0,0 +1,149 @@
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from products.benchmarks import HTTPTransport, free_port, seed_products, seed_users, server_process, summarize
+from products.models import Product
+from products.search import rebuild_index
+
+# بدون ضبط = إعدادات Django الافتراضية كما كانت قبل clean_shop/database.py
+PROFILES = {
+    'stock': {'SQLITE_TUNING': '0'},
+    'tuned': {'SQLITE_TUNING': '1'},
+}
+HOT_PRODUCTS = 50
+
+
+class Command(BaseCommand):
+    help = (
+        "يشغّل gunicorn بعدة workers على قاعدة SQLite مؤقتة ويقيس الإنتاجية والأخطاء "
+        "(database is locked) مع إعدادات SQLite الافتراضية ومع الضبط."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--clients', type=int, default=16, help="عدد العملاء المتزامنين (مستخدم لكل عميل)")
+        parser.add_argument('--duration', type=float, default=15, help="ثوانٍ لكل إعداد")
+        parser.add_argument('--products', type=int, default=5_000)
+        parser.add_argument('--profile', action='append', dest='profiles', choices=list(PROFILES))
+        # داخلي: يُستدعى في عملية فرعية لتجهيز القاعدة المؤقتة
+        parser.add_argument('--prepare', metavar='FILE', help="(داخلي) تجهيز البيانات وكتابة الجلسات والمنتجات في FILE")
+
+    def handle(self, *args, **options):
+        if options['prepare']:
+            return self.prepare(options)
+        if importlib.util.find_spec('gunicorn') is None:
+            raise CommandError("هذا القياس يحتاج gunicorn: pip install gunicorn")
+
+        results = {}
+        for profile in options['profiles'] or list(PROFILES):
+            with tempfile.TemporaryDirectory() as tmp:
+                results[profile] = self.run_profile(profile, tmp, options)
+            stats = results[profile]
+            self.stdout.write(
+                f"{profile:<6} {stats['requests']:>6} طلب  {stats['throughput_rps']:>7.1f} req/s  "
+                f"p50={stats['p50_ms']:>7.1f}ms p95={stats['p95_ms']:>7.1f}ms  أخطاء={stats['errors']}"
+            )
+        if set(results) == set(PROFILES) and results['stock']['throughput_rps']:
+            gain = results['tuned']['throughput_rps'] / results['stock']['throughput_rps']
+            self.stdout.write(self.style.SUCCESS(f"الإنتاجية مع الضبط: x{gain:.2f}"))
+
+    # ---------------- Setup (child process) ----------------
+    def prepare(self, options):
+        seed_products(options['products'])
+        rebuild_index()
+        hot = list(Product.objects.order_by('id').values_list('id', flat=True)[:HOT_PRODUCTS])
+        Product.objects.filter(id__in=hot).update(stock=10 ** 9)
+        sessions = []
+        for user in seed_users(options['clients']):
+            client = Client()
+            client.force_login(user)
+            sessions.append(client.cookies['sessionid'].value)
+        with open(options['prepare'], 'w') as f:
+            json.dump({'sessions': sessions, 'products': hot}, f)
+
+    # ---------------- One profile ----------------
+    def run_profile(self, profile, tmp, options):
+        env = {
+            **os.environ, **PROFILES[profile],
+            'SQLITE_PATH': os.path.join(tmp, 'db.sqlite3'),
+            'QUERY_BUDGET_RAISE': '0',
+            'PRODUCT_IMAGE_ASYNC': '0',
+        }
+        manage = [sys.executable, str(settings.BASE_DIR / 'manage.py')]
+        data_file = os.path.join(tmp, 'bench.json')
+        subprocess.run([*manage, 'migrate', '--noinput', '-v0'], env=env, check=True)
+        subprocess.run(
+            [*manage, 'benchmark_sqlite', '--prepare', data_file,
+             '--products', str(options['products']), '--clients', str(options['clients'])],
+            env=env, check=True,
+        )
+        with open(data_file) as f:
+            data = json.load(f)
+
+        port = free_port()
+        argv = [
+            sys.executable, '-m', 'gunicorn', 'clean_shop.wsgi:application',
+            '--workers', str(options['workers']), '--bind', f'127.0.0.1:{port}', '--log-level', 'error',
+        ]
+        try:
+            with server_process(argv, env, port, cwd=settings.BASE_DIR) as address:
+                return self.load(address, data['sessions'], data['products'], options['duration'])
+        except RuntimeError:
+            raise CommandError("لم يبدأ gunicorn في الوقت المحدد.")
+
+    # ---------------- Load ----------------
+    def load(self, address, sessions, product_ids, duration):
+        checkout_form = {'customer_name': 'عميل', 'phone': '0599', 'address': 'الخليل'}
+        samples, errors = [], []
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def client(session_key, seed):
+            rng = random.Random(seed)
+            http = HTTPTransport(address, session_key)
+            http.request('GET', reverse('checkout'))  # كوكي CSRF
+            # تصفح، ثم إضافة للسلة، ثم شراء: مزيج قراءة وكتابة مثل المتجر الحقيقي
+            steps = [
+                ('GET', reverse('home_page'), None),
+                ('GET', reverse('api_products'), None),
+                ('ADD', None, None),
+                ('POST', reverse('checkout'), checkout_form),
+            ]
+            while time.monotonic() < deadline:
+                for method, path, data in steps:
+                    if method == 'ADD':
+                        method, path = 'GET', reverse('add_to_cart', args=[rng.choice(product_ids)])
+                    start = time.perf_counter()
+                    try:
+                        status = http.request(method, path, data)
+                    except OSError:
+                        status = 599
+                    elapsed = (time.perf_counter() - start) * 1000
+                    with lock:
+                        samples.append(elapsed)
+                        if status >= 500:
+                            errors.append(status)
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=client, args=(key, i)) for i, key in enumerate(sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.monotonic() - started
+
+        stats = summarize(samples) if samples else {'p50_ms': 0, 'p95_ms': 0, 'p99_ms': 0}
+        ok = len(samples) - len(errors)
+        return {**stats, 'requests': len(samples), 'errors': len(errors), 'throughput_rps': round(ok / wall, 1)}
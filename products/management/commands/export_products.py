@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from products.bulk import export_rows
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "يصدّر المنتجات إلى CSV أو JSONL بشكل متدفق."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--output', '-o', help="مسار ملف الإخراج (الافتراضي stdout)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunks = export_rows(Product.objects.all(), options['format'], options['chunk_size'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as out:
+            out.writelines(chunks)
@@ -0,0 +1,40 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from products.images import generate_variants, store_variants
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "يولّد النسخ المصغّرة لصور المنتجات الموجودة بالتوازي."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--all', action='store_true', help="إعادة توليد حتى المنتجات التي لها نسخ مسبقاً")
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True)
+        pending = [
+            (pk, image) for pk, image, variants in products.values_list('id', 'image', 'image_variants')
+            if options['all'] or (variants or {}).get('source') != image
+        ]
+        if not pending:
+            self.stdout.write("لا توجد صور بحاجة للمعالجة.")
+            return
+
+        # العمليات الفرعية تعمل على الملفات فقط؛ الكتابة في قاعدة البيانات تتم هنا
+        connections.close_all()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(generate_variants, image): pk for pk, image in pending}
+            for future in as_completed(futures):
+                pk = futures[future]
+                try:
+                    store_variants(pk, future.result())
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"منتج {pk}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"تمت معالجة {done} صورة، فشل {failed}."))
@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.bulk import UnsupportedFormat, import_rows, iter_rows
+
+
+class Command(BaseCommand):
+    help = "يستورد المنتجات من ملف CSV أو JSONL (upsert حسب SKU) على دفعات."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="مسار الملف، أو - للقراءة من stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="يُستنتج من امتداد الملف إن لم يُحدد")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        try:
+            result = import_rows(iter_rows(stream, fmt), batch_size=options['batch_size'])
+        except UnsupportedFormat:
+            raise CommandError(f"صيغة غير مدعومة: {fmt}")
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+        for error in result.errors:
+            self.stderr.write(f"سطر {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"تم استيراد {result.imported} منتج، وتخطي {result.failed} صف غير صالح."
+        ))
@@ -0,0 +1,35 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from products.inventory import post_movements, release_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "يعيد كمية الحجوزات المنتهية (وحجوزات السلات المحذوفة) إلى المتاح على دفعات، "
+        "ويرحّل حركات المخزون المتبقية إلى Product.stock."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=500, help="عدد الحجوزات في كل معاملة")
+        parser.add_argument('--interval', type=float, help="التكرار كل هذه الثواني حتى الإيقاف، بدل مرة واحدة")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        previous = {sig: signal.signal(sig, lambda *_: stop.set()) for sig in (signal.SIGTERM, signal.SIGINT)}
+        released = posted = 0
+        try:
+            while True:
+                released += release_expired(options['batch'])
+                posted += post_movements(batch_size=options['batch'])
+                if options['interval'] is None or stop.is_set():
+                    break
+                close_old_connections()
+                stop.wait(options['interval'])
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+        self.stdout.write(self.style.SUCCESS(f"أُعيد {released} حجز، ورُحّلت {posted} حركة."))
@@ -0,0 +1,18 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from products.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "يعيد حساب ملخصات المبيعات اليومية من سجل الطلبات (كاملاً أو لفترة محددة)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=date.fromisoformat, help="YYYY-MM-DD")
+        parser.add_argument('--to', dest='end', type=date.fromisoformat, help="YYYY-MM-DD")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        days = rebuild_rollups(options['start'], options['end'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"تمت إعادة حساب {days} يوم."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from products.search import rebuild_index, search_available
+
+
+class Command(BaseCommand):
+    help = "يعيد بناء فهرس البحث (FTS5) لكل المنتجات على دفعات."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not search_available(using):
+            raise CommandError("فهرس FTS5 غير متوفر على قاعدة البيانات هذه.")
+        with transaction.atomic(using=using):
+            total = rebuild_index(batch_size=options['batch_size'], using=using)
+        self.stdout.write(self.style.SUCCESS(f"تمت فهرسة {total} منتج."))
@@ -0,0 +1,46 @@
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from products.jobs import claim, release_stale, run_in_thread
+
+
+class Command(BaseCommand):
+    help = "يشغّل المهام المؤجلة (رسائل التأكيد، مزامنة الـ ERP) من جدول Job على مجموعة threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--batch', type=int, default=20, help="عدد المهام المأخوذة في كل مرة")
+        parser.add_argument('--poll', type=float, default=1.0, help="ثوانٍ بين الفحوص عندما يكون الطابور فارغاً")
+        parser.add_argument('--once', action='store_true', help="تنفيذ المهام المستحقة الآن ثم الخروج")
+
+    def handle(self, *args, **options):
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        stop = threading.Event()
+        # SIGTERM: ننهي المهام الجارية ولا نأخذ جديدة
+        previous = {sig: signal.signal(sig, lambda *_: stop.set()) for sig in (signal.SIGTERM, signal.SIGINT)}
+
+        done = failed = 0
+        try:
+            with ThreadPoolExecutor(max_workers=options['threads'], thread_name_prefix='jobs') as pool:
+                while not stop.is_set():
+                    release_stale()
+                    jobs = claim(worker, options['batch'])
+                    if not jobs:
+                        if options['once']:
+                            break
+                        close_old_connections()
+                        stop.wait(options['poll'])
+                        continue
+                    for ok in pool.map(run_in_thread, jobs):
+                        done += ok
+                        failed += not ok
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+        self.stdout.write(self.style.SUCCESS(f"تم تنفيذ {done} مهمة، وفشلت {failed}."))
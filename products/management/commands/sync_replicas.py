@@ -0,0 +1,30 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = "ينسخ قاعدة SQLite الأساسية إلى ملفات النسخ (replicas) باستخدام backup API."
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("لا توجد نسخ معرّفة؛ حدّد SQLITE_REPLICAS.")
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("هذا الأمر لقواعد SQLite فقط؛ استخدم تكرار قاعدة البيانات نفسها لغيرها.")
+
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    # لقطة متسقة حتى لو كانت الأساسية تُكتب أثناء النسخ
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f"{alias}: {settings.DATABASES[alias]['NAME']}")
+        finally:
+            source.close()
+        self.stdout.write(self.style.SUCCESS("تمت مزامنة النسخ."))
@@ -0,0 +1,175 @@
+"""
+Per-view request metrics collected by products.middleware.InstrumentationMiddleware
+and exposed in Prometheus text format at /metrics/ (staff only).
+
+Counters live in this process only; with several workers each one reports
+its own numbers, which Prometheus sums when scraping them separately.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+# ---------------- SQL counting ----------------
+class QueryCounter:
+    """connection.execute_wrapper() callable: counts statements and their wall time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+# عدّاد الطلب الحالي في ContextVar: sync_to_async ينسخ السياق إلى thread الاستعلامات،
+# والاتصالات هناك غير اتصالات thread الـ event loop (connections لكل thread)
+_current_counter = ContextVar('query_counter', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+def install_query_counter(connection, **kwargs):
+    # في أول القائمة: execute_wrapper() المؤقت يزيل آخر عنصر عند الخروج
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_query)
+
+
+# كل اتصال يُفتح في أي thread (ومنها threads الـ sync_to_async تحت ASGI)
+connection_created.connect(install_query_counter)
+
+
+@contextmanager
+def counting(counter):
+    """Count into `counter` every statement run in this context, whichever thread and connection runs it."""
+    # اتصالات هذا الـ thread التي فُتحت قبل تسجيل الإشارة
+    for connection in connections.all():
+        install_query_counter(connection)
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
+
+
+# ---------------- Registry ----------------
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'total')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.total = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.total += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = defaultdict(int)            # (view, method, status) -> n
+            self.latency = {}                           # view -> _Histogram
+            self.queries = {}                           # view -> _Histogram
+            self.query_seconds = defaultdict(float)     # view -> seconds
+            self.budget_exceeded = defaultdict(int)     # view -> n
+
+    def record(self, view, method, status, seconds, queries, query_seconds, over_budget=False):
+        with self._lock:
+            self.requests[(view, method, status)] += 1
+            self.latency.setdefault(view, _Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries.setdefault(view, _Histogram(QUERY_BUCKETS)).observe(queries)
+            self.query_seconds[view] += query_seconds
+            if over_budget:
+                self.budget_exceeded[view] += 1
+
+    def snapshot(self, view):
+        """(requests, queries, query seconds) for one view; handy in tests and shells."""
+        with self._lock:
+            histogram = self.queries.get(view)
+            return (
+                histogram.total if histogram else 0,
+                int(histogram.sum) if histogram else 0,
+                self.query_seconds.get(view, 0.0),
+            )
+
+    # ---------------- Prometheus text format ----------------
+    def render(self):
+        with self._lock:
+            lines = []
+            _header(lines, 'shop_http_requests_total', 'counter', "Requests by view, method and status.")
+            for (view, method, status), n in sorted(self.requests.items()):
+                lines.append(f'shop_http_requests_total{_labels(view=view, method=method, status=status)} {n}')
+
+            _header(lines, 'shop_http_request_duration_seconds', 'histogram', "Time spent in the view and middleware below.")
+            for view, histogram in sorted(self.latency.items()):
+                _histogram(lines, 'shop_http_request_duration_seconds', view, histogram)
+
+            _header(lines, 'shop_db_queries_per_request', 'histogram', "SQL statements executed per request.")
+            for view, histogram in sorted(self.queries.items()):
+                _histogram(lines, 'shop_db_queries_per_request', view, histogram)
+
+            _header(lines, 'shop_db_query_seconds_total', 'counter', "Wall time spent executing SQL.")
+            for view, seconds in sorted(self.query_seconds.items()):
+                lines.append(f'shop_db_query_seconds_total{_labels(view=view)} {seconds:.6f}')
+
+            _header(lines, 'shop_query_budget_exceeded_total', 'counter', "Requests over their view's query budget.")
+            for view, n in sorted(self.budget_exceeded.items()):
+                lines.append(f'shop_query_budget_exceeded_total{_labels(view=view)} {n}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _header(lines, name, kind, help_text):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def _histogram(lines, name, view, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{_labels(view=view, le=bound)} {cumulative}')
+    lines.append(f'{name}_bucket{_labels(view=view, le="+Inf")} {histogram.total}')
+    lines.append(f'{name}_sum{_labels(view=view)} {histogram.sum:.6f}')
+    lines.append(f'{name}_count{_labels(view=view)} {histogram.total}')
+
+
+registry = Registry()
@@ -0,0 +1,223 @@
+import cProfile
+import io
+import logging
+import pstats
+import time
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.http import HttpResponse
+from django.utils.functional import SimpleLazyObject
+
+from .metrics import QueryBudgetExceeded, QueryCounter, counting, registry
+from .auth import aget_cached_user, get_cached_user
+from .carts import AnonymousCart, clear_anonymous_cart, has_anonymous_cart, merge_into_user_cart
+from .routers import routing_scope, wrote_to_primary
+
+logger = logging.getLogger(__name__)
+
+
+class HybridMiddleware:
+    """
+    Base for middleware that runs natively under both WSGI and ASGI:
+    subclasses implement handle() and ahandle(). A sync-only middleware in
+    an ASGI stack would make Django run everything below it, async views
+    included, on a worker thread for the whole request.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.ahandle(request)
+        return self.handle(request)
+
+
+class InstrumentationMiddleware(HybridMiddleware):
+    """
+    Times every request and counts its SQL through an execute wrapper on every
+    connection (products.metrics.counting), so DRF views, async views and
+    anything else that hits the database are covered too.
+    Costs two perf_counter() calls per statement and one lock per request.
+
+    QUERY_BUDGETS maps a URL name to the most statements that view may run;
+    going over is logged, or raised when QUERY_BUDGET_RAISE is on (tests).
+    Staff can add ?_profile=1 to a request to get its cProfile report
+    instead of the response, when REQUEST_PROFILING is on.
+    """
+
+    def handle(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        if self.should_profile(request, getattr(request, 'user', None)):
+            return self.profile(request)
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with counting(counter):
+            response = self.get_response(request)
+        return self.record(request, response, counter, time.perf_counter() - start)
+
+    async def ahandle(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        if self.wants_profile(request) and self.should_profile(request, await request.auser()):
+            return await self.aprofile(request)
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+        # الاستعلامات تُنفَّذ في thread آخر عبر sync_to_async وباتصالاته؛ العدّاد يصلها عبر السياق
+        with counting(counter):
+            response = await self.get_response(request)
+        return self.record(request, response, counter, time.perf_counter() - start)
+
+    def record(self, request, response, counter, elapsed):
+        view = self.view_name(request)
+        budget = settings.QUERY_BUDGETS.get(view)
+        over_budget = budget is not None and counter.count > budget
+        registry.record(
+            view, request.method, response.status_code, elapsed,
+            counter.count, counter.seconds, over_budget,
+        )
+        if over_budget:
+            message = f"{view} ran {counter.count} queries (budget {budget}) for {request.path}"
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    @staticmethod
+    def view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return '<unresolved>'
+        return match.view_name or match._func_path
+
+    # ---------------- Profiling ----------------
+    profile_sorts = ('cumulative', 'tottime', 'calls')
+
+    @staticmethod
+    def wants_profile(request):
+        return settings.REQUEST_PROFILING and request.GET.get('_profile') == '1'
+
+    def should_profile(self, request, user):
+        # المستخدم يُقرأ فقط عند طلب التقرير فعلاً
+        return self.wants_profile(request) and user is not None and user.is_staff
+
+    def profile(self, request):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            self.get_response(request)
+        finally:
+            profiler.disable()
+        return self.report(request, profiler)
+
+    async def aprofile(self, request):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.get_response(request)
+        finally:
+            profiler.disable()
+        return self.report(request, profiler)
+
+    def report(self, request, profiler):
+        sort = request.GET.get('_sort')
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats(sort if sort in self.profile_sorts else 'cumulative').print_stats(40)
+        return HttpResponse(out.getvalue(), content_type='text/plain; charset=utf-8')
+
+
+class ReplicaPinningMiddleware(HybridMiddleware):
+    """
+    Read-your-writes for replica routing: a request that writes (or uses an
+    unsafe method) sets a short-lived cookie, and requests carrying it read
+    everything from the primary until it expires.
+    """
+    cookie_name = 'db_primary'
+
+    def handle(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        with routing_scope(pinned=self.is_pinned(request)):
+            return self.pin(request, self.get_response(request))
+
+    async def ahandle(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        # asgiref يعيد تغييرات الـ ContextVars من thread الاستعلامات إلى هذا السياق
+        with routing_scope(pinned=self.is_pinned(request)):
+            return self.pin(request, await self.get_response(request))
+
+    @staticmethod
+    def is_unsafe(request):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def is_pinned(self, request):
+        return self.is_unsafe(request) or self.cookie_name in request.COOKIES
+
+    def pin(self, request, response):
+        if self.is_unsafe(request) or wrote_to_primary():
+            response.set_cookie(
+                self.cookie_name, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class AnonymousCartMiddleware(HybridMiddleware):
+    """
+    Moves a visitor's cookie cart into their database Cart once they are
+    logged in: before the view for requests that already are (checkout,
+    the cart page), after it for the login request itself.
+    """
+
+    def handle(self, request):
+        if not has_anonymous_cart(request):
+            return self.get_response(request)
+        merged = self.merge(request)
+        response = self.get_response(request)
+        if not merged:
+            merged = self.merge(request)
+        if merged:
+            clear_anonymous_cart(response)
+        return response
+
+    async def ahandle(self, request):
+        if not has_anonymous_cart(request):
+            return await self.get_response(request)
+        merge = sync_to_async(self.merge)
+        merged = await merge(request)
+        response = await self.get_response(request)
+        if not merged:
+            merged = await merge(request)
+        if merged:
+            clear_anonymous_cart(response)
+        return response
+
+    @staticmethod
+    def merge(request):
+        if not request.user.is_authenticated:
+            return False
+        cart = AnonymousCart.from_request(request)
+        if cart:
+            merge_into_user_cart(request.user, cart)
+        return True
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware whose request.user comes from products.auth's cache."""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
+        request.auser = partial(aget_cached_user, request)
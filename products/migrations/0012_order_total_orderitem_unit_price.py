@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:34
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Order = apps.get_model('products', 'Order')
+    OrderItem = apps.get_model('products', 'OrderItem')
+
+    OrderItem.objects.update(unit_price=Subquery(
+        Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1]
+    ))
+    order_sum = (
+        OrderItem.objects.filter(order_id=OuterRef('pk'))
+        .values('order_id')
+        .annotate(s=Sum(F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)))
+        .values('s')[:1]
+    )
+    Order.objects.update(total=Coalesce(Subquery(order_sum), 0, output_field=DecimalField(max_digits=12, decimal_places=2)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='order_created_idx'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:41
+
+import re
+import unicodedata
+from itertools import islice
+
+import django.db.models.deletion
+import products.models
+from django.db import OperationalError, migrations, models
+
+
+# نسخة مجمّدة من products.search.normalize كما كانت عند كتابة هذه الهجرة: تغييرها
+# لاحقاً يحتاج إعادة بناء الفهرس (manage.py rebuild_search_index) لا تعديل الهجرة
+_ARABIC_MARKS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_ARABIC_LETTERS = str.maketrans({
+    '\u0623': '\u0627', '\u0625': '\u0627', '\u0622': '\u0627', '\u0671': '\u0627',  # أ إ آ ٱ -> ا
+    '\u0649': '\u064a', '\u06cc': '\u064a', '\u0626': '\u064a',  # ى ی ئ -> ي
+    '\u0624': '\u0648',  # ؤ -> و
+    '\u0629': '\u0647',  # ة -> ه
+})
+BATCH_SIZE = 2000
+
+
+def normalize(text):
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', text)
+    text = _ARABIC_MARKS.sub('', text)
+    return text.translate(_ARABIC_LETTERS).casefold()
+
+
+def create_fts_table(apps, schema_editor):
+    # FTS5 خاص بـ SQLite؛ على قواعد أخرى يرجع البحث إلى icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE products_product_fts USING fts5(name, description)'
+        )
+    except OperationalError:
+        return  # SQLite compiled without FTS5
+    # الاسم أهم من الوصف في الترتيب
+    schema_editor.execute(
+        "INSERT INTO products_product_fts (products_product_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')"
+    )
+    Product = apps.get_model('products', 'Product')
+    # على دفعات: لا نحمّل كل المنتجات في الذاكرة مرة واحدة
+    products = Product.objects.order_by().values_list('id', 'name', 'description').iterator(chunk_size=BATCH_SIZE)
+    with schema_editor.connection.cursor() as cursor:
+        while batch := list(islice(products, BATCH_SIZE)):
+            cursor.executemany(
+                'INSERT INTO products_product_fts (rowid, name, description) VALUES (%s, %s, %s)',
+                [(pk, normalize(name), normalize(description)) for pk, name, description in batch],
+            )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS products_product_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_product_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchIndex',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='products.product')),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+                ('document', products.models.SearchDocumentField(db_column='products_product_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'products_product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    OrderItem = apps.get_model('products', 'OrderItem')
+    DailySales = apps.get_model('products', 'DailySales')
+    DailyProductSales = apps.get_model('products', 'DailyProductSales')
+
+    items = OrderItem.objects.annotate(day=TruncDate('order__created_at'))
+    line_total = Sum(F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    DailyProductSales.objects.bulk_create([
+        DailyProductSales(date=day, product_id=pid, units=units, revenue=revenue)
+        for day, pid, units, revenue in items.values_list('day', 'product_id')
+        .annotate(units=Sum('quantity'), revenue=line_total).order_by()
+    ], batch_size=5000)
+    DailySales.objects.bulk_create([
+        DailySales(date=day, orders=orders, units=units, revenue=revenue)
+        for day, orders, units, revenue in items.values_list('day')
+        .annotate(orders=Count('order_id', distinct=True), units=Sum('quantity'), revenue=line_total).order_by()
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_product_sku'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='products.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'product'), name='daily_product_sales_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0021_inventory_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['kind', 'id'], name='stockmove_kind_idx'),
+        ),
+    ]
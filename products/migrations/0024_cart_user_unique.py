@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_carts(apps, schema_editor):
+    # تبقى أقدم سلة لكل مستخدم وتُجمع فيها أسطر السلال الأخرى قبل حذفها
+    Cart = apps.get_model('products', 'Cart')
+    CartItem = apps.get_model('products', 'CartItem')
+
+    duplicated = (
+        Cart.objects.filter(user__isnull=False)
+        .values('user_id')
+        .annotate(n=Count('id'), keep=Min('id'))
+        .filter(n__gt=1)
+    )
+    for row in duplicated:
+        others = Cart.objects.filter(user_id=row['user_id']).exclude(pk=row['keep'])
+        for item in CartItem.objects.filter(cart__in=others):
+            kept, created = CartItem.objects.get_or_create(
+                cart_id=row['keep'], product_id=item.product_id, defaults={'quantity': item.quantity},
+            )
+            if not created:
+                kept.quantity += item.quantity
+                kept.save(update_fields=['quantity'])
+        # حجوزات السلال المحذوفة تصبح بلا سلة ويعيدها reap_reservations
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0023_product_stock_not_editable'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_carts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=['user'], name='cart_user_unique'),
+        ),
+    ]
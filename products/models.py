@@ -1,15 +1,111 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, F, Lookup, Prefetch, Sum, Value, When
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.utils import timezone
+
+
+def line_total_sum(prefix=''):
+    """SUM(price * quantity) over cart lines, optionally through a relation prefix."""
+    return Sum(
+        F(f'{prefix}product__price') * F(f'{prefix}quantity'),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+class ItemsQuerySet(models.QuerySet):
+    """Shared helpers for models with an `items` relation (Cart, Order)."""
+
+    def with_items(self):
+        item_model = self.model._meta.get_field('items').related_model
+        items = item_model.objects.select_related('product').order_by('id')
+        return self.prefetch_related(Prefetch('items', queryset=items))
+
+
+class CartQuerySet(ItemsQuerySet):
+    def with_total(self):
+        return self.annotate(items_total=line_total_sum('items__'))
+
+
+class CartItemQuerySet(models.QuerySet):
+    """
+    Cart line writes as set-based statements: no read-modify-write, so
+    concurrent clicks can't lose increments.
+    """
+
+    def add_quantities(self, cart, quantities):
+        # {product_id: n}: ينشئ السطر الناقص ثم يزيد الكمية بـ F() داخل نفس المعاملة
+        if not quantities:
+            return
+        with transaction.atomic(using=self.db):
+            self.bulk_create(
+                [self.model(cart=cart, product_id=pid, quantity=0) for pid in quantities],
+                ignore_conflicts=True,
+            )
+            increment = Case(
+                *[When(product_id=pid, then=Value(n)) for pid, n in quantities.items()],
+                output_field=models.PositiveIntegerField(),
+            )
+            self.filter(cart=cart, product_id__in=quantities).update(quantity=F('quantity') + increment)
+
+    def set_quantities(self, cart, quantities):
+        # {product_id: n}: الكمية صفر تعني حذف السطر
+        if not quantities:
+            return
+        removed = [pid for pid, n in quantities.items() if n <= 0]
+        kept = {pid: n for pid, n in quantities.items() if n > 0}
+        with transaction.atomic(using=self.db):
+            if removed:
+                self.filter(cart=cart, product_id__in=removed).delete()
+            if kept:
+                self.bulk_create(
+                    [self.model(cart=cart, product_id=pid, quantity=n) for pid, n in kept.items()],
+                    update_conflicts=True,
+                    unique_fields=['cart', 'product'],
+                    update_fields=['quantity'],
+                )
+
+
+class OrderQuerySet(ItemsQuerySet):
+    def revenue(self):
+        return self.aggregate(revenue=Sum('total'))['revenue'] or Decimal('0')
 
 
 class Product(models.Model):
+    # رمز المنتج عند المورّد؛ مفتاح الاستيراد الجماعي (upsert)
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=200)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='product_images/', blank=True, null=True)
-    stock = models.IntegerField(default=0)
+    # نسخ مصغّرة تُولَّد في الخلفية (products/images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # يتغير عبر دفتر الحركات (products/inventory.py)، لا من النماذج: تعديل منتج يحفظ حقوله
+    # بـ save(update_fields=...) حتى لا يكتب قيمة قديمة فوق مبيعات رُحّلت أثناء التعديل
+    stock = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # يُحدَّث مع كل تعديل؛ التحديثات الجماعية (update) يجب أن تضبطه يدوياً بـ Now()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # فهارس الترقيم بالمؤشر (keyset) على الترتيبات المعروضة في الكتالوج
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            # MAX(updated_at) لـ ETag/Last-Modified الخاص بالقائمة
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+            # فلتر "متوفر فقط": فهارس جزئية على المنتجات المتوفرة لنفس الترتيبات
+            models.Index(
+                fields=['created_at', 'id'], condition=models.Q(stock__gt=0),
+                name='product_instock_created_idx',
+            ),
+            models.Index(
+                fields=['price', 'id'], condition=models.Q(stock__gt=0),
+                name='product_instock_price_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -24,8 +120,18 @@ class Cart(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CartQuerySet.as_manager()
+
+    class Meta:
+        # سلة واحدة لكل مستخدم: get_or_create المتزامن يعيد نفس السلة بدل إنشاء ثانية
+        constraints = [
+            models.UniqueConstraint(fields=['user'], name='cart_user_unique'),
+        ]
+
     def total_price(self):
-        return sum(item.total_price() for item in self.items.all())
+        if hasattr(self, 'items_total'):
+            return self.items_total or Decimal('0')
+        return self.items.aggregate(total=line_total_sum())['total'] or Decimal('0')
 
     def __str__(self):
         if self.user:
@@ -37,6 +143,8 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ('cart', 'product')
 
@@ -58,9 +166,21 @@ class Order(models.Model):
     phone = models.CharField(max_length=50)
     address = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # يُحسب مرة واحدة عند تأكيد الطلب ولا يتغير بتغير أسعار المنتجات لاحقاً
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            # البحث في لوحة الإدارة برقم الهاتف (مطابقة تامة)
+            models.Index(fields=['phone'], name='order_phone_idx'),
+        ]
 
     def total_price(self):
-        return sum(item.total_price() for item in self.items.all())
+        return self.total
 
     def __str__(self):
         if self.user:
@@ -71,9 +191,174 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    # سعر المنتج لحظة الشراء
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
     def total_price(self):
-        return self.product.price * self.quantity
+        return self.unit_price * self.quantity
+
+    def __str__(self):
+        return f"{self.product.name} (x{self.quantity})"
+
+
+# ---------------- Search index ----------------
+class SearchDocumentField(models.TextField):
+    """The hidden FTS5 column named after the table; only used for `__match`."""
+
+
+@SearchDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class ProductSearchIndex(models.Model):
+    """
+    SQLite FTS5 table over normalized Product.name/description (see
+    products/search.py). rowid is the product id; `rank` is bm25 when the
+    query has a MATCH.
+    """
+    product = models.OneToOneField(
+        Product,
+        primary_key=True,
+        db_column='rowid',
+        on_delete=models.DO_NOTHING,
+        related_name='search_index',
+    )
+    name = models.TextField()
+    description = models.TextField()
+    document = SearchDocumentField(db_column='products_product_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'products_product_fts'
+
+
+# ---------------- Sales rollups ----------------
+class DailySales(models.Model):
+    """Per-day order totals, kept up to date by checkout (see products/analytics.py)."""
+    date = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.date}: {self.orders} طلب"
+
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='daily_product_sales_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: {self.product_id} (x{self.units})"
+
+
+# ---------------- Background jobs ----------------
+class Job(models.Model):
+    """A unit of deferred work run by `manage.py run_jobs` (see products/jobs.py)."""
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = [(PENDING, 'pending'), (RUNNING, 'running'), (DONE, 'done'), (FAILED, 'failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    # نفس المفتاح لا يُضاف مرتين: إعادة المحاولة أو الضغط المزدوج لا يكرر العمل
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+
+# ---------------- Inventory ----------------
+# المخزون عبر دفتر حركات (products/inventory.py): البيع والحجز لا يعدّلان صف Product
+class StockMovement(models.Model):
+    """One change to a product's on-hand quantity. Rows are only ever added."""
+    OPENING, RECEIPT, ADJUSTMENT, SALE = 'opening', 'receipt', 'adjustment', 'sale'
+    KIND_CHOICES = [(OPENING, 'رصيد افتتاحي'), (RECEIPT, 'توريد'), (ADJUSTMENT, 'تسوية'), (SALE, 'بيع')]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    delta = models.IntegerField()
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    reference = models.CharField(max_length=64, blank=True)
+    # أُضيفت إلى Product.stock؛ البيع يُرحَّل بعد الالتزام لا داخل معاملة الطلب
+    posted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'id'], name='stockmove_product_idx'),
+            models.Index(fields=['product'], condition=models.Q(posted=False), name='stockmove_unposted_idx'),
+            # فلتر النوع في الإدارة، بترتيبها الافتراضي (-id)
+            models.Index(fields=['kind', 'id'], name='stockmove_kind_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.delta:+d} ({self.kind})"
+
+
+class StockReservation(models.Model):
+    """Units held for a cart line until expires_at; `manage.py reap_reservations` releases them."""
+    # حذف السلة لا يحذف الحجز: يبقى بلا سلة حتى يعيد الـ reaper كميته
+    cart = models.ForeignKey(Cart, on_delete=models.SET_NULL, null=True, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='reservation_cart_product_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} × {self.quantity} حتى {self.expires_at}"
+
+
+class InventoryShard(models.Model):
+    """
+    Units of a product that can still be reserved (on hand minus held),
+    split over INVENTORY_SHARDS rows so concurrent buyers update different
+    rows instead of queuing on one.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='inventory_shards')
+    shard = models.PositiveSmallIntegerField()
+    available = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='inventory_shard_unique'),
+        ]
 
     def __str__(self):
-        return f"{self.product.name} (x{self.quantity})"
\ No newline at end of file
+        return f"{self.product_id}/{self.shard}: {self.available}"
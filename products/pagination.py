@@ -0,0 +1,300 @@
+import base64
+import binascii
+import json
+from decimal import Decimal
+
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# ---------------- Orderings ----------------
+# كل ترتيب ينتهي بـ id حتى يكون المفتاح فريداً وثابتاً بين الصفحات
+PRODUCT_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    # متاح فقط مع البحث (search_rank من products/search.py)
+    'relevance': ('search_rank', 'id'),
+}
+DEFAULT_PRODUCT_ORDERING = 'newest'
+# أعمدة المنتج التي تُقرأ لبناء الـ cursor (search_rank ليس عموداً)
+PRODUCT_ORDERING_COLUMNS = ('created_at', 'price')
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def get_product_ordering(value, searching=False):
+    if searching and not value:
+        return 'relevance'
+    if value not in PRODUCT_ORDERINGS or (value == 'relevance' and not searching):
+        return DEFAULT_PRODUCT_ORDERING
+    return value
+
+
+def is_search(queryset):
+    return 'search_rank' in queryset.query.annotations
+
+
+# ---------------- Cursor encoding ----------------
+def encode_cursor(ordering, values, reverse=False):
+    payload = {'o': ordering, 'v': values}
+    if reverse:
+        payload['r'] = 1
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        return payload['o'], payload['v'], bool(payload.get('r'))
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+
+
+# ---------------- Keyset paginator ----------------
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Seek pagination: each page is a `WHERE (key) < (last key) LIMIT n` on an
+    indexed ordering, so page cost doesn't grow with the table size.
+    """
+
+    def __init__(self, queryset, ordering_name, per_page):
+        self.queryset = queryset
+        self.ordering_name = ordering_name
+        self.ordering = PRODUCT_ORDERINGS[ordering_name]
+        self.per_page = per_page
+
+    def _field_names(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def _field(self, name):
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return self.queryset.model._meta.get_field(name)
+
+    def _key(self, obj):
+        key = []
+        for name in self._field_names():
+            value = getattr(obj, name)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            key.append(value)
+        return key
+
+    def _parse_key(self, values):
+        names = self._field_names()
+        if not isinstance(values, list) or len(values) != len(names):
+            raise InvalidCursor(values)
+        try:
+            return [self._field(name).to_python(value) for name, value in zip(names, values)]
+        except Exception:
+            raise InvalidCursor(values)
+
+    def _seek_filter(self, values, reverse):
+        # (a, b) < (va, vb)  ==>  a <= va AND (a < va OR (a = va AND b < vb))
+        # القيد الأول على العمود الأول يسمح لـ SQLite باستخدام الفهرس كنطاق
+        clauses = Q()
+        bound = None
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            clause = Q(**{f'{name}__{lookup}': values[i]})
+            for prev_field, prev_value in zip(self.ordering[:i], values[:i]):
+                clause &= Q(**{prev_field.lstrip('-'): prev_value})
+            clauses |= clause
+            if bound is None:
+                bound = Q(**{f'{name}__{lookup}e': values[i]})
+        return bound & clauses
+
+    def _order_by(self, reverse):
+        if not reverse:
+            return self.ordering
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering)
+
+    def _page_queryset(self, cursor):
+        reverse = False
+        queryset = self.queryset
+        if cursor:
+            ordering_name, values, reverse = decode_cursor(cursor)
+            if ordering_name != self.ordering_name:
+                raise InvalidCursor(cursor)
+            queryset = queryset.filter(self._seek_filter(self._parse_key(values), reverse))
+        return queryset.order_by(*self._order_by(reverse))[:self.per_page + 1], reverse
+
+    def _make_page(self, rows, cursor, reverse):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                next_cursor = encode_cursor(self.ordering_name, self._key(rows[-1]))
+            if cursor and (has_more or not reverse):
+                previous_cursor = encode_cursor(self.ordering_name, self._key(rows[0]), reverse=True)
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def page(self, cursor=None):
+        queryset, reverse = self._page_queryset(cursor)
+        return self._make_page(list(queryset), cursor, reverse)
+
+    async def apage(self, cursor=None):
+        queryset, reverse = self._page_queryset(cursor)
+        return self._make_page([row async for row in queryset], cursor, reverse)
+
+
+# ---------------- REST pagination ----------------
+class ProductCursorPagination(BasePagination):
+    page_size = 24
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'sort'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_paginator(self, queryset, request):
+        self.request = request
+        ordering = get_product_ordering(
+            request.GET.get(self.ordering_query_param), searching=is_search(queryset)
+        )
+        return KeysetPaginator(queryset, ordering, self.get_page_size(request))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        paginator = self.get_paginator(queryset, request)
+        try:
+            self.page = paginator.page(request.GET.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound("مؤشر الصفحة غير صالح.")
+        return list(self.page)
+
+    async def apaginate_queryset(self, queryset, request):
+        """paginate_queryset() for async views; `request` may be a plain HttpRequest."""
+        paginator = self.get_paginator(queryset, request)
+        try:
+            self.page = await paginator.apage(request.GET.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound("مؤشر الصفحة غير صالح.")
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.page.previous_cursor)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+# ---------------- Estimated counts (admin) ----------------
+def estimated_row_count(model, using):
+    """
+    Rough size of `model`'s table without scanning it: the planner's
+    statistics where the database keeps them (PostgreSQL reltuples, SQLite
+    sqlite_stat1 after ANALYZE), else MAX(pk), which is one index lookup.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    estimates = []
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            elif connection.vendor == 'sqlite':
+                # سطر لكل فهرس، أوله عدد الصفوف فيه؛ الفهارس الجزئية أصغر فنأخذ الأكبر
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+            else:
+                cursor.execute('SELECT NULL WHERE 1 = 0')
+            estimates = [int(str(stat).split()[0]) for stat, in cursor.fetchall() if stat is not None]
+    except DatabaseError:
+        # sqlite_stat1 غير موجود قبل أول ANALYZE
+        pass
+    if estimates and max(estimates) > 0:
+        return max(estimates)
+    return model._default_manager.using(using).aggregate(n=Max('pk'))['n'] or 0
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Admin paginator that never runs a full COUNT(*). Results up to
+    `exact_limit` are counted exactly with a LIMITed subquery; beyond that an
+    unfiltered list uses estimated_row_count and a filtered one reports the
+    limit, so the page links stop there.
+    """
+    exact_limit = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        counted = queryset.order_by()[:self.exact_limit + 1].count()
+        if counted <= self.exact_limit:
+            return counted
+        if not queryset.query.where:
+            return max(estimated_row_count(queryset.model, queryset.db), counted)
+        return counted
@@ -0,0 +1,65 @@
+"""
+Primary/replica routing. Catalog models (settings.REPLICA_READ_MODELS) are
+read from a random replica; everything else, and every write, uses the
+primary. Once something is written, reads stay on the primary for the rest
+of the request (or thread, outside requests), and ReplicaPinningMiddleware
+carries that over to the same browser's next requests for
+REPLICA_PIN_SECONDS so users always see their own changes.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_pinned = ContextVar('db_pinned_to_primary', default=False)
+_wrote = ContextVar('db_wrote_to_primary', default=False)
+
+
+def pin_to_primary():
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get() or _wrote.get()
+
+
+def wrote_to_primary():
+    return _wrote.get()
+
+
+@contextmanager
+def routing_scope(pinned=False):
+    """One request's routing state; restored afterwards so threads can be reused."""
+    pinned_token, wrote_token = _pinned.set(pinned), _wrote.set(False)
+    try:
+        yield
+    finally:
+        _pinned.reset(pinned_token)
+        _wrote.reset(wrote_token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # العلاقات تُقرأ من نفس القاعدة التي جاء منها الكائن
+            return instance._state.db
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or is_pinned() or model._meta.label_lower not in settings.REPLICA_READ_MODELS:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # يشمل get_or_create و select_for_update: قد يكتبان، فنعاملهما ككتابة
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # النسخ تحمل نفس البيانات، فالعلاقات بينها مسموحة
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # النسخ تُنسخ من الأساسية (sync_replicas) ولا تُرحَّل بنفسها
+        return db == DEFAULT_DB_ALIAS
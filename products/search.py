@@ -0,0 +1,114 @@
+import re
+import unicodedata
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, FloatField, Q, Value
+
+from .models import Product, ProductSearchIndex
+
+
+FTS_TABLE = ProductSearchIndex._meta.db_table
+
+# ---------------- Arabic normalization ----------------
+# التشكيل والتطويل وعلامات القرآن
+_ARABIC_MARKS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_ARABIC_LETTERS = str.maketrans({
+    '\u0623': '\u0627', '\u0625': '\u0627', '\u0622': '\u0627', '\u0671': '\u0627',  # أ إ آ ٱ -> ا
+    '\u0649': '\u064a', '\u06cc': '\u064a', '\u0626': '\u064a',  # ى ی ئ -> ي
+    '\u0624': '\u0648',  # ؤ -> و
+    '\u0629': '\u0647',  # ة -> ه
+})
+_TOKEN = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Normalization applied both to indexed text and to queries."""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', text)
+    text = _ARABIC_MARKS.sub('', text)
+    return text.translate(_ARABIC_LETTERS).casefold()
+
+
+def build_match_query(query):
+    # كل كلمة تصبح "كلمة"* (بحث بالبادئة) والكلمات مربوطة بـ AND ضمنياً
+    tokens = _TOKEN.findall(normalize(query))
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+# ---------------- Index availability ----------------
+_available = {}
+
+
+def search_available(using=DEFAULT_DB_ALIAS):
+    if using not in _available:
+        connection = connections[using]
+        _available[using] = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _available[using]
+
+
+# ---------------- Querying ----------------
+def search_products(queryset, query):
+    """
+    Filter `queryset` to products matching `query` and annotate
+    `search_rank` (lower is better). Falls back to icontains where the
+    FTS5 table doesn't exist (non-SQLite databases).
+    """
+    if not query or not query.strip():
+        return queryset
+    match = build_match_query(query)
+    if not match:
+        return queryset
+    if not search_available(queryset.db):
+        return queryset.filter(
+            Q(name__icontains=query) | Q(description__icontains=query)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+    return queryset.filter(search_index__document__match=match).annotate(
+        search_rank=F('search_index__rank')
+    )
+
+
+# ---------------- Index maintenance ----------------
+def index_products(rows, using=DEFAULT_DB_ALIAS):
+    """rows: iterable of (id, name, description)."""
+    if not search_available(using):
+        return
+    rows = [(pk, normalize(name), normalize(description)) for pk, name, description in rows]
+    if not rows:
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)', rows
+        )
+
+
+def unindex_products(product_ids, using=DEFAULT_DB_ALIAS):
+    if not search_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+
+def rebuild_index(batch_size=5000, using=DEFAULT_DB_ALIAS):
+    if not search_available(using):
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+    total = 0
+    batch = []
+    rows = Product.objects.using(using).values_list('id', 'name', 'description')
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            index_products(batch, using)
+            total += len(batch)
+            batch = []
+    index_products(batch, using)
+    total += len(batch)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return total
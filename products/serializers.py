@@ -1,11 +1,64 @@
+from decimal import Decimal
+
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import Prefetch
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.functional import cached_property
 from rest_framework import serializers
+from .images import FORMATS, VARIANTS, variant_url
+from .inventory import OutOfStock, hold, set_on_hand
 from .models import Product, Cart, CartItem, Order, OrderItem
 
 # ---------------- Product Serializer ----------------
 class ProductSerializer(serializers.ModelSerializer):
+    images = serializers.SerializerMethodField()
+    # Product.stock غير قابل للتعديل في النماذج؛ هنا يُقبل ويصبح حركة في الدفتر عند التعديل
+    stock = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'description', 'price', 'stock', 'created_at', 'images']
+
+    def get_images(self, obj):
+        return product_images(obj)
+
+    def update(self, instance, validated_data):
+        # تعديل المخزون حركة تسوية في الدفتر، لا كتابة مباشرة على Product.stock
+        stock = validated_data.pop('stock', None)
+        with transaction.atomic():
+            # الحقول المرسلة فقط: stock وimage_variants القديمة في instance لا تُكتب
+            for name, value in validated_data.items():
+                setattr(instance, name, value)
+            instance.save(update_fields=[*validated_data, 'updated_at'])
+            if stock is not None:
+                set_on_hand({instance.pk: stock}, reference='api')
+                instance.refresh_from_db(fields=['stock'])
+        return instance
+
+
+def product_images(obj):
+    if not obj.image:
+        return None
+    images = {'original': obj.image.url}
+    for variant in VARIANTS:
+        urls = {fmt: variant_url(obj, variant, fmt) for fmt in FORMATS}
+        if any(urls.values()):
+            images[variant] = urls
+    return images
+
+
+# ---------------- Product Import Serializer ----------------
+class ProductImportSerializer(serializers.ModelSerializer):
+    # بدون UniqueValidator: الـ SKU الموجود يعني تحديث المنتج لا خطأ
+    sku = serializers.CharField(max_length=64)
+    # بلا default: صف بلا عمود مخزون لا يغيّر مخزون المنتج الموجود
+    stock = serializers.IntegerField(min_value=0, required=False)
+
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'stock', 'created_at']
+        fields = ['sku', 'name', 'description', 'price', 'stock']
 
 
 # ---------------- Cart Item Serializer ----------------
@@ -32,7 +85,48 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'items', 'total']
 
     def get_total(self, obj):
-        return sum(item.product.price * item.quantity for item in obj.items.all())
+        return obj.total_price()
+
+
+# ---------------- Cart Batch Serializer ----------------
+class CartLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0)
+    mode = serializers.ChoiceField(choices=['set', 'add'], default='set')
+
+    def validate(self, attrs):
+        if attrs['mode'] == 'add' and attrs['quantity'] < 1:
+            raise serializers.ValidationError("الكمية المضافة يجب أن تكون 1 على الأقل.")
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    items = CartLineSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        ids = [line['product'] for line in items]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("لا يمكن تكرار نفس المنتج في الطلب.")
+        missing = set(ids) - set(Product.objects.filter(id__in=ids).values_list('id', flat=True))
+        if missing:
+            raise serializers.ValidationError(f"منتجات غير موجودة: {sorted(missing)}")
+        return items
+
+    def save(self, cart):
+        lines = self.validated_data['items']
+        with transaction.atomic():
+            CartItem.objects.set_quantities(
+                cart, {line['product']: line['quantity'] for line in lines if line['mode'] == 'set'}
+            )
+            CartItem.objects.add_quantities(
+                cart, {line['product']: line['quantity'] for line in lines if line['mode'] == 'add'}
+            )
+            try:
+                hold(cart.id, [line['product'] for line in lines])
+            except OutOfStock as e:
+                # ValidationError يُرجع 400 ويلغي المعاملة كلها: السلة كما كانت
+                raise serializers.ValidationError({'items': [f"الكمية المتوفرة غير كافية: {e}"]})
+        return cart
 
 
 # ---------------- Order Item Serializer ----------------
@@ -41,12 +135,13 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = OrderItem
-        fields = ['id', 'product', 'quantity', 'total_price']
+        fields = ['id', 'product', 'quantity', 'unit_price', 'total_price']
+        read_only_fields = ['unit_price']
 
     total_price = serializers.SerializerMethodField()
 
     def get_total_price(self, obj):
-        return obj.product.price * obj.quantity
+        return obj.total_price()
 
 
 # ---------------- Order Serializer ----------------
@@ -59,4 +154,355 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'created_at', 'items', 'total']
 
     def get_total(self, obj):
-        return sum(item.product.price * item.quantity for item in obj.items.all())
\ No newline at end of file
+        return obj.total_price()
+
+
+# ---------------- Fast read-only serializers ----------------
+# نفس مخرجات الـ serializers أعلاه بايت ببايت، لكن بقاموس مكتوب مباشرة بدل
+# to_representation() لكل حقل: للقراءة فقط (القوائم الكبيرة)، والكتابة تبقى على DRF
+CENTS = Decimal('0.01')
+
+
+def _money(value):
+    # DecimalField(decimal_places=2) في DRF: نص بخانتين
+    return f'{value.quantize(CENTS):f}'
+
+
+def _number(value):
+    # SerializerMethodField يعيد Decimal، ومُرمِّز DRF يحوّله إلى float
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def _datetime(value):
+    # DateTimeField في DRF: بالتوقيت الحالي، و+00:00 تصبح Z
+    if value is None:
+        return None
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+_IMAGES = {}
+_IMAGES_MAX = 10_000
+
+
+@receiver(setting_changed)
+def _clear_images(setting, **kwargs):
+    if setting in ('MEDIA_URL', 'STORAGES'):
+        _IMAGES.clear()
+
+
+def _images(obj):
+    # روابط الصور (storage.url لكل نسخة) أغلى من باقي المنتج؛ تتحدد باسم الصورة وبصمة محتواها
+    if not obj.image:
+        return None
+    key = (obj.image.name, (obj.image_variants or {}).get('hash'))
+    images = _IMAGES.get(key)
+    if images is None:
+        if len(_IMAGES) >= _IMAGES_MAX:
+            _IMAGES.clear()
+        images = _IMAGES[key] = product_images(obj)
+    return images
+
+
+def _product(obj):
+    return {
+        'id': obj.id,
+        'name': obj.name,
+        'description': obj.description,
+        'price': _money(obj.price),
+        'stock': obj.stock,
+        'created_at': _datetime(obj.created_at),
+        'images': _images(obj),
+    }
+
+
+def _cart_item(obj):
+    product = obj.product
+    return {
+        'id': obj.id,
+        'product': _product(product),
+        'quantity': obj.quantity,
+        'total_price': _number(product.price * obj.quantity),
+    }
+
+
+def _order_item(obj):
+    return {
+        'id': obj.id,
+        'product': _product(obj.product),
+        'quantity': obj.quantity,
+        'unit_price': _money(obj.unit_price),
+        'total_price': _number(obj.total_price()),
+    }
+
+
+def _cart(obj):
+    return {
+        'id': obj.id,
+        'user': obj.user_id,
+        'items': [_cart_item(item) for item in obj.items.all()],
+        'total': _number(obj.total_price()),
+    }
+
+
+def _order(obj):
+    return {
+        'id': obj.id,
+        'user': obj.user_id,
+        'created_at': _datetime(obj.created_at),
+        'items': [_order_item(item) for item in obj.items.all()],
+        'total': _number(obj.total_price()),
+    }
+
+
+class FastSerializer:
+    """
+    Read-only stand-in for a DRF serializer: same constructor and `.data`,
+    but `.data` comes from one function that builds the final dict with
+    plain attribute access, already in JSON types.
+    """
+    represent = None
+
+    def __init__(self, instance=None, many=False, **kwargs):
+        self.instance = instance
+        self.many = many
+
+    @property
+    def data(self):
+        represent = self.represent
+        if self.many:
+            return [represent(obj) for obj in self.instance]
+        return represent(self.instance)
+
+
+class FastProductSerializer(FastSerializer):
+    represent = staticmethod(_product)
+
+
+class FastCartItemSerializer(FastSerializer):
+    represent = staticmethod(_cart_item)
+
+
+class FastCartSerializer(FastSerializer):
+    represent = staticmethod(_cart)
+
+
+class FastOrderItemSerializer(FastSerializer):
+    represent = staticmethod(_order_item)
+
+
+class FastOrderSerializer(FastSerializer):
+    represent = staticmethod(_order)
+
+
+FAST_SERIALIZERS = {
+    ProductSerializer: FastProductSerializer,
+    CartItemSerializer: FastCartItemSerializer,
+    CartSerializer: FastCartSerializer,
+    OrderItemSerializer: FastOrderItemSerializer,
+    OrderSerializer: FastOrderSerializer,
+}
+
+
+def read_serializer_class(serializer_class, fast=True):
+    """The fast twin of `serializer_class` for responses, if it has one and `fast` is on."""
+    return FAST_SERIALIZERS.get(serializer_class, serializer_class) if fast else serializer_class
+
+
+# ---------------- Sparse fieldsets (?fields= / ?expand=) ----------------
+# ?fields=id,total,items.quantity يختار الحقول (والمسار المنقّط حقول علاقة متداخلة)،
+# و?expand=items,items.product يعرض العلاقة كاملة بدل رقمها. بدون المعاملين: الرد الكامل كما هو.
+class Column:
+    """A plain field: the columns it reads (`a__b` joins `a`) and how it's rendered."""
+
+    def __init__(self, get, columns=(), prepare=None):
+        self.get = get
+        self.columns = columns
+        self.prepare = prepare  # تجهيز الـ queryset (annotate) عندما يُطلب الحقل
+
+
+class Relation:
+    """A foreign key (rendered as its id) or reverse FK (list of ids) unless expanded."""
+
+    def __init__(self, resource, many=False):
+        self.resource = resource
+        self.many = many
+
+
+class Resource:
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+
+
+PRODUCT = Resource(Product, {
+    'id': Column(lambda obj: obj.id),
+    'name': Column(lambda obj: obj.name, ['name']),
+    'description': Column(lambda obj: obj.description, ['description']),
+    'price': Column(lambda obj: _money(obj.price), ['price']),
+    'stock': Column(lambda obj: obj.stock, ['stock']),
+    'created_at': Column(lambda obj: _datetime(obj.created_at), ['created_at']),
+    'images': Column(_images, ['image', 'image_variants']),
+})
+CART_ITEM = Resource(CartItem, {
+    'id': Column(lambda obj: obj.id),
+    'product': Relation(PRODUCT),
+    'quantity': Column(lambda obj: obj.quantity, ['quantity']),
+    'total_price': Column(lambda obj: _number(obj.product.price * obj.quantity), ['quantity', 'product__price']),
+})
+CART = Resource(Cart, {
+    'id': Column(lambda obj: obj.id),
+    'user': Column(lambda obj: obj.user_id, ['user']),
+    'items': Relation(CART_ITEM, many=True),
+    'total': Column(lambda obj: _number(obj.total_price()), prepare=lambda queryset: queryset.with_total()),
+})
+ORDER_ITEM = Resource(OrderItem, {
+    'id': Column(lambda obj: obj.id),
+    'product': Relation(PRODUCT),
+    'quantity': Column(lambda obj: obj.quantity, ['quantity']),
+    'unit_price': Column(lambda obj: _money(obj.unit_price), ['unit_price']),
+    'total_price': Column(lambda obj: _number(obj.total_price()), ['quantity', 'unit_price']),
+})
+ORDER = Resource(Order, {
+    'id': Column(lambda obj: obj.id),
+    'user': Column(lambda obj: obj.user_id, ['user']),
+    'created_at': Column(lambda obj: _datetime(obj.created_at), ['created_at']),
+    'items': Relation(ORDER_ITEM, many=True),
+    'total': Column(lambda obj: _number(obj.total_price()), ['total']),
+})
+RESOURCES = {
+    ProductSerializer: PRODUCT,
+    CartItemSerializer: CART_ITEM,
+    CartSerializer: CART,
+    OrderItemSerializer: ORDER_ITEM,
+    OrderSerializer: ORDER,
+}
+
+
+def _split(value):
+    if value is None:
+        return None
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+class Fieldset:
+    """
+    The requested shape of one resource. apply() narrows a queryset to it:
+    only() the columns the chosen fields read, select_related()/Prefetch
+    only for relations that are expanded (a collapsed FK costs nothing, a
+    collapsed reverse FK one `id` query). represent() renders a row.
+    """
+
+    def __init__(self, resource, names=None):
+        self.resource = resource
+        self.names = names  # None: كل الحقول
+        self.expanded = {}
+
+    @classmethod
+    def from_params(cls, resource, params):
+        """None when the request asks for neither ?fields= nor ?expand=."""
+        fields, expand = _split(params.get('fields')), _split(params.get('expand'))
+        if fields is None and expand is None:
+            return None
+        root = cls(resource, names=None if fields is None else set())
+        for path in expand or ():
+            root._walk(path.split('.'), 'expand', select=False)
+        for path in fields or ():
+            *relations, name = path.split('.')
+            node = root._walk(relations, 'fields', select=True)
+            if name not in node.resource.fields:
+                raise serializers.ValidationError({'fields': [f"حقل غير معروف: {path}"]})
+            node._select(name)
+        return root
+
+    def _select(self, name):
+        if self.names is None:
+            self.names = set()
+        self.names.add(name)
+
+    def _walk(self, relations, param, select):
+        node = self
+        for i, name in enumerate(relations):
+            field = node.resource.fields.get(name)
+            if not isinstance(field, Relation):
+                path = '.'.join(relations[:i + 1])
+                raise serializers.ValidationError({param: [f"ليست علاقة قابلة للتوسيع: {path}"]})
+            if select and node.names is not None:
+                node._select(name)
+            node = node.expanded.setdefault(name, Fieldset(field.resource))
+        return node
+
+    @cached_property
+    def selected(self):
+        return [
+            (name, field) for name, field in self.resource.fields.items()
+            if self.names is None or name in self.names
+        ]
+
+    # ---------------- Query ----------------
+    def plan(self, prefix=''):
+        """(only() paths, select_related() paths, Prefetch objects) for this shape."""
+        columns, joins, prefetches = [prefix + 'id'], [], []
+        for name, field in self.selected:
+            if isinstance(field, Column):
+                for column in field.columns:
+                    if '__' in column:
+                        relation = column.split('__')[0]
+                        columns.append(prefix + relation)
+                        joins.append(prefix + relation)
+                    columns.append(prefix + column)
+            elif field.many:
+                child = self.expanded.get(name) or Fieldset(field.resource, names=set())
+                back = self.resource.model._meta.get_field(name).field.name
+                queryset = child.apply(field.resource.model.objects.order_by('id'), also=[back])
+                prefetches.append(Prefetch(prefix + name, queryset=queryset))
+            else:
+                columns.append(prefix + name)
+                if name in self.expanded:
+                    joins.append(prefix + name)
+                    sub_columns, sub_joins, sub_prefetches = self.expanded[name].plan(f'{prefix}{name}__')
+                    columns += sub_columns
+                    joins += sub_joins
+                    prefetches += sub_prefetches
+        return columns, joins, prefetches
+
+    def apply(self, queryset, also=()):
+        columns, joins, prefetches = self.plan()
+        queryset = queryset.select_related(None).prefetch_related(None).only(*dict.fromkeys([*columns, *also]))
+        if joins:
+            queryset = queryset.select_related(*dict.fromkeys(joins))
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        for name, field in self.selected:
+            if isinstance(field, Column) and field.prepare:
+                queryset = field.prepare(queryset)
+        return queryset
+
+    # ---------------- Rendering ----------------
+    def represent(self, obj):
+        data = {}
+        for name, field in self.selected:
+            if isinstance(field, Column):
+                data[name] = field.get(obj)
+            elif field.many:
+                child = self.expanded.get(name)
+                rows = getattr(obj, name).all()
+                data[name] = [child.represent(row) if child else row.pk for row in rows]
+            elif name in self.expanded:
+                data[name] = self.expanded[name].represent(getattr(obj, name))
+            else:
+                data[name] = getattr(obj, f'{name}_id')
+        return data
+
+    def serializer(self, instance=None, many=False, **kwargs):
+        serializer = FastSerializer(instance, many=many)
+        serializer.represent = self.represent
+        return serializer
+
+
+def fieldset_for(serializer_class, params):
+    """The Fieldset asked for in `params` for `serializer_class`'s resource, or None."""
+    resource = RESOURCES.get(serializer_class)
+    return resource and Fieldset.from_params(resource, params)
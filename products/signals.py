@@ -0,0 +1,77 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .analytics import record_order
+from .auth import forget_user
+from .cache import invalidate_products
+from .images import needs_variants, schedule_variants
+from .inventory import forget
+from .jobs import enqueue_on_commit
+from .models import Order, Product, StockMovement
+from .search import index_products, unindex_products
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    # بعد نجاح المعاملة فقط، حتى لا يُعاد ملء الكاش ببيانات لم تُحفظ بعد
+    product_id = instance.pk
+    transaction.on_commit(lambda: invalidate_products([product_id]))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, using, **kwargs):
+    index_products([(instance.pk, instance.name, instance.description)], using)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using, **kwargs):
+    unindex_products([instance.pk], using)
+
+
+@receiver(post_save, sender=Product)
+def generate_image_variants(sender, instance, **kwargs):
+    if needs_variants(instance):
+        schedule_variants(instance.pk)
+    elif not instance.image and instance.image_variants:
+        Product.objects.filter(pk=instance.pk).update(image_variants={})
+
+
+@receiver(post_save, sender=Product)
+def open_stock_ledger(sender, instance, created, **kwargs):
+    if not created:
+        return
+    # رقم منتج محذوف قد يعود (SQLite)؛ عدّاد قديم بنفس المفتاح لا يخص المنتج الجديد
+    forget(instance.pk)
+    # منتج جديد بمخزون: أول حركة في الدفتر، فمجموع الحركات يساوي المخزون دائماً
+    if instance.stock:
+        StockMovement.objects.create(product=instance, delta=instance.stock, kind=StockMovement.OPENING, posted=True)
+
+
+@receiver(post_delete, sender=Product)
+def forget_available_counter(sender, instance, **kwargs):
+    forget(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def sync_product_to_erp(sender, instance, **kwargs):
+    # المفتاح يتضمن وقت التعديل: حفظ مكرر لنفس النسخة لا يضيف مهمة ثانية
+    enqueue_on_commit(
+        'erp_inventory_sync', {'product_ids': [instance.pk]},
+        key=f'erp-sync:product:{instance.pk}:{instance.updated_at.isoformat()}',
+    )
+
+
+@receiver(pre_delete, sender=Order)
+def remove_order_from_rollups(sender, instance, **kwargs):
+    # قبل الحذف حتى تبقى الأسطر موجودة لنطرحها من الملخصات اليومية
+    record_order(instance, list(instance.items.all()), sign=-1)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    # صلاحيات أو كلمة مرور تغيّرت: الطلب التالي يقرأ المستخدم من قاعدة البيانات
+    forget_user(instance.pk)
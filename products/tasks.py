@@ -0,0 +1,54 @@
+"""
+Side effects of checkout and product changes, run by `manage.py run_jobs`.
+Every handler may run more than once (retries, a worker dying mid-job),
+so each one reads current state instead of trusting the payload.
+"""
+import json
+import logging
+import urllib.request
+
+from django.conf import settings
+from django.core.mail import send_mail
+
+from .inventory import post_movements
+from .jobs import task
+from .models import Order, Product
+
+logger = logging.getLogger(__name__)
+
+
+@task('order_confirmation')
+def send_order_confirmation(order_id):
+    order = Order.objects.select_related('user').filter(pk=order_id).first()
+    if order is None or order.user is None or not order.user.email:
+        return
+    lines = [
+        f"{item.product.name} × {item.quantity} = {item.total_price()}"
+        for item in order.items.select_related('product')
+    ]
+    send_mail(
+        subject=f"تأكيد الطلب رقم {order.id}",
+        message="\n".join([f"مرحباً {order.customer_name}،", "تم استلام طلبك:", *lines, f"المجموع: {order.total}"]),
+        from_email=None,
+        recipient_list=[order.user.email],
+    )
+
+
+@task('erp_inventory_sync')
+def sync_inventory_to_erp(product_ids):
+    # نرسل المخزون الحالي لا الفرق: تكرار المهمة أو تأخرها لا يفسد الأرقام عند الـ ERP
+    # ومبيعات لم تُرحَّل بعد تُرحَّل أولاً حتى يطابق الرقم المُرسل الدفتر
+    post_movements(product_ids)
+    rows = list(Product.objects.filter(id__in=product_ids).values('id', 'sku', 'stock'))
+    if not settings.ERP_INVENTORY_URL:
+        logger.info("ERP_INVENTORY_URL not set; skipping inventory sync of %s products", len(rows))
+        return
+    request = urllib.request.Request(
+        settings.ERP_INVENTORY_URL,
+        data=json.dumps({'products': rows}).encode(),
+        headers={'Content-Type': 'application/json'},
+        method='POST',
+    )
+    # أي خطأ شبكة أو رد غير 2xx يرفع استثناء، فتُعاد المحاولة لاحقاً
+    with urllib.request.urlopen(request, timeout=settings.ERP_TIMEOUT) as response:
+        response.read()
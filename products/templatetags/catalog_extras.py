@@ -0,0 +1,25 @@
+from django import template
+
+from products.images import variant_srcset, variant_url
+
+register = template.Library()
+
+@register.simple_tag(takes_context=True)
+def url_replace(context, **kwargs):
+    query = context['request'].GET.copy()
+    for key, value in kwargs.items():
+        if value in (None, ''):
+            query.pop(key, None)
+        else:
+            query[key] = value
+    return query.urlencode()
+
+
+@register.simple_tag
+def srcset(product, fmt='jpeg'):
+    return variant_srcset(product, fmt)
+
+
+@register.simple_tag
+def image_variant(product, variant, fmt='jpeg'):
+    return variant_url(product, variant, fmt) or (product.image.url if product.image else '')
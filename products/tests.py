@@ -1,3 +1,1731 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count, Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from clean_shop.database import sqlite_database
+
+from .analytics import rebuild_rollups, sales_report
+from .benchmarks import find_regressions, seed_orders, seed_products, seed_users
+from .cache import catalog_cache, cache_stats, reset_cache_stats, product_card_keys
+from .checkout import place_order, OutOfStock
+from .metrics import QueryBudgetExceeded, registry
+from .middleware import ReplicaPinningMiddleware
+from .routers import routing_scope
+from .filters import filter_products, product_facets
+from .inventory import _available_in_db, _bump, adjust, available, counter_key, hold, on_hand, post_movements, release_expired
+from .jobs import claim, enqueue, run_job, task
+from .pagination import EstimatedCountPaginator, KeysetPaginator, ProductCursorPagination, encode_cursor
+from .models import (
+    Product, Cart, CartItem, Order, OrderItem, DailySales, DailyProductSales, Job,
+    InventoryShard, StockMovement, StockReservation,
+)
+from .renderers import FastJSONRenderer
+from .search import normalize, search_products
+from .serializers import (
+    CartItemSerializer, CartSerializer, OrderItemSerializer, OrderSerializer, ProductSerializer, read_serializer_class,
+)
+from .views import ProductListCreateAPI
+
+
+# ---------------- Query counts ----------------
+class QueryCountTests(TestCase):
+    """عدد الاستعلامات يجب أن يبقى ثابتاً مهما زاد حجم السلة أو عدد الطلبات."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='pass')
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'منتج {i}', price=Decimal('2.50') + i, stock=100)
+            for i in range(20)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def fill_cart(self, size):
+        cart, created = Cart.objects.get_or_create(user=self.user)
+        CartItem.objects.filter(cart=cart).delete()
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=2)
+            for product in self.products[:size]
+        ])
+
+    def place_orders(self, count, lines):
+        for i in range(count):
+            order = Order.objects.create(
+                user=self.user, customer_name='عميل', phone='0599', address='رام الله'
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=1, unit_price=product.price)
+                for product in self.products[:lines]
+            ])
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def assertConstantQueries(self, url, grow):
+        grow(1)
+        self.count_queries(url)  # يملأ كاش الجلسة والمستخدم
+        small = self.count_queries(url)
+        grow(15)
+        large = self.count_queries(url)
+        self.assertEqual(small, large)
+        return large
+
+    def test_cart_page(self):
+        queries = self.assertConstantQueries(reverse('view_cart'), self.fill_cart)
+        self.assertLessEqual(queries, 5)
+
+    def test_checkout_page(self):
+        queries = self.assertConstantQueries(reverse('checkout'), self.fill_cart)
+        self.assertLessEqual(queries, 5)
+
+    def test_cart_api(self):
+        queries = self.assertConstantQueries(reverse('api_cart'), self.fill_cart)
+        self.assertLessEqual(queries, 5)
+
+    def test_my_orders_page(self):
+        queries = self.assertConstantQueries(
+            reverse('my_orders'), lambda n: self.place_orders(n, n)
+        )
+        self.assertLessEqual(queries, 5)
+
+    def test_orders_api(self):
+        queries = self.assertConstantQueries(
+            reverse('api_orders'), lambda n: self.place_orders(n, n)
+        )
+        self.assertLessEqual(queries, 5)
+
+
+# ---------------- Totals ----------------
+class TotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='pass')
+        cls.pen = Product.objects.create(name='قلم', price=Decimal('1.25'), stock=10)
+        cls.book = Product.objects.create(name='كتاب', price=Decimal('10.00'), stock=10)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.pen, quantity=4)
+        CartItem.objects.create(cart=cart, product=self.book, quantity=1)
+        self.cart = cart
+
+    def test_cart_total_is_one_aggregate(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.cart.total_price(), Decimal('15.00'))
+        annotated = Cart.objects.with_total().get(pk=self.cart.pk)
+        self.assertEqual(annotated.total_price(), Decimal('15.00'))
+
+    def test_checkout_snapshots_prices(self):
+        self.client.post(reverse('checkout'), {
+            'customer_name': 'عميل', 'phone': '0599', 'address': 'نابلس',
+        })
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(order.total, Decimal('15.00'))
+
+        Product.objects.filter(pk=self.book.pk).update(price=Decimal('99.00'))
+        order = Order.objects.with_items().get(pk=order.pk)
+        self.assertEqual(order.total_price(), Decimal('15.00'))
+        self.assertEqual(sum(item.total_price() for item in order.items.all()), Decimal('15.00'))
+        self.assertEqual(Order.objects.revenue(), Decimal('15.00'))
+
+
+# ---------------- Cart writes ----------------
+class CartWriteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='pass')
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'منتج {i}', price=Decimal('5.00'), stock=10) for i in range(4)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post_batch(self, items):
+        # جلسة حقيقية (force_login) لا force_authenticate: نفس مسار المصادقة في المتصفح
+        return self.client.post(reverse('api_cart_batch'), {'items': items}, content_type='application/json')
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity'))
+
+    def test_add_to_cart_increments(self):
+        url = reverse('add_to_cart', args=[self.products[0].id])
+        for _ in range(3):
+            self.client.get(url)
+        self.assertEqual(self.quantities(), {self.products[0].id: 3})
+
+    def test_remove_from_other_users_cart_is_404(self):
+        other = User.objects.create_user(username='other', password='pass')
+        cart = Cart.objects.create(user=other)
+        item = CartItem.objects.create(cart=cart, product=self.products[0])
+        response = self.client.get(reverse('remove_from_cart', args=[item.id]))
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(CartItem.objects.filter(pk=item.pk).exists())
+
+    def test_batch_update(self):
+        a, b, c, d = self.products
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=a, quantity=2)
+        CartItem.objects.create(cart=cart, product=b, quantity=1)
+
+        response = self.post_batch([
+            {'product': a.id, 'quantity': 3, 'mode': 'add'},
+            {'product': b.id, 'quantity': 0},
+            {'product': c.id, 'quantity': 7},
+            {'product': d.id, 'quantity': 1, 'mode': 'add'},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {a.id: 5, c.id: 7, d.id: 1})
+        self.assertEqual(Decimal(str(response.json()['total'])), Decimal('65.00'))
+
+    def test_batch_rejects_unknown_products(self):
+        response = self.post_batch([{'product': 999999, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {})
+        self.client.logout()
+        self.assertEqual(self.post_batch([{'product': self.products[0].id, 'quantity': 1}]).status_code, 403)
+
+    def test_one_cart_per_user(self):
+        cart = Cart.objects.create(user=self.user)
+        with transaction.atomic(), self.assertRaises(IntegrityError):
+            Cart.objects.create(user=self.user)
+        self.client.get(reverse('add_to_cart', args=[self.products[0].id]))
+        self.assertEqual(list(Cart.objects.filter(user=self.user)), [cart])
+
+
+class CartMigrationTests(TransactionTestCase):
+    before = [('products', '0023_product_stock_not_editable')]
+    after = [('products', '0024_cart_user_unique')]
+
+    def test_duplicate_carts_are_merged(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        old = executor.loader.project_state(self.before).apps
+        user = old.get_model('auth', 'User').objects.create(username='buyer')
+        pen, book = old.get_model('products', 'Product').objects.bulk_create([
+            old.get_model('products', 'Product')(name=name, price=Decimal('5.00')) for name in ('pen', 'book')
+        ])
+        OldCart, OldItem = old.get_model('products', 'Cart'), old.get_model('products', 'CartItem')
+        first, second = OldCart.objects.create(user=user), OldCart.objects.create(user=user)
+        OldItem.objects.create(cart=first, product=pen, quantity=2)
+        OldItem.objects.create(cart=second, product=pen, quantity=1)
+        OldItem.objects.create(cart=second, product=book, quantity=3)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+
+        cart = Cart.objects.get(user_id=user.pk)
+        self.assertEqual(cart.pk, first.pk)
+        self.assertEqual(dict(cart.items.values_list('product_id', 'quantity')), {pen.pk: 3, book.pk: 3})
+
+
+# ---------------- Checkout ----------------
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='pass')
+        cls.pen = Product.objects.create(name='قلم', price=Decimal('1.00'), stock=5)
+        cls.book = Product.objects.create(name='كتاب', price=Decimal('10.00'), stock=1)
+
+    def setUp(self):
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.pen, quantity=3)
+        CartItem.objects.create(cart=self.cart, product=self.book, quantity=2)
+
+    def new_order(self):
+        return Order(user=self.user, customer_name='عميل', phone='0599', address='الخليل')
+
+    def test_short_stock_writes_nothing(self):
+        with self.assertRaises(OutOfStock) as ctx:
+            place_order(self.new_order(), self.cart)
+        self.assertEqual([p.id for p in ctx.exception.products], [self.book.id])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2)
+        self.pen.refresh_from_db()
+        self.assertEqual(self.pen.stock, 5)
+
+    def test_checkout_decrements_stock(self):
+        CartItem.objects.filter(product=self.book).update(quantity=1)
+        # المبيعات تُرحَّل إلى Product.stock بعد الالتزام
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order(self.new_order(), self.cart)
+        self.assertEqual(order.total, Decimal('13.00'))
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(self.cart.items.count(), 0)
+        self.assertEqual(
+            dict(Product.objects.values_list('name', 'stock')), {'قلم': 2, 'كتاب': 0}
+        )
+
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+    """عدة مستخدمين يشترون آخر القطع من نفس المنتج في نفس الوقت."""
+
+    buyers = 12
+    units = 5
+
+    def test_last_units_are_not_oversold(self):
+        product = Product.objects.create(name='عرض', price=Decimal('3.00'), stock=self.units)
+        users = User.objects.bulk_create([User(username=f'buyer{i}') for i in range(self.buyers)])
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1) for cart in carts])
+
+        results = []
+        barrier = threading.Barrier(self.buyers)
+
+        def buy(cart):
+            barrier.wait()
+            try:
+                for attempt in range(50):
+                    try:
+                        order = Order(user_id=cart.user_id, customer_name='عميل', phone='0599', address='جنين')
+                        place_order(order, cart)
+                        results.append('ok')
+                        return
+                    except OperationalError:
+                        # SQLite يرفض الكتابة المتزامنة بدل الانتظار، نعيد المحاولة
+                        time.sleep(0.005 * (attempt + 1))
+                    except OutOfStock:
+                        results.append('out')
+                        return
+                results.append('locked')
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=buy, args=(cart,)) for cart in carts]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        post_movements()  # ما لم يُرحَّل بعد الالتزام (قاعدة مقفلة) يرحّله الـ reaper
+        product.refresh_from_db()
+        self.assertEqual(product.stock + results.count('ok'), self.units)
+        self.assertGreaterEqual(product.stock, 0)
+        self.assertEqual(Order.objects.count(), results.count('ok'))
+        self.assertEqual(OrderItem.objects.count(), results.count('ok'))
+        self.assertEqual(results.count('ok'), self.units)
+
+
+# ---------------- Catalog cache ----------------
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='مصباح', price=Decimal('7.00'), stock=3)
+
+    def setUp(self):
+        catalog_cache().clear()
+        reset_cache_stats()
+
+    def test_runner_keeps_caches_in_process(self):
+        # ShopTestRunner يبدّل كاشات الملفات بـ LocMem: لا شيء يبقى في CACHE_DIR بين التشغيلات
+        for alias in ('catalog', 'sessions', 'inventory'):
+            self.assertIsInstance(caches[alias], LocMemCache)
+        self.assertTrue(settings.QUERY_BUDGET_RAISE)
+
+    def test_list_is_served_from_cache_until_product_changes(self):
+        url = reverse('api_products')
+        self.client.get(url)
+        # استعلام واحد فقط لحساب ETag، والصفحة نفسها من الكاش
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.json()['results'][0]['name'], 'مصباح')
+        # العدادات لكل worker: الرد يذكر أي عملية عدّت
+        self.assertEqual((cache_stats()['hits'], cache_stats()['pid']), (1, os.getpid()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'مصباح مكتب'
+            self.product.save()
+        response = self.client.get(url)
+        self.assertEqual(response.json()['results'][0]['name'], 'مصباح مكتب')
+
+    def test_detail_invalidated_by_checkout_stock_change(self):
+        url = reverse('api_product_detail', args=[self.product.id])
+        self.assertEqual(self.client.get(url).json()['stock'], 3)
+
+        user = User.objects.create_user(username='buyer', password='pass')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(Order(user=user, customer_name='عميل', phone='0599', address='طولكرم'), cart)
+        self.assertEqual(self.client.get(url).json()['stock'], 1)
+
+    def test_card_fragment_invalidated_on_delete(self):
+        anonymous_card = product_card_keys(self.product.id)[1]
+        self.client.get(reverse('home_page'))
+        self.assertIsNotNone(catalog_cache().get(anonymous_card))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertIsNone(catalog_cache().get(anonymous_card))
+
+
+# ---------------- Conditional GET ----------------
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='كوب', price=Decimal('4.00'), stock=8)
+
+    def setUp(self):
+        catalog_cache().clear()
+
+    def test_list_etag_round_trip(self):
+        url = reverse('api_products')
+        response = self.client.get(url)
+        etag = response.headers['ETag']
+        self.assertIn('Last-Modified', response.headers)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Product.objects.create(name='صحن', price=Decimal('6.00'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_if_modified_since(self):
+        url = reverse('api_product_detail', args=[self.product.id])
+        last_modified = self.client.get(url).headers['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_order_etag_follows_its_products(self):
+        user = User.objects.create_user(username='etag')
+        order = Order.objects.create(user=user, customer_name='عميل', phone='0599', address='جنين')
+        OrderItem.objects.create(order=order, product=self.product, quantity=1, unit_price=self.product.price)
+        url = reverse('api_order_detail', args=[order.pk])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(user)
+        etag = self.client.get(url).headers['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Product.objects.filter(pk=self.product.pk).update(name='كوب كبير', updated_at=timezone.now() + timedelta(seconds=5))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'][0]['product']['name'], 'كوب كبير')
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_detail_missing_is_404(self):
+        url = reverse('api_product_detail', args=[999999])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+# ---------------- Search ----------------
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lamp = Product.objects.create(name='مصباح مكتب', price=Decimal('20.00'), description='إضاءة قوية')
+        cls.hospital = Product.objects.create(name='سرير', price=Decimal('90.00'), description='أثاث مستشفى')
+        cls.cable = Product.objects.create(name='Charger cable', price=Decimal('5.00'))
+
+    def setUp(self):
+        catalog_cache().clear()
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('api_products'), {'q': q, **params})
+        return [row['id'] for row in response.json()['results']]
+
+    def test_normalizes_arabic(self):
+        self.assertEqual(normalize('أَحْمَدُ مستشفى مكتبةٌ'), 'احمد مستشفي مكتبه')
+        self.assertEqual(self.search('مُسْتَشْفي'), [self.hospital.id])
+        self.assertEqual(self.search('اضاءة'), [self.lamp.id])
+
+    def test_prefix_and_case(self):
+        self.assertEqual(self.search('CHARG'), [self.cable.id])
+        self.assertEqual(self.search('مصب مكت'), [self.lamp.id])
+
+    def test_index_follows_edits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cable.name = 'USB lamp'
+            self.cable.save()
+        self.assertEqual(self.search('lamp'), [self.cable.id])
+        self.assertEqual(self.search('charger'), [])
+
+    def test_name_ranks_above_description(self):
+        Product.objects.create(name='حامل', price=Decimal('3.00'), description='حامل مصباح')
+        self.assertEqual(self.search('مصباح')[0], self.lamp.id)
+
+    def test_home_page_search(self):
+        response = self.client.get(reverse('home_page'), {'q': 'سرير'})
+        self.assertEqual([p.id for p in response.context['products']], [self.hospital.id])
+        self.assertEqual(response.context['sort'], 'relevance')
+
+
+# ---------------- Filters & facets ----------------
+class FilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cheap = Product.objects.create(name='ممحاة', price=Decimal('2.00'), stock=0)
+        cls.mid = Product.objects.create(name='حقيبة', price=Decimal('45.00'), stock=3)
+        cls.pricey = Product.objects.create(name='ساعة', price=Decimal('750.00'), stock=1)
+        Product.objects.filter(pk=cls.cheap.pk).update(created_at=timezone.now() - timedelta(days=30))
+
+    def setUp(self):
+        catalog_cache().clear()
+
+    def ids(self, **params):
+        response = self.client.get(reverse('api_products'), params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(row['id'] for row in response.json()['results'])
+
+    def test_price_stock_and_date_filters(self):
+        self.assertEqual(self.ids(min_price='10', max_price='100'), [self.mid.id])
+        self.assertEqual(self.ids(in_stock='true'), [self.mid.id, self.pricey.id])
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        self.assertEqual(self.ids(created_after=since), [self.mid.id, self.pricey.id])
+
+    def test_sort_by_price(self):
+        response = self.client.get(reverse('api_products'), {'sort': '-price', 'in_stock': '1'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.pricey.id, self.mid.id])
+
+    def test_invalid_filter_is_400(self):
+        response = self.client.get(reverse('api_products'), {'min_price': '50', 'max_price': '10'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_facets_in_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            facets = product_facets(Product.objects.all(), {'in_stock': True})
+        self.assertEqual(len(ctx), 1)
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(facets['in_stock'], 2)
+        self.assertEqual([b['count'] for b in facets['price_ranges']], [0, 1, 0, 0, 1])
+
+        response = self.client.get(reverse('api_products'), {'facets': '1'})
+        self.assertEqual(response.json()['facets']['in_stock'], 2)
+
+    def test_in_stock_uses_partial_index(self):
+        queryset = filter_products(Product.objects.all(), {'in_stock': True}).order_by('price', 'id')
+        self.assertIn('product_instock_price_idx', queryset.explain())
+
+
+# ---------------- Keyset pagination ----------------
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # أسعار وتواريخ متساوية: الترتيب يُحسم بالـ id
+        prices = ['10', '5', '20', '5', '10', '5', '20']
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'منتج {i}', price=Decimal(price)) for i, price in enumerate(prices)
+        ])
+        base = timezone.now() - timedelta(days=1)
+        for i, product in enumerate(cls.products):
+            product.created_at = base + timedelta(minutes=i // 3)
+        Product.objects.bulk_update(cls.products, ['created_at'])
+
+    def setUp(self):
+        catalog_cache().clear()
+
+    def expected(self, sort):
+        keys = {
+            'newest': lambda p: (-p.created_at.timestamp(), -p.pk),
+            'price': lambda p: (p.price, p.pk),
+            '-price': lambda p: (-p.price, -p.pk),
+        }
+        return [p.pk for p in sorted(self.products, key=keys[sort])]
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [row['id'] for row in data['results']], data['next'], data['previous']
+
+    def test_walks_forward_and_back_for_each_sort(self):
+        for sort in ('newest', 'price', '-price'):
+            with self.subTest(sort=sort):
+                ids, next_url, previous_url = self.get(reverse('api_products'), {'sort': sort, 'page_size': 3})
+                self.assertIsNone(previous_url)
+                pages = [ids]
+                while next_url:
+                    ids, next_url, previous_url = self.get(next_url)
+                    pages.append(ids)
+                self.assertEqual([len(page) for page in pages], [3, 3, 1])
+                self.assertEqual(sum(pages, []), self.expected(sort))
+
+                back = [ids]
+                while previous_url:
+                    ids, next_url, previous_url = self.get(previous_url)
+                    back.append(ids)
+                self.assertEqual(back[::-1], pages)
+                # الصفحة الأولى من الخلف لها رابط تالٍ يعود إلى الثانية
+                self.assertEqual(self.get(next_url)[0], pages[1])
+
+    def test_paginator_pages(self):
+        paginator = KeysetPaginator(Product.objects.all(), 'price', 4)
+        first = paginator.page()
+        self.assertEqual([p.pk for p in first], self.expected('price')[:4])
+        self.assertTrue(first.has_next())
+        self.assertFalse(first.has_previous())
+        last = paginator.page(first.next_cursor)
+        self.assertEqual([p.pk for p in last], self.expected('price')[4:])
+        self.assertFalse(last.has_next())
+        self.assertEqual([p.pk for p in paginator.page(last.previous_cursor)], [p.pk for p in first])
+
+    def test_rejects_bad_cursors(self):
+        url = reverse('api_products')
+        next_url = self.get(url, {'sort': 'price', 'page_size': 2})[1]
+        price_cursor = parse_qs(urlsplit(next_url).query)['cursor'][0]
+        cursors = {
+            'not base64': '%%%',
+            'not json': encode_cursor('price', [])[:-4] + 'AAAA',
+            'bad value': encode_cursor('price', ['غالي', 1]),
+            'short key': encode_cursor('price', ['5.00']),
+            'not a list': encode_cursor('price', {'price': '5.00'}),
+        }
+        for reason, cursor in cursors.items():
+            with self.subTest(reason):
+                self.assertEqual(self.client.get(url, {'sort': 'price', 'cursor': cursor}).status_code, 404)
+        # مؤشر ترتيب آخر لا يصلح لهذا الترتيب
+        self.assertEqual(self.client.get(url, {'sort': 'price', 'cursor': price_cursor}).status_code, 200)
+        self.assertEqual(self.client.get(url, {'sort': 'newest', 'cursor': price_cursor}).status_code, 404)
+
+    def test_catalog_page_two_skips_the_facet_aggregate(self):
+        Product.objects.bulk_create([Product(name=f'إضافي {i}', price=Decimal('1.00') + i) for i in range(30)])
+        response = self.client.get(reverse('home_page'), {'sort': 'price'})
+        self.assertEqual(response.context['facets']['total'], 37)
+        cursor = response.context['page_obj'].next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home_page'), {'sort': 'price', 'cursor': cursor})
+        self.assertEqual(len(response.context['products']), 13)
+        # الأعداد من الكاش: استعلام الصفحة وحده (WHERE ... LIMIT)، بلا COUNT على الجدول
+        self.assertEqual(len(queries), 1, [q['sql'] for q in queries])
+        self.assertNotIn('COUNT(', queries[0]['sql'])
+        self.assertEqual(response.context['facets']['total'], 37)
+
+    def test_page_size_limits(self):
+        pagination = ProductCursorPagination()
+        sizes = {None: 24, 'abc': 24, '0': 1, '-5': 1, '7': 7, '1000': 100}
+        for value, size in sizes.items():
+            request = RequestFactory().get('/', {} if value is None else {'page_size': value})
+            self.assertEqual(pagination.get_page_size(request), size)
+        self.assertEqual(len(self.get(reverse('api_products'), {'page_size': 2})[0]), 2)
+        self.assertEqual(len(self.get(reverse('api_products'), {'page_size': 1000})[0]), len(self.products))
+
+
+# ---------------- Image variants ----------------
+def make_image(width=1600, height=900, fmt='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 80, 40)).save(buffer, fmt)
+    return SimpleUploadedFile(f'photo.{fmt.lower()}', buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        overrides = self.settings(MEDIA_ROOT=media, PRODUCT_IMAGE_ASYNC=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        catalog_cache().clear()
+
+    def create_product(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(name='لوحة', price=Decimal('30.00'), image=make_image(), **kwargs)
+
+    def test_variants_generated_on_save(self):
+        product = self.create_product()
+        product.refresh_from_db()
+        variants = product.image_variants
+        self.assertEqual(variants['source'], product.image.name)
+        self.assertEqual(variants['card']['webp']['width'], 480)
+        self.assertTrue(variants['thumb']['jpeg']['name'].startswith(f"product_images/variants/{variants['hash']}-"))
+
+        images = self.client.get(reverse('api_product_detail', args=[product.id])).json()['images']
+        self.assertTrue(images['detail']['webp'].endswith('-detail.webp'))
+        self.assertIn('original', images)
+
+        html = self.client.get(reverse('home_page')).content.decode()
+        self.assertIn('-card.jpeg', html)
+        self.assertIn('type="image/webp"', html)
+
+    def test_same_content_reuses_files(self):
+        first = self.create_product()
+        second = self.create_product()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertNotEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image_variants['card'], second.image_variants['card'])
+
+    def test_small_images_are_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='أيقونة', price=Decimal('1.00'), image=make_image(100, 100, 'JPEG'))
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants['detail']['jpeg']['width'], 100)
+
+
+# ---------------- Bulk import / export ----------------
+class BulkImportExportTests(TestCase):
+    csv_feed = (
+        'sku,name,description,price,stock\n'
+        'A-1,مصباح,ضوء,12.50,4\n'
+        'A-2,كابل,,3.00,0\n'
+        'A-3,بدون سعر,,,1\n'
+    )
+
+    def setUp(self):
+        catalog_cache().clear()
+
+    def write_feed(self, content, suffix):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with open(handle, 'w', encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_command_upserts_by_sku(self):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_products', self.write_feed(self.csv_feed, '.csv'), batch_size=2, stdout=out, stderr=err)
+        self.assertIn('سطر 4', err.getvalue())
+        self.assertEqual(dict(Product.objects.values_list('sku', 'stock')), {'A-1': 4, 'A-2': 0})
+
+        created_at = Product.objects.get(sku='A-1').created_at
+        jsonl = '{"sku": "A-1", "name": "مصباح مكتب", "price": "11.00", "stock": 9}\nnot json\n'
+        call_command('import_products', self.write_feed(jsonl, '.jsonl'), stdout=out, stderr=err)
+        lamp = Product.objects.get(sku='A-1')
+        self.assertEqual((lamp.name, lamp.price, lamp.stock), ('مصباح مكتب', Decimal('11.00'), 9))
+        self.assertEqual(lamp.created_at, created_at)
+        self.assertEqual(Product.objects.count(), 2)
+        # منتج جديد: رصيد افتتاحي؛ منتج موجود: تسوية بالفرق
+        self.assertEqual(
+            list(lamp.stock_movements.order_by('id').values_list('kind', 'delta', 'reference')),
+            [('opening', 4, 'import'), ('adjustment', 5, 'import')],
+        )
+        self.assertEqual(
+            [p.sku for p in search_products(Product.objects.all(), 'مكتب')], ['A-1']
+        )
+
+    def test_price_only_feed_keeps_stock(self):
+        product = Product.objects.create(sku='C-1', name='مقلاة', price=Decimal('20.00'), stock=25)
+        movements = list(StockMovement.objects.values_list('kind', 'delta'))
+        feed = 'sku,name,price\nC-1,مقلاة,18.00\nC-2,ملعقة,2.00\n'
+        call_command('import_products', self.write_feed(feed, '.csv'), stdout=io.StringIO(), stderr=io.StringIO())
+        product.refresh_from_db()
+        self.assertEqual((product.price, product.stock), (Decimal('18.00'), 25))
+        self.assertEqual(Product.objects.get(sku='C-2').stock, 0)
+        self.assertEqual(list(StockMovement.objects.values_list('kind', 'delta')), movements)
+
+    def test_export_command(self):
+        Product.objects.create(sku='B-1', name='كوب', price=Decimal('4.00'), stock=2)
+        out = io.StringIO()
+        call_command('export_products', format='jsonl', stdout=out)
+        row = json.loads(out.getvalue().splitlines()[0])
+        self.assertEqual((row['sku'], row['price'], row['stock']), ('B-1', '4.00', 2))
+
+    def test_import_and_export_api_are_staff_only(self):
+        staff = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        upload = SimpleUploadedFile('feed.csv', self.csv_feed.encode(), content_type='text/csv')
+
+        self.assertEqual(self.client.post(reverse('api_products_import'), {'file': upload}).status_code, 403)
+
+        api = APIClient()
+        api.force_authenticate(staff)
+        upload.seek(0)
+        response = api.post(reverse('api_products_import'), {'file': upload}, format='multipart')
+        self.assertEqual(response.data['imported'], 2)
+        self.assertEqual(response.data['failed'], 1)
+
+        self.client.force_login(staff)
+        response = self.client.get(reverse('api_products_export'), {'format': 'csv', 'in_stock': '1'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'sku', 'name'])
+        self.assertEqual(len(lines), 2)
+
+    def test_order_export_streams_lines_within_date_range(self):
+        staff = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        product = Product.objects.create(sku='C-1', name='دفتر', price=Decimal('5.00'), stock=5)
+        recent = Order.objects.create(user=staff, customer_name='سارة', phone='1', address='x', total=Decimal('10.00'))
+        OrderItem.objects.create(order=recent, product=product, quantity=2, unit_price=Decimal('5.00'))
+        old = Order.objects.create(user=staff, customer_name='قديم', phone='2', address='y')
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=30))
+
+        url = reverse('api_orders_export')
+        self.client.force_login(User.objects.create_user(username='buyer', password='pass'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(staff)
+        since = (timezone.localdate() - timedelta(days=1)).isoformat()
+        response = self.client.get(url, {'format': 'csv', 'created_from': since})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('دفتر', lines[1])
+
+        response = self.client.get(url, {'format': 'jsonl'})
+        orders = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([o['order_id'] for o in orders], [recent.pk, old.pk])
+        self.assertEqual(orders[0]['items'][0]['line_total'], '10.00')
+        self.assertEqual(orders[1]['items'], [])
+
+        response = self.client.get(url, {'created_from': '2025-02-01', 'created_to': '2025-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+# ---------------- Sales rollups ----------------
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='pass')
+        cls.staff = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.pen = Product.objects.create(name='قلم', price=Decimal('1.50'), stock=100)
+        cls.book = Product.objects.create(name='كتاب', price=Decimal('10.00'), stock=100)
+
+    def checkout(self, **quantities):
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        CartItem.objects.add_quantities(cart, {getattr(self, name).id: n for name, n in quantities.items()})
+        return place_order(Order(user=self.user, customer_name='عميل', phone='0599', address='الخليل'), cart)
+
+    def rollups(self):
+        return (
+            list(DailySales.objects.values_list('date', 'orders', 'units', 'revenue')),
+            sorted(DailyProductSales.objects.values_list('date', 'product_id', 'units', 'revenue')),
+        )
+
+    def test_checkout_updates_rollups_like_a_rebuild(self):
+        self.checkout(pen=2, book=1)
+        self.checkout(pen=4)
+        today = timezone.localdate()
+        self.assertEqual(
+            self.rollups()[0], [(today, 2, 7, Decimal('19.00'))]
+        )
+        incremental = self.rollups()
+        self.assertEqual(rebuild_rollups(), 1)
+        self.assertEqual(self.rollups(), incremental)
+
+        report = sales_report(today - timedelta(days=2), today, top=1)
+        self.assertEqual(len(report['days']), 3)
+        self.assertEqual(report['days'][0]['orders'], 0)
+        self.assertEqual(report['top_products'][0]['product_id'], self.book.id)
+        self.assertEqual(report['totals']['units'], 7)
+
+    def test_deleting_an_order_removes_it(self):
+        first = self.checkout(pen=2)
+        self.checkout(book=1)
+        first.delete()
+        incremental = self.rollups()
+        self.assertEqual(incremental[0][0][1:], (1, 1, Decimal('10.00')))
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_report_api_is_staff_only_and_reads_rollups(self):
+        self.checkout(pen=1)
+        url = reverse('api_sales_report')
+        api = APIClient()
+        api.force_authenticate(self.user)
+        self.assertEqual(api.get(url).status_code, 403)
+
+        api.force_authenticate(self.staff)
+        with CaptureQueriesContext(connection) as ctx:
+            response = api.get(url, {'top': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['days']), 30)
+        self.assertEqual(response.data['totals']['orders'], 1)
+        self.assertFalse([q for q in ctx.captured_queries if 'products_orderitem' in q['sql']])
+        self.assertEqual(api.get(url, {'date_from': '2026-02-01', 'date_to': '2026-01-01'}).status_code, 400)
+
+        self.client.force_login(self.staff)
+        self.assertContains(self.client.get(reverse('sales_report')), 'قلم')
+
+
+# ---------------- Instrumentation ----------------
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='pass')
+        cls.staff = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        Product.objects.create(name='قلم', price=Decimal('1.00'), stock=3)
+
+    def setUp(self):
+        registry.reset()
+
+    def test_counts_queries_of_drf_views(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            api.get(reverse('api_cart'))
+            api.get(reverse('api_cart'))
+        self.assertEqual(registry.snapshot('api_cart')[:2], (2, len(ctx)))
+
+    async def test_counts_queries_under_asgi(self):
+        # تحت ASGI تُنفَّذ الاستعلامات في thread الـ sync_to_async لا في thread الـ event loop
+        catalog_cache().clear()
+        for name in ('async_api_products', 'api_products'):
+            response = await self.async_client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            requests, queries, seconds = registry.snapshot(name)
+            self.assertEqual(requests, 1)
+            self.assertGreater(queries, 0)
+        with override_settings(QUERY_BUDGETS={'api_products': 0}), self.assertRaises(QueryBudgetExceeded):
+            await self.async_client.get(reverse('api_products'), {'sort': 'price'})
+
+    @override_settings(QUERY_BUDGETS={'home_page': 0})
+    def test_query_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('home_page'))
+        with self.settings(QUERY_BUDGET_RAISE=False), self.assertLogs('products.middleware', 'WARNING'):
+            self.assertEqual(self.client.get(reverse('home_page')).status_code, 200)
+
+    def test_metrics_endpoint_is_staff_only(self):
+        self.client.get(reverse('home_page'))
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        self.client.force_login(self.staff)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('shop_http_requests_total{view="home_page",method="GET",status="200"} 1', body)
+        self.assertIn('shop_http_request_duration_seconds_bucket{view="home_page",le="+Inf"} 1', body)
+        self.assertIn('# TYPE shop_db_queries_per_request histogram', body)
+
+    def test_profiling_is_staff_only(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('home_page'), {'_profile': '1'})
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+        self.client.force_login(self.staff)
+        with self.settings(REQUEST_PROFILING=True):
+            response = self.client.get(reverse('home_page'), {'_profile': '1'})
+        self.assertIn('function calls', response.content.decode())
+
+
+# ---------------- Benchmark helpers ----------------
+class BenchmarkHelperTests(TestCase):
+    def test_seeded_history_matches_rollups(self):
+        seed_products(30, batch_size=7)
+        users = seed_users(4)
+        self.assertEqual(seed_orders(users, 25, lines=2, batch_size=10), 25)
+        self.assertEqual(OrderItem.objects.count(), 50)
+        self.assertEqual(sum(DailySales.objects.values_list('orders', flat=True)), 25)
+        self.assertEqual(
+            sum(DailySales.objects.values_list('revenue', flat=True)), Order.objects.revenue()
+        )
+
+    def test_find_regressions(self):
+        def run(p95, queries):
+            return {'scenarios': {'cart_page[client]': {'p95_ms': p95, 'queries_per_request': queries}}}
+
+        self.assertEqual(find_regressions(run(10, 4), run(11.5, 4)), [])
+        self.assertEqual(len(find_regressions(run(10, 4), run(13, 5))), 2)
+
+
+# ---------------- SQLite configuration ----------------
+class SQLiteSettingsTests(TestCase):
+    def test_pragmas_applied_on_connect(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_environment_overrides(self):
+        env = {'SQLITE_PATH': '/tmp/shop.db', 'SQLITE_BUSY_TIMEOUT_MS': '250', 'DB_CONN_MAX_AGE': '0'}
+        with mock.patch.dict(os.environ, env):
+            database = sqlite_database(Path('/srv'))
+        self.assertEqual(database['NAME'], '/tmp/shop.db')
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertEqual(database['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertIn('PRAGMA busy_timeout=250', database['OPTIONS']['init_command'])
+        self.assertIn('PRAGMA journal_mode=WAL', database['OPTIONS']['init_command'])
+
+        with mock.patch.dict(os.environ, {'SQLITE_TUNING': '0'}):
+            self.assertEqual(set(sqlite_database(Path('/srv'))), {'ENGINE', 'NAME'})
+
+
+# ---------------- Replica routing ----------------
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(TestCase):
+    def test_catalog_reads_go_to_replica_until_a_write(self):
+        with routing_scope():
+            self.assertEqual(Product.objects.all().db, 'replica1')
+            self.assertEqual(Cart.objects.all().db, 'default')
+            self.assertEqual(User.objects.all().db, 'default')
+            self.assertEqual(Product.objects.select_for_update().db, 'default')
+            # بعد الكتابة تبقى القراءات على الأساسية حتى نهاية الطلب
+            self.assertEqual(Product.objects.all().db, 'default')
+        with routing_scope():
+            self.assertEqual(Product.objects.all().db, 'replica1')
+
+    def test_middleware_pins_browser_after_write(self):
+        seen = []
+
+        def view(request):
+            seen.append(Product.objects.all().db)
+            if request.path == '/write/':
+                Product.objects.none().update(stock=0)
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(view)
+        factory = RequestFactory()
+        with routing_scope():
+            self.assertNotIn('db_primary', middleware(factory.get('/read/')).cookies)
+            response = middleware(factory.get('/write/'))
+            self.assertEqual(response.cookies['db_primary']['max-age'], 15)
+            middleware(factory.get('/read/', HTTP_COOKIE='db_primary=1'))
+            middleware(factory.post('/form/'))
+        self.assertEqual(seen, ['replica1', 'replica1', 'default', 'default'])
+
+
+# ---------------- Anonymous carts ----------------
+class AnonymousCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='pass')
+        cls.pen = Product.objects.create(name='قلم', price=Decimal('1.50'), stock=10)
+        cls.book = Product.objects.create(name='كتاب', price=Decimal('10.00'), stock=10)
+
+    def writes(self, ctx):
+        return [q['sql'] for q in ctx.captured_queries if not q['sql'].lstrip().upper().startswith('SELECT')]
+
+    def test_browsing_cart_writes_nothing(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('add_to_cart', args=[self.pen.id]))
+            self.client.get(reverse('add_to_cart', args=[self.pen.id]))
+            self.client.get(reverse('add_to_cart', args=[self.book.id]))
+            response = self.client.get(reverse('view_cart'))
+            api = self.client.get(reverse('api_cart')).json()
+        self.assertEqual(self.writes(ctx), [])
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(response.context['total'], Decimal('13.00'))
+        self.assertEqual([(i['product']['id'], i['quantity']) for i in api['items']], [(self.pen.id, 2), (self.book.id, 1)])
+
+        self.client.get(reverse('remove_from_cart', args=[self.pen.id]))
+        self.assertEqual([i.product_id for i in self.client.get(reverse('view_cart')).context['items']], [self.book.id])
+
+    def test_tampered_cookie_is_ignored(self):
+        self.client.cookies['cart'] = f'{self.pen.id}:5'
+        self.assertEqual(self.client.get(reverse('view_cart')).context['items'], [])
+
+    def test_login_merges_in_bulk(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.pen, quantity=1)
+        self.client.get(reverse('add_to_cart', args=[self.pen.id]))
+        self.client.get(reverse('add_to_cart', args=[self.book.id]))
+
+        response = self.client.post(reverse('login'), {'username': 'buyer', 'password': 'pass'})
+        self.assertEqual(response.cookies['cart'].value, '')
+        self.assertEqual(
+            dict(cart.items.values_list('product_id', 'quantity')), {self.pen.id: 2, self.book.id: 1}
+        )
+        self.assertEqual(Cart.objects.count(), 1)
+
+
+# ---------------- Sessions and cached user ----------------
+class SessionFastPathTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='pass')
+
+    def setUp(self):
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+
+    def session_queries(self, ctx):
+        return [q['sql'] for q in ctx.captured_queries if 'django_session' in q['sql'] or 'auth_user' in q['sql']]
+
+    def test_logged_in_pages_skip_session_and_user_tables(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('view_cart'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('view_cart'))
+            self.client.get(reverse('add_to_cart', args=[Product.objects.create(name='قلم', price=1, stock=1).id]))
+        self.assertEqual(self.session_queries(ctx), [])
+
+    def test_user_changes_are_seen_on_next_request(self):
+        self.client.force_login(self.user)
+        self.assertNotContains(self.client.get(reverse('home_page')), 'تقارير المبيعات')
+        self.user.is_staff = True
+        self.user.save()
+        self.assertContains(self.client.get(reverse('home_page')), 'تقارير المبيعات')
+
+        self.user.set_password('new-pass')
+        self.user.save()
+        self.assertFalse(self.client.get(reverse('view_cart')).context['user'].is_authenticated)
+
+    def test_prune_sessions_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create([
+            Session(session_key=f'old{i}', session_data='', expire_date=now - timedelta(days=1)) for i in range(7)
+        ] + [Session(session_key='live', session_data='', expire_date=now + timedelta(days=1))])
+        out = io.StringIO()
+        call_command('prune_sessions', batch_size=3, stdout=out)
+        self.assertIn('7', out.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+
+
+# ---------------- Background jobs ----------------
+flaky_calls = []
+
+
+@task('test_flaky', max_attempts=2)
+def flaky(fail):
+    flaky_calls.append(fail)
+    if fail:
+        raise RuntimeError('ERP down')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        flaky_calls.clear()
+
+    def test_idempotency_key_enqueues_once(self):
+        self.assertIsNotNone(enqueue('test_flaky', {'fail': False}, key='k1'))
+        self.assertIsNone(enqueue('test_flaky', {'fail': False}, key='k1'))
+        self.assertEqual(Job.objects.filter(idempotency_key='k1').count(), 1)
+
+    @override_settings(JOBS_BACKOFF_SECONDS=60)
+    def test_failures_back_off_then_give_up(self):
+        enqueue('test_flaky', {'fail': True})
+        [job] = claim('w1', 10)
+        self.assertEqual(claim('w2', 10), [])
+        self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=50))
+        self.assertIn('ERP down', job.last_error)
+        self.assertEqual(claim('w1', 10), [])
+
+        Job.objects.update(run_at=timezone.now())
+        [job] = claim('w1', 10)
+        run_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(flaky_calls, [True, True])
+
+    def test_checkout_queues_side_effects_with_the_order(self):
+        user = User.objects.create_user(username='buyer', password='pass', email='buyer@example.com')
+        pen = Product.objects.create(name='قلم', price=Decimal('2.00'), stock=5)
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=pen, quantity=2)
+        order = place_order(Order(user=user, customer_name='عميل', phone='0599', address='الخليل'), cart)
+        self.assertEqual(
+            set(Job.objects.values_list('name', 'idempotency_key')),
+            {('order_confirmation', f'order-confirmation:{order.id}'),
+             ('erp_inventory_sync', f'erp-sync:order:{order.id}')},
+        )
+
+        for job in claim('w1', 10):
+            self.assertTrue(run_job(job))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(str(order.id), mail.outbox[0].subject)
+        self.assertEqual(mail.outbox[0].to, ['buyer@example.com'])
+
+    def test_failed_checkout_queues_nothing(self):
+        user = User.objects.create_user(username='buyer', password='pass')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=Product.objects.create(name='قلم', price=1, stock=0), quantity=1)
+        with self.assertRaises(OutOfStock):
+            place_order(Order(user=user, customer_name='عميل', phone='0599', address='الخليل'), cart)
+        self.assertFalse(Job.objects.filter(name='order_confirmation').exists())
+
+
+class JobWorkerTests(TransactionTestCase):
+    def test_worker_runs_due_jobs_on_threads(self):
+        for i in range(5):
+            enqueue('test_flaky', {'fail': i == 4})
+        enqueue('test_flaky', {'fail': False}, delay=timedelta(hours=1))
+        out = io.StringIO()
+        call_command('run_jobs', once=True, threads=3, batch=2, stdout=out)
+        self.assertEqual(
+            dict(Job.objects.values_list('status').annotate(n=Count('id')).order_by()),
+            {Job.DONE: 4, Job.PENDING: 2},
+        )
+        self.assertIn('4', out.getvalue())
+
+
+# ---------------- Admin ----------------
+class AdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='pass')
+        cls.products = [Product.objects.create(name=f'منتج {i}', price=Decimal('10.00'), stock=5) for i in range(3)]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_orders(self, count):
+        for i in range(count):
+            order = Order.objects.create(user=self.admin, customer_name='عميل', phone=f'059{i}', address='نابلس')
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=p, quantity=1, unit_price=p.price) for p in self.products
+            ])
+
+    def changelist_queries(self, model, **params):
+        url = reverse(f'admin:products_{model}_changelist')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def test_changelists_do_not_grow_with_rows(self):
+        self.add_orders(1)
+        self.changelist_queries('orderitem')
+        counts = {model: self.changelist_queries(model) for model in ('orderitem', 'order', 'cartitem')}
+        self.add_orders(15)
+        Cart.objects.bulk_create([Cart(user=self.admin)])
+        CartItem.objects.bulk_create([CartItem(cart=Cart.objects.get(), product=p) for p in self.products])
+        self.assertEqual({model: self.changelist_queries(model) for model in counts}, counts)
+
+    def test_search_uses_exact_lookups_and_full_text(self):
+        self.add_orders(2)
+        response = self.client.get(reverse('admin:products_order_changelist'), {'q': '0591'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        self.client.get(reverse('admin:products_order_changelist'), {'q': 'ليس رقماً'})
+        response = self.client.get(reverse('admin:products_product_changelist'), {'q': 'منتج'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+    def test_order_lines_are_read_only(self):
+        # تعديل سطر لا يعيد حساب Order.total ولا تجميعات اليوم
+        self.add_orders(1)
+        order, item = Order.objects.get(), OrderItem.objects.first()
+        response = self.client.get(reverse('admin:products_order_change', args=[order.pk]))
+        formset = response.context['inline_admin_formsets'][0]
+        self.assertFalse(formset.has_add_permission or formset.has_delete_permission)
+        self.assertNotContains(response, 'name="items-0-quantity"')
+        self.assertNotContains(response, 'name="total"')
+        response = self.client.post(reverse('admin:products_orderitem_change', args=[item.pk]), {'quantity': 5})
+        self.assertEqual(response.status_code, 403)
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 1)
+
+    def test_estimated_count_paginator(self):
+        class Small(EstimatedCountPaginator):
+            exact_limit = 2
+
+        self.add_orders(2)
+        items = OrderItem.objects.order_by('id')
+        self.assertGreaterEqual(Small(items, 10).count, items.count())
+        self.assertEqual(Small(items.filter(quantity=1), 10).count, 3)
+        self.assertEqual(EstimatedCountPaginator(items, 10).count, 6)
+
+    def run_action(self, action, value, products, field='value'):
+        return self.client.post(reverse('admin:products_product_changelist'), {
+            'action': action, field: value, '_selected_action': [p.pk for p in products],
+        })
+
+    def test_bulk_price_and_stock_actions_are_single_updates(self):
+        catalog_cache().set('probe', 1)
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            self.run_action('change_price_percent', '-15', self.products[:2])
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]), 1)
+        self.run_action('add_stock', '-7', self.products[1:], field='units')
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('price', 'stock')),
+            [(Decimal('8.50'), 5), (Decimal('8.50'), 0), (Decimal('10.00'), 0)],
+        )
+        self.assertTrue(Job.objects.filter(name='erp_inventory_sync').exists())
+
+        response = self.run_action('set_price', '', self.products)
+        self.assertEqual(Product.objects.filter(price=Decimal('10.00')).count(), 1)
+        self.assertContains(self.client.get(response.url), 'أدخل القيمة')
+        # المخزون بوحدات صحيحة: كسر يُرفض بدل أن يُقطع
+        self.run_action('set_stock', '2.5', self.products, field='units')
+        self.assertEqual(list(Product.objects.order_by('id').values_list('stock', flat=True)), [5, 0, 0])
+        response = self.run_action('set_stock', '', self.products, field='units')
+        self.assertContains(self.client.get(response.url), 'أدخل الوحدات')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_action('set_stock', '4', self.products, field='units')
+        self.assertEqual(list(Product.objects.order_by('id').values_list('stock', flat=True)), [4, 4, 4])
+
+
+# ---------------- Async APIs ----------------
+class AsyncAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='pass')
+        cls.products = [
+            Product.objects.create(name=f'مصباح {i}', price=Decimal('4.50') + i, stock=i) for i in range(5)
+        ]
+        cart = Cart.objects.create(user=cls.user)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=p, quantity=2) for p in cls.products[:3]])
+        order = Order.objects.create(user=cls.user, customer_name='عميل', phone='0599', address='طولكرم')
+        OrderItem.objects.create(order=order, product=cls.products[0], quantity=1, unit_price=Decimal('4.50'))
+
+    def setUp(self):
+        catalog_cache().clear()
+
+    def assertSameResponse(self, sync_url, async_url, **params):
+        sync = self.client.get(sync_url, params)
+        response = self.client.get(async_url, params)
+        self.assertEqual(response.status_code, sync.status_code)
+        # الفرق الوحيد: روابط الصفحات تشير إلى نفس المسار الذي طُلب
+        self.assertEqual(response.content.replace(b'/api/async/', b'/api/'), sync.content)
+        return response
+
+    def test_responses_match_the_sync_views(self):
+        for params in ({}, {'page_size': 2, 'sort': 'price'}, {'q': 'مصباح', 'facets': '1'}, {'min_price': 'x'}):
+            self.assertSameResponse(reverse('api_products'), reverse('async_api_products'), **params)
+        cursor = json.loads(self.client.get(reverse('api_products'), {'page_size': 2}).content)['next']
+        self.assertSameResponse(cursor, cursor.replace('/api/', '/api/async/'))
+        self.assertSameResponse(reverse('api_products'), reverse('async_api_products'), cursor='bad')
+
+        pk = self.products[1].pk
+        self.assertSameResponse(reverse('api_product_detail', args=[pk]), reverse('async_api_product_detail', args=[pk]))
+        self.assertSameResponse(reverse('api_product_detail', args=[0]), reverse('async_api_product_detail', args=[0]))
+        self.assertSameResponse(reverse('api_cart'), reverse('async_api_cart'))
+
+        self.assertSameResponse(reverse('api_orders'), reverse('async_api_orders'))
+
+        self.client.force_login(self.user)
+        self.assertSameResponse(reverse('api_cart'), reverse('async_api_cart'))
+        self.assertSameResponse(reverse('api_orders'), reverse('async_api_orders'))
+
+    def test_conditional_get(self):
+        url = reverse('async_api_product_detail', args=[self.products[0].pk])
+        etag = self.client.get(url).headers['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        etag = self.client.get(reverse('async_api_products')).headers['ETag']
+        self.assertEqual(self.client.get(reverse('async_api_products'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    async def test_served_by_the_asgi_handler(self):
+        response = await self.async_client.get(reverse('async_api_orders'))
+        self.assertEqual(response.status_code, 403)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('async_api_cart'))
+        self.assertEqual(len(response.json()['items']), 3)
+        response = await self.async_client.get(reverse('async_api_orders'))
+        self.assertEqual(response.json()[0]['items'][0]['quantity'], 1)
+        response = await self.async_client.get(reverse('async_api_products'), {'page_size': 2})
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+# ---------------- Fast serializers ----------------
+class FastSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='pass')
+        cls.products = [
+            Product.objects.create(name=f'مصباح {i} 💡', description='سطر\u2028"آخر"\n', price=Decimal('4.05') * i, stock=i)
+            for i in range(1, 4)
+        ]
+        variants = {'card': {'webp': {'name': 'v/card.webp', 'width': 480}, 'jpeg': {'name': 'v/card.jpeg', 'width': 480}}}
+        Product.objects.filter(pk=cls.products[0].pk).update(image='product_images/a.jpg', image_variants=variants)
+        cart = Cart.objects.create(user=cls.user)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=p, quantity=3) for p in cls.products])
+        order = Order.objects.create(user=cls.user, customer_name='عميل', phone='0599', address='طولكرم')
+        OrderItem.objects.create(order=order, product=cls.products[0], quantity=2, unit_price=Decimal('4.05'))
+        Order.objects.create(customer_name='ضيف', phone='0598', address='جنين')
+
+    def setUp(self):
+        catalog_cache().clear()
+
+    def assertSameBytes(self, serializer_class, instance, many=False):
+        fast = read_serializer_class(serializer_class)
+        self.assertIsNot(fast, serializer_class)
+        expected = JSONRenderer().render(serializer_class(instance, many=many).data)
+        self.assertEqual(FastJSONRenderer().render(fast(instance, many=many).data), expected)
+        self.assertEqual(JSONRenderer().render(fast(instance, many=many).data), expected)
+
+    def test_byte_identical_to_drf(self):
+        products = list(Product.objects.order_by('id'))
+        self.assertSameBytes(ProductSerializer, products, many=True)
+        self.assertSameBytes(ProductSerializer, products[0])
+        self.assertSameBytes(CartSerializer, Cart.objects.with_items().with_total().get())
+        self.assertSameBytes(CartSerializer, Cart.objects.with_items().get())
+        self.assertSameBytes(CartItemSerializer, [CartItem(product=p, quantity=2) for p in products], many=True)
+        orders = list(Order.objects.with_items().order_by('id'))
+        self.assertSameBytes(OrderSerializer, orders, many=True)
+        self.assertSameBytes(OrderItemSerializer, orders[0].items.all(), many=True)
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'price': Decimal('10.10'), 'at': timezone.now(), 'lazy': _('Cart'), 1: [None, True, 1.5, 2 ** 70],
+            'text': 'أ\u2029\x00\x1f"\\', 'nested': ({'qs': Product.objects.values_list('id', flat=True)},),
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_views_can_opt_out(self):
+        url = reverse('api_products')
+        fast = self.client.get(url).content
+        catalog_cache().clear()
+        with mock.patch.object(ProductListCreateAPI, 'fast_read', False), \
+                mock.patch('products.serializers.FastProductSerializer.represent') as represent:
+            self.assertEqual(self.client.get(url).content, fast)
+        represent.assert_not_called()
+        self.client.force_login(self.user)
+        self.assertEqual(len(self.client.get(reverse('api_cart')).json()['items']), 3)
+        response = self.client.post(
+            reverse('api_cart_batch'), {'items': [{'product': self.products[0].pk, 'quantity': 1}]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['items'][0]['quantity'], 1)
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        # يعمل داخل قاعدة الاختبار بدل إنشاء قاعدة مؤقتة
+        with mock.patch('products.management.commands.benchmark_serializers.benchmark_database', nullcontext):
+            call_command(
+                'benchmark_serializers', '--products', '20', '--carts', '3', '--orders', '3', '--images', '0',
+                '--repeat', '2', stdout=out,
+            )
+        self.assertIn('FastProductSerializer', out.getvalue())
+
+
+# ---------------- Sparse fieldsets ----------------
+class FieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='pass')
+        cls.products = [
+            Product.objects.create(name=f'مصباح {i}', description='وصف طويل ' * 50, price=Decimal('4.50') + i, stock=i)
+            for i in range(4)
+        ]
+        for i in range(3):
+            order = Order.objects.create(user=cls.user, customer_name='عميل', phone='0599', address='طولكرم', total=9)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=p, quantity=2, unit_price=p.price) for p in cls.products[:2]
+            ])
+        cart = Cart.objects.create(user=cls.user)
+        CartItem.objects.create(cart=cart, product=cls.products[0], quantity=3)
+
+    def setUp(self):
+        catalog_cache().clear()
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def get(self, url, client=None, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = (client or self.api).get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), [query['sql'] for query in queries]
+
+    def test_orders_with_ids_and_totals_only(self):
+        data, queries = self.get(reverse('api_orders'), fields='id,total')
+        self.assertEqual(data[0], {'id': data[0]['id'], 'total': 9.0})
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(queries[0].split(' FROM ')[0], 'SELECT "products_order"."id", "products_order"."total"')
+
+        data, queries = self.get(reverse('api_orders'), fields='id,items')
+        self.assertEqual(len(data[0]['items']), 2)
+        self.assertIsInstance(data[0]['items'][0], int)
+        self.assertEqual(len(queries), 2)
+
+    def test_nested_fields_select_only_their_columns(self):
+        data, queries = self.get(reverse('api_orders'), fields='id,items.quantity,items.product.name')
+        self.assertEqual(data[0]['items'][0], {'product': {'name': 'مصباح 0'}, 'quantity': 2})
+        self.assertEqual(len(queries), 2)
+        self.assertIn('"products_product"."name"', queries[1])
+        self.assertNotIn('description', ' '.join(queries))
+
+        data, queries = self.get(reverse('api_orders'), expand='items')
+        item = data[0]['items'][0]
+        self.assertEqual(item['product'], self.products[0].pk)
+        self.assertEqual(item['total_price'], 9.0)
+        self.assertEqual(set(data[0]), {'id', 'user', 'created_at', 'items', 'total'})
+        self.assertNotIn('products_product', ' '.join(queries))
+
+        full, _ = self.get(reverse('api_orders'))
+        data, _ = self.get(reverse('api_orders'), expand='items,items.product')
+        self.assertEqual(data, full)
+
+    def test_product_list_pages_with_sparse_fields(self):
+        data, queries = self.get(reverse('api_products'), fields='id,name', sort='price', page_size=2)
+        self.assertEqual(data['results'], [{'id': p.pk, 'name': p.name} for p in self.products[:2]])
+        self.assertNotIn('description', ' '.join(queries))
+        data, _ = self.get(data['next'])
+        self.assertEqual([row['id'] for row in data['results']], [p.pk for p in self.products[2:]])
+
+        data, queries = self.get(reverse('api_product_detail', args=[self.products[1].pk]), fields='price')
+        self.assertEqual(data, {'price': '5.50'})
+        self.assertEqual(self.get(reverse('api_product_detail', args=[self.products[1].pk]))[0]['stock'], 1)
+
+    def test_cart_and_errors(self):
+        data, _ = self.get(reverse('api_cart'), client=self.client, fields='total,items.quantity')
+        self.assertEqual(data, {'items': [], 'total': 0})
+        self.client.force_login(self.user)
+        data, _ = self.get(reverse('api_cart'), client=self.client, fields='total,items.quantity')
+        self.assertEqual(data, {'items': [{'quantity': 3}], 'total': 13.5})
+
+        for params in ({'fields': 'nope'}, {'fields': 'total.id'}, {'expand': 'user'}):
+            response = self.api.get(reverse('api_orders'), params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(next(iter(params)), response.json())
+
+    def test_async_views_match(self):
+        self.client.force_login(self.user)
+        for name, params in (
+            ('api_products', {'fields': 'id,price', 'sort': '-price'}),
+            ('api_cart', {'fields': 'id,items', 'expand': 'items'}),
+            ('api_orders', {'fields': 'total,items.product.id'}),
+        ):
+            sync = self.client.get(reverse(name), params)
+            response = self.client.get(reverse(f'async_{name}'), params)
+            self.assertEqual(response.content.replace(b'/api/async/', b'/api/'), sync.content)
+        response = self.client.get(reverse('async_api_product_detail', args=[self.products[0].pk]), {'fields': 'stock'})
+        self.assertEqual(response.json(), {'stock': 0})
+
+
+# ---------------- Inventory ----------------
+class InventoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='pass')
+        cls.product = Product.objects.create(name='ساعة', price=Decimal('20.00'), stock=3)
+
+    def setUp(self):
+        caches[settings.INVENTORY_CACHE_ALIAS].clear()
+        self.client.force_login(self.user)
+
+    def add_to_cart(self, client=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = (client or self.client).get(reverse('add_to_cart', args=[self.product.pk]), follow=True)
+        return [str(m) for m in response.context['messages']]
+
+    def cart_with(self, username, quantity, ttl=None):
+        cart = Cart.objects.create(user=User.objects.create_user(username=username))
+        CartItem.objects.create(cart=cart, product=self.product, quantity=quantity)
+        with self.captureOnCommitCallbacks(execute=True):
+            hold(cart.id, ttl=ttl)
+        return cart
+
+    def assert_consistent(self):
+        units = on_hand([self.product.pk])[self.product.pk]
+        held = sum(StockReservation.objects.values_list('quantity', flat=True))
+        shards = InventoryShard.objects.filter(product=self.product).values_list('available', flat=True)
+        self.assertEqual(sum(shards), units - held)
+        self.assertEqual(sum(StockMovement.objects.values_list('delta', flat=True)), units)
+        self.assertEqual(available([self.product.pk]), {self.product.pk: max(units - held, 0)})
+
+    def test_cart_holds_units_until_sold_out(self):
+        for _ in range(3):
+            self.add_to_cart()
+        self.assertEqual(StockReservation.objects.get().quantity, 3)
+        self.assertEqual(available([self.product.pk]), {self.product.pk: 0})
+        # العدّاد يرفض قبل أي كتابة، وإذا تأخر يرفض الحجز ويلغي إضافة السطر
+        self.assertIn('نفدت الكمية من ساعة.', self.add_to_cart())
+        caches[settings.INVENTORY_CACHE_ALIAS].set(counter_key(self.product.pk), 1)
+        self.assertIn('الكمية المتوفرة غير كافية: ساعة', self.add_to_cart())
+        self.assertEqual(CartItem.objects.get().quantity, 3)
+        self.assertIn('نفدت الكمية من ساعة.', self.add_to_cart(client=self.client_class()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('remove_from_cart', args=[CartItem.objects.get().pk]))
+        self.assertFalse(StockReservation.objects.exists())
+        self.assert_consistent()
+
+    def test_checkout_sells_holds_and_posts_after_commit(self):
+        cart = self.cart_with('held', 2)
+        with override_settings(INVENTORY_POST_ON_COMMIT=False), self.captureOnCommitCallbacks(execute=True):
+            place_order(Order(user=cart.user, customer_name='عميل', phone='0599', address='طولكرم'), cart)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+        self.assertEqual(on_hand([self.product.pk]), {self.product.pk: 1})
+        self.assertFalse(StockReservation.objects.exists())
+        self.assert_consistent()
+
+        out = io.StringIO()
+        call_command('reap_reservations', stdout=out)
+        self.assertIn('1 حركة', out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+        self.assertEqual(
+            list(StockMovement.objects.order_by('id').values_list('kind', 'delta', 'posted')),
+            [('opening', 3, True), ('sale', -2, True)],
+        )
+
+    def test_reaper_returns_expired_and_orphaned_holds(self):
+        expired = self.cart_with('late', 2, ttl=0)
+        kept = self.cart_with('early', 1)
+        with self.assertRaises(OutOfStock):
+            self.cart_with('third', 1)
+        self.assertEqual(available([self.product.pk]), {self.product.pk: 0})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(release_expired(), 1)
+        self.assertEqual(available([self.product.pk]), {self.product.pk: 2})
+
+        kept.delete()
+        self.assertEqual(StockReservation.objects.filter(cart=None).count(), 1)
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reap_reservations', batch=1, stdout=out)
+        self.assertIn('أُعيد 1 حجز', out.getvalue())
+        # سلة انتهى حجزها تُحجز من جديد عند الطلب
+        with self.captureOnCommitCallbacks(execute=True):
+                place_order(Order(user=expired.user, customer_name='عميل', phone='0599', address='قلقيلية'), expired)
+        self.assertEqual(StockReservation.objects.count(), 0)
+        self.assert_consistent()
+
+    def test_stale_counter_does_not_turn_buyers_away(self):
+        # عدّاد worker آخر لم يرَ الإرجاع: الصفر يُراجَع من القاعدة قبل الرفض
+        caches[settings.INVENTORY_CACHE_ALIAS].set(counter_key(self.product.pk), 0)
+        self.assertIn('تمت إضافة ساعة إلى السلة.', self.add_to_cart())
+        self.assertEqual(StockReservation.objects.get().quantity, 1)
+        self.assert_consistent()
+
+    def test_change_during_counter_load_is_not_lost(self):
+        # التغيير يصل بعد قراءة القاعدة وقبل add: القيمة القديمة لا تبقى في الكاش
+        def read_then_change(product_ids):
+            totals = _available_in_db(product_ids)
+            _bump({self.product.pk: -2})
+            return totals
+
+        with mock.patch('products.inventory._available_in_db', read_then_change):
+            self.assertEqual(available([self.product.pk]), {self.product.pk: 3})
+        self.assertIsNone(caches[settings.INVENTORY_CACHE_ALIAS].get(counter_key(self.product.pk)))
+        self.assertEqual(available([self.product.pk]), {self.product.pk: 3})
+        self.assertEqual(caches[settings.INVENTORY_CACHE_ALIAS].get(counter_key(self.product.pk)), 3)
+
+    def test_editing_a_product_keeps_ledger_stock(self):
+        # توريد يُرحَّل أثناء تعبئة النموذج؛ الحفظ لا يعيد المخزون الذي قرأه قبله
+        def write_meanwhile(form):
+            adjust({self.product.pk: 1}, kind=StockMovement.RECEIPT)
+            return form.cleaned_data
+
+        self.client.force_login(User.objects.create_superuser(username='staff'))
+        data = {'name': 'ساعة يد', 'price': '21.00', 'description': '', 'sku': ''}
+        for url in (
+            reverse('edit_product', args=[self.product.pk]),
+            reverse('admin:products_product_change', args=[self.product.pk]),
+        ):
+            with mock.patch('django.forms.models.BaseModelForm.clean', autospec=True, side_effect=write_meanwhile), \
+                    self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.price, self.product.stock), ('ساعة يد', Decimal('21.00'), 5))
+        self.assertEqual(sum(StockMovement.objects.values_list('delta', flat=True)), 5)
+
+    def test_stock_changes_are_ledger_movements(self):
+        self.cart_with('held', 2)
+        serializer = ProductSerializer(self.product, data={'name': 'ساعة', 'price': '20.00', 'stock': 1})
+        self.assertTrue(serializer.is_valid())
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.save()
+        self.assertEqual(serializer.data['stock'], 1)
+        self.assertEqual(StockMovement.objects.latest('id').delta, -2)
+        # مخزون أقل من المحجوز: لا شيء متاح حتى يعود الحجز
+        self.assert_consistent()
+        with self.captureOnCommitCallbacks(execute=True):
+            adjust({self.product.pk: 4}, kind=StockMovement.RECEIPT)
+        self.assertEqual(available([self.product.pk]), {self.product.pk: 3})
+        self.assert_consistent()
+        self.assertTrue(Job.objects.filter(name='erp_inventory_sync').exists())
+
+        response = self.client.get(reverse('api_product_availability'), {'ids': f'{self.product.pk},999999'})
+        self.assertEqual(response.json(), {str(self.product.pk): 3})
+        self.assertEqual(self.client.get(reverse('api_product_availability'), {'ids': 'x'}).status_code, 400)
+
+
+class FlashSaleStressTests(TransactionTestCase):
+    """مشترون كثيرون على نفس المنتج يحجزون ويطلبون ويتركون السلة، والـ reaper يعمل في نفس الوقت."""
+
+    buyers = 16
+    rounds = 3
+    units = 20
+
+    def retry(self, operation):
+        for attempt in range(100):
+            try:
+                return operation()
+            except OperationalError:
+                # SQLite يرفض الكتابة المتزامنة بدل الانتظار، نعيد المحاولة
+                time.sleep(0.005 * (attempt + 1))
+        raise OperationalError("database stayed locked")
+
+    def test_holds_checkout_and_reaper_never_oversell(self):
+        product = Product.objects.create(name='عرض خاطف', price=Decimal('5.00'), stock=self.units)
+        users = User.objects.bulk_create([User(username=f'flash{i}') for i in range(self.buyers)])
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        barrier = threading.Barrier(self.buyers + 1)
+        stop = threading.Event()
+        results, errors = [], []
+
+        def buyer(seed, cart):
+            rng = random.Random(seed)
+            barrier.wait()
+            try:
+                for _ in range(self.rounds):
+                    quantity, abandon = rng.randint(1, 3), rng.random() < 0.4
+
+                    def add():
+                        with transaction.atomic():
+                            CartItem.objects.set_quantities(cart, {product.id: quantity})
+                            # السلة المتروكة ينتهي حجزها فوراً ويعيده الـ reaper
+                            hold(cart.id, [product.id], ttl=0 if abandon else None)
+
+                    def buy():
+                        order = Order(user_id=cart.user_id, customer_name='عميل', phone='0599', address='أريحا')
+                        place_order(order, cart)
+
+                    try:
+                        self.retry(add)
+                        if abandon:
+                            results.append('abandoned')
+                            continue
+                        self.retry(buy)
+                        results.append('ok')
+                    except OutOfStock:
+                        results.append('out')
+            except Exception as e:
+                errors.append(repr(e))
+            finally:
+                connections.close_all()
+
+        def reaper():
+            barrier.wait()
+            try:
+                while not stop.is_set():
+                    self.retry(release_expired)
+                    self.retry(post_movements)
+                    time.sleep(0.005)
+            except Exception as e:
+                errors.append(repr(e))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=buyer, args=(i, cart)) for i, cart in enumerate(carts)]
+        threads.append(threading.Thread(target=reaper))
+        for t in threads:
+            t.start()
+        for t in threads[:-1]:
+            t.join()
+        stop.set()
+        threads[-1].join()
+
+        self.assertEqual(errors, [])
+        self.assertIn('out', results)
+        post_movements()
+        product.refresh_from_db()
+        sold = sum(OrderItem.objects.values_list('quantity', flat=True))
+        self.assertGreater(sold, 0)
+        self.assertLessEqual(sold, self.units)
+        self.assertEqual(product.stock, self.units - sold)
+        self.assertEqual(on_hand([product.pk]), {product.pk: product.stock})
+        self.assertEqual(sum(StockMovement.objects.values_list('delta', flat=True)), product.stock)
+        self.assertEqual(Order.objects.count(), results.count('ok'))
+
+        shards = list(InventoryShard.objects.filter(product=product).values_list('available', flat=True))
+        held = sum(StockReservation.objects.values_list('quantity', flat=True))
+        self.assertTrue(all(units >= 0 for units in shards))
+        self.assertEqual(sum(shards), product.stock - held)
+        release_expired(now=timezone.now() + timedelta(days=1))
+        self.assertEqual(InventoryShard.objects.filter(product=product).aggregate(n=Sum('available'))['n'], product.stock)
@@ -2,8 +2,11 @@ from django.urls import path
 from .views import (
     HomePageView, ProductCreateView, ProductUpdateView, ProductDeleteView,
     CartView, AddToCartView, RemoveFromCartView, CheckoutView,
-    ProductListCreateAPI, ProductDetailAPI, CartListAPI, OrderListCreateAPI,
-    OrderDetailAPI, RegisterView, MyOrdersView
+    ProductListCreateAPI, ProductDetailAPI, CartListAPI, CartBatchAPI, OrderListCreateAPI,
+    OrderDetailAPI, RegisterView, MyOrdersView, CatalogCacheStatsView,
+    ProductImportAPI, ProductExportView, ProductAvailabilityAPI, OrderExportView,
+    SalesReportView, SalesReportAPI, MetricsView,
+    AsyncProductListAPI, AsyncProductDetailAPI, AsyncCartAPI, AsyncOrderListAPI,
 )
 
 urlpatterns = [
@@ -22,16 +25,34 @@ urlpatterns = [
     path('checkout/', CheckoutView.as_view(), name='checkout'),
     path('register/', RegisterView.as_view(), name='register'),
     path('my-orders/', MyOrdersView.as_view(), name='my_orders'),
+    path('catalog/cache-stats/', CatalogCacheStatsView.as_view(), name='catalog_cache_stats'),
+    path('reports/sales/', SalesReportView.as_view(), name='sales_report'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),  # Prometheus text format (staff)
 
     # ---------- APIs ----------
     # Products API
     path('api/products/', ProductListCreateAPI.as_view(), name='api_products'),          # GET all, POST new
     path('api/products/<int:pk>/', ProductDetailAPI.as_view(), name='api_product_detail'),  # GET, PUT, DELETE
+    path('api/products/import/', ProductImportAPI.as_view(), name='api_products_import'),  # POST CSV/JSONL file (staff)
+    path('api/products/export/', ProductExportView.as_view(), name='api_products_export'),  # GET streamed CSV/JSONL (staff)
+    path('api/products/availability/', ProductAvailabilityAPI.as_view(), name='api_product_availability'),  # GET ?ids=1,2
 
     # Cart API
     path('api/cart/', CartListAPI.as_view(), name='api_cart'),  # GET cart items (تم السماح للجميع)
+    path('api/cart/items/', CartBatchAPI.as_view(), name='api_cart_batch'),  # POST many line changes at once
 
     # Orders API
     path('api/orders/', OrderListCreateAPI.as_view(), name='api_orders'),                # GET all user orders, POST order
     path('api/orders/<int:pk>/', OrderDetailAPI.as_view(), name='api_order_detail'),      # GET, PUT, DELETE single order
+    path('api/orders/export/', OrderExportView.as_view(), name='api_orders_export'),      # GET streamed CSV/NDJSON (staff)
+
+    # Reports API
+    path('api/reports/sales/', SalesReportAPI.as_view(), name='api_sales_report'),  # GET daily series + top products (staff)
+
+    # ---------- Async APIs (ASGI, read-only) ----------
+    # نفس ردود الـ APIs المتزامنة؛ تُقدَّم من clean_shop.asgi (uvicorn)
+    path('api/async/products/', AsyncProductListAPI.as_view(), name='async_api_products'),
+    path('api/async/products/<int:pk>/', AsyncProductDetailAPI.as_view(), name='async_api_product_detail'),
+    path('api/async/cart/', AsyncCartAPI.as_view(), name='async_api_cart'),
+    path('api/async/orders/', AsyncOrderListAPI.as_view(), name='async_api_orders'),
 ]
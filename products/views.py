@@ -1,15 +1,50 @@
-from django.shortcuts import redirect, get_object_or_404
+from datetime import datetime, time, timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, redirect, get_object_or_404
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, TemplateView, FormView, View
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth import login
+from django.utils import timezone
+from asgiref.sync import sync_to_async
 from .models import Product, Cart, CartItem, Order, OrderItem
-from .forms import ProductForm, OrderForm, CustomerRegisterForm
+from .forms import ProductForm, OrderForm, CustomerRegisterForm, ProductFilterForm, OrderExportForm, SalesReportForm
+from .analytics import sales_report
+from . import inventory
+from .carts import AnonymousCart
+from .checkout import place_order, EmptyCart, OutOfStock
+from .cache import (
+    catalog_cache, cache_stats, product_facets_key, product_list_key, product_detail_key, aproduct_list_key,
+)
+from .metrics import registry
+from .conditional import (
+    AsyncConditionalGetMixin, ListValidatorsMixin, DetailValidatorsMixin, LIST_STATS,
+    list_validators, make_etag, validators_queryset,
+)
+from .search import search_available, search_products
+from .filters import filter_products, product_facets
+from .bulk import export_order_rows, export_rows, import_rows, iter_rows
+from .pagination import (
+    KeysetPaginator, InvalidCursor, ProductCursorPagination, PRODUCT_ORDERING_COLUMNS, get_product_ordering
+)
 
 # REST Framework
-from rest_framework import generics
-from rest_framework.permissions import AllowAny  # <-- تعديل هنا
-from .serializers import ProductSerializer, CartSerializer, OrderSerializer
+from rest_framework import generics, views
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser  # <-- تعديل هنا
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound, PermissionDenied, ValidationError
+from rest_framework.response import Response
+from .renderers import FastJSONRenderer
+from .serializers import (
+    ProductSerializer, CartSerializer, CartItemSerializer, OrderSerializer, CartBatchSerializer,
+    fieldset_for, read_serializer_class,
+)
 
 
 # ---------------- Pages ----------------
@@ -17,7 +52,54 @@ class HomePageView(ListView):
     model = Product
     template_name = 'products/home.html'
     context_object_name = 'products'
-    ordering = ['-id']
+    paginate_by = 24
+
+    def get_search_query(self):
+        return self.request.GET.get('q', '').strip()
+
+    def get_filters(self):
+        # الحقول غير الصالحة تُتجاهل في الصفحة بدل إظهار خطأ
+        if not hasattr(self, 'filter_form'):
+            self.filter_form = ProductFilterForm(self.request.GET)
+            self.filter_form.is_valid()
+        return self.filter_form.cleaned_data
+
+    def search_queryset(self):
+        return search_products(super().get_queryset(), self.get_search_query())
+
+    def get_queryset(self):
+        return filter_products(self.search_queryset(), self.get_filters())
+
+    def get_sort(self):
+        return get_product_ordering(self.request.GET.get('sort'), searching=bool(self.get_search_query()))
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, self.get_sort(), page_size)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("مؤشر الصفحة غير صالح.")
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['sort'] = self.get_sort()
+        context['q'] = self.get_search_query()
+        context['filter_form'] = self.filter_form
+        context['facets'] = self.get_facets()
+        context['card_cache_timeout'] = settings.CATALOG_CACHE_TIMEOUT
+        return context
+
+    def get_facets(self):
+        # تجميع على كل الجدول المفلتر: مرة لكل بحث وفلاتر في كل جيل من الكتالوج، لا مع كل صفحة
+        filters = self.get_filters()
+        cache = catalog_cache()
+        key = product_facets_key(self.get_search_query(), filters)
+        facets = cache.get(key)
+        if facets is None:
+            facets = product_facets(self.search_queryset(), filters)
+            cache.set(key, facets)
+        return facets
 
 
 class ProductCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
@@ -41,8 +123,11 @@ class ProductUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     success_url = '/'
 
     def form_valid(self, form):
+        # حقول النموذج فقط: لا نكتب مخزوناً أو نسخاً مصغّرة قرأناها قبل التعديل
+        self.object = form.save(commit=False)
+        self.object.save(update_fields=[*form.changed_data, 'updated_at'])
         messages.success(self.request, "تم تعديل المنتج.")
-        return super().form_valid(form)
+        return redirect(self.get_success_url())
 
     def test_func(self):
         return self.request.user.is_staff
@@ -61,37 +146,69 @@ class ProductDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return self.request.user.is_staff
 
 
-class CartView(LoginRequiredMixin, TemplateView):
+class CartView(TemplateView):
     template_name = 'products/cart.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
-        total = sum(item.product.price * item.quantity for item in cart.items.all())
+        if not self.request.user.is_authenticated:
+            # سلة الزائر من الكوكي: قراءة المنتجات فقط بدون إنشاء صف Cart
+            items = AnonymousCart.from_request(self.request).items()
+            context.update(cart=None, items=items, total=AnonymousCart.total_price(items))
+            return context
+        cart, created = Cart.objects.with_items().with_total().get_or_create(user=self.request.user)
         context['cart'] = cart
-        context['total'] = total
+        context['items'] = list(cart.items.all())
+        context['total'] = cart.total_price()
         return context
 
 
-class AddToCartView(LoginRequiredMixin, View):
+class AddToCartView(View):
     def get(self, request, product_id):
-        product = get_object_or_404(Product, id=product_id)
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-        if not created:
-            cart_item.quantity += 1
-        cart_item.save()
+        product = get_object_or_404(Product.objects.only('id', 'name'), id=product_id)
+        response = redirect('view_cart')
+        # رفض سريع قبل أي كتابة (العدّاد، ثم القاعدة إذا قال صفر)؛ الحجز نفسه يتحقق من الشرائح
+        if not inventory.in_stock(product.id):
+            messages.error(request, f"نفدت الكمية من {product.name}.")
+            return response
+        if request.user.is_authenticated:
+            cart, created = Cart.objects.get_or_create(user=request.user)
+            try:
+                with transaction.atomic():
+                    CartItem.objects.add_quantities(cart, {product.id: 1})
+                    inventory.hold(cart.id, [product.id])
+            except OutOfStock as e:
+                messages.error(request, f"الكمية المتوفرة غير كافية: {e}")
+                return response
+        else:
+            cart = AnonymousCart.from_request(request)
+            if not cart.add(product.id):
+                messages.error(request, "السلة ممتلئة.")
+                return response
+            cart.save(response)
         messages.success(request, f"تمت إضافة {product.name} إلى السلة.")
-        return redirect('view_cart')
+        return response
 
 
-class RemoveFromCartView(LoginRequiredMixin, View):
+class RemoveFromCartView(View):
     def get(self, request, item_id):
-        cart = Cart.objects.get(user=request.user)
-        item = get_object_or_404(CartItem, id=item_id, cart=cart)
-        item.delete()
+        response = redirect('view_cart')
+        if request.user.is_authenticated:
+            item = CartItem.objects.filter(id=item_id, cart__user=request.user).values('cart_id', 'product_id').first()
+            deleted = item is not None
+            if deleted:
+                with transaction.atomic():
+                    CartItem.objects.filter(id=item_id).delete()
+                    inventory.hold(item['cart_id'], [item['product_id']])
+        else:
+            # للزائر: المعرّف هو رقم المنتج في سلة الكوكي
+            cart = AnonymousCart.from_request(request)
+            deleted = cart.remove(item_id)
+            cart.save(response)
+        if not deleted:
+            raise Http404
         messages.success(request, "تم حذف المنتج من السلة.")
-        return redirect('view_cart')
+        return response
 
 
 class CheckoutView(LoginRequiredMixin, FormView):
@@ -101,23 +218,29 @@ class CheckoutView(LoginRequiredMixin, FormView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cart = Cart.objects.filter(user=self.request.user).first()
-        total = sum(item.product.price * item.quantity for item in cart.items.all()) if cart else 0
+        cart = self.get_cart()
         context['cart'] = cart
-        context['total'] = total
+        context['items'] = list(cart.items.all()) if cart else []
+        context['total'] = cart.total_price() if cart else 0
         return context
 
+    def get_cart(self):
+        return Cart.objects.with_items().with_total().filter(user=self.request.user).first()
+
     def form_valid(self, form):
         cart = Cart.objects.filter(user=self.request.user).first()
-        if not cart or not cart.items.exists():
-            messages.error(self.request, "السلة فارغة.")
-            return redirect('home_page')
         order = form.save(commit=False)
         order.user = self.request.user
-        order.save()
-        for item in cart.items.all():
-            OrderItem.objects.create(order=order, product=item.product, quantity=item.quantity)
-        cart.delete()
+        try:
+            if cart is None:
+                raise EmptyCart()
+            place_order(order, cart)
+        except EmptyCart:
+            messages.error(self.request, "السلة فارغة.")
+            return redirect('home_page')
+        except OutOfStock as e:
+            messages.error(self.request, f"الكمية المتوفرة غير كافية: {e}")
+            return redirect('view_cart')
         messages.success(self.request, "تم تأكيد الطلب بنجاح.")
         return super().form_valid(form)
 
@@ -140,41 +263,438 @@ class MyOrdersView(LoginRequiredMixin, ListView):
     context_object_name = 'orders'
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        return (
+            Order.objects.filter(user=self.request.user)
+            .with_items()
+            .order_by('-created_at')
+        )
+
+
+class CatalogCacheStatsView(LoginRequiredMixin, UserPassesTestMixin, View):
+    # عدادات الـ worker الذي أجاب فقط (انظر products/cache.py)، لا مجموع كل الـ workers
+    def get(self, request):
+        return JsonResponse(cache_stats())
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+
+class MetricsView(LoginRequiredMixin, UserPassesTestMixin, View):
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+
+class SalesReportView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
+    template_name = 'products/sales_report.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = SalesReportForm(self.request.GET)
+        context['form'] = form
+        if form.is_valid():
+            data = form.cleaned_data
+            context['report'] = sales_report(data['date_from'], data['date_to'], data['top'])
+        return context
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+
+class StreamingExportView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Base for staff-only CSV/JSONL downloads streamed row by row."""
+    formats = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson', 'ndjson': 'application/x-ndjson'}
+    filename = 'export'
+
+    def get(self, request):
+        fmt = request.GET.get('format', 'csv')
+        if fmt not in self.formats:
+            return JsonResponse({'detail': "صيغة غير مدعومة."}, status=400)
+        try:
+            queryset = self.get_queryset()
+        except DjangoValidationError as e:
+            return JsonResponse({'detail': e.message_dict}, status=400)
+        rows = self.export(queryset, 'csv' if fmt == 'csv' else 'jsonl')
+        response = StreamingHttpResponse(rows, content_type=self.formats[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{self.filename}.{fmt}"'
+        return response
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+
+class ProductExportView(StreamingExportView):
+    filename = 'products'
+    export = staticmethod(export_rows)
+
+    def get_queryset(self):
+        form = ProductFilterForm(self.request.GET)
+        form.is_valid()
+        return filter_products(Product.objects.all(), form.cleaned_data)
+
+
+class OrderExportView(StreamingExportView):
+    filename = 'orders'
+    export = staticmethod(export_order_rows)
+
+    def get_queryset(self):
+        form = OrderExportForm(self.request.GET)
+        if not form.is_valid():
+            raise DjangoValidationError(form.errors)
+        queryset = Order.objects.all()
+        # حدود الأيام بالتوقيت المحلي، والنهاية شاملة لليوم كاملاً
+        if form.cleaned_data['created_from']:
+            start = datetime.combine(form.cleaned_data['created_from'], time.min)
+            queryset = queryset.filter(created_at__gte=timezone.make_aware(start))
+        if form.cleaned_data['created_to']:
+            end = datetime.combine(form.cleaned_data['created_to'] + timedelta(days=1), time.min)
+            queryset = queryset.filter(created_at__lt=timezone.make_aware(end))
+        return queryset
 
 
 # ---------------- APIs ----------------
-class ProductListCreateAPI(generics.ListCreateAPIView):
+def unsaved_cart_data(items, user_id, item_serializer, fieldset=None):
+    # سلة الزائر (أو مستخدم بلا سلة بعد): لا صف في قاعدة البيانات
+    if fieldset is not None:
+        return fieldset.represent(AnonymousCart.as_cart(items, user_id))
+    return {
+        'id': None,
+        'user': user_id,
+        'items': item_serializer(items, many=True).data,
+        'total': AnonymousCart.total_price(items),
+    }
+
+
+class FastReadMixin:
+    """
+    GET responses of a generic view through the fast read-only twin of its
+    serializer (products.serializers.FAST_SERIALIZERS); set fast_read =
+    False on a view to go back to DRF's serializer. Writes, and the data
+    returned by PUT/POST, always use the DRF serializer.
+
+    ?fields= / ?expand= (products.serializers.Fieldset) narrow both the
+    response and the query behind it.
+    """
+    fast_read = True
+    # أعمدة يقرؤها الـ view نفسه (مفاتيح الـ cursor) حتى لو لم تُطلب في ?fields=
+    fieldset_columns = ()
+
+    def get_fieldset(self, serializer_class=None):
+        return fieldset_for(serializer_class or self.get_serializer_class(), self.request.query_params)
+
+    def get_read_serializer(self, *args, serializer_class=None, **kwargs):
+        serializer_class = serializer_class or self.get_serializer_class()
+        fieldset = self.get_fieldset(serializer_class)
+        if fieldset is not None:
+            return fieldset.serializer(*args, **kwargs)
+        serializer_class = read_serializer_class(serializer_class, self.fast_read)
+        kwargs.setdefault('context', self.get_serializer_context())
+        return serializer_class(*args, **kwargs)
+
+    def read_queryset(self, queryset):
+        fieldset = self.get_fieldset()
+        return queryset if fieldset is None else fieldset.apply(queryset, also=self.fieldset_columns)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.read_queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_read_serializer(page, many=True).data)
+        return Response(self.get_read_serializer(queryset, many=True).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        # get_object() لكن على الـ queryset المضيَّق
+        queryset = self.read_queryset(self.filter_queryset(self.get_queryset()))
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = generics.get_object_or_404(queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(request, obj)
+        return Response(self.get_read_serializer(obj).data)
+
+
+class ProductListCreateAPI(ListValidatorsMixin, FastReadMixin, generics.ListCreateAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
     permission_classes = [AllowAny]  # <-- تم تعديلها
-
-class ProductDetailAPI(generics.RetrieveUpdateDestroyAPIView):
+    fieldset_columns = PRODUCT_ORDERING_COLUMNS
+
+    def get_filters(self):
+        if not hasattr(self, '_filters'):
+            form = ProductFilterForm(self.request.query_params)
+            if not form.is_valid():
+                raise ValidationError(form.errors)
+            self._filters = form.cleaned_data
+        return self._filters
+
+    def search_queryset(self, queryset):
+        return search_products(super().filter_queryset(queryset), self.request.query_params.get('q'))
+
+    def filter_queryset(self, queryset):
+        return filter_products(self.search_queryset(queryset), self.get_filters())
+
+    def list(self, request, *args, **kwargs):
+        cache = catalog_cache()
+        key = product_list_key(request.build_absolute_uri())
+        data = cache.get(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            if request.query_params.get('facets') in ('1', 'true'):
+                data['facets'] = product_facets(self.search_queryset(self.get_queryset()), self.get_filters())
+            cache.set(key, data)
+        return Response(data)
+
+class ProductImportAPI(views.APIView):
+    """رفع ملف CSV/JSONL (حقل file) لاستيراد المنتجات جماعياً؛ للموظفين فقط."""
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': "الملف مطلوب."})
+        fmt = 'jsonl' if upload.name.endswith(('.jsonl', '.ndjson')) else 'csv'
+        result = import_rows(iter_rows(upload.file, fmt))
+        return Response(result.as_dict())
+
+class ProductAvailabilityAPI(views.APIView):
+    """?ids=1,2,3 → {"1": 4, ...}: what can still be put in a cart, from the cached counters."""
+    max_ids = 100
+
+    def get(self, request):
+        try:
+            ids = [int(pid) for pid in request.GET.get('ids', '').split(',') if pid.strip()]
+        except ValueError:
+            raise ValidationError({'ids': "أرقام منتجات مفصولة بفواصل."})
+        if not ids or len(ids) > self.max_ids:
+            raise ValidationError({'ids': f"من 1 إلى {self.max_ids} منتج."})
+        counts = inventory.available(ids)
+        return Response({str(pid): counts[pid] for pid in ids if pid in counts})
+
+class SalesReportAPI(views.APIView):
+    """Reads only the daily rollups, so the cost depends on the date range, not on order volume."""
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        form = SalesReportForm(request.GET)
+        if not form.is_valid():
+            raise ValidationError(form.errors)
+        data = form.cleaned_data
+        return Response(sales_report(data['date_from'], data['date_to'], data['top']))
+
+
+class ProductDetailAPI(DetailValidatorsMixin, FastReadMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]  # <-- تم تعديلها
 
-class CartListAPI(generics.RetrieveAPIView):
+    def retrieve(self, request, *args, **kwargs):
+        if self.get_fieldset() is not None:
+            # الكاش للرد الكامل فقط (مفتاحه لا يتضمن الحقول ويُمسح بالـ id)
+            return super().retrieve(request, *args, **kwargs)
+        cache = catalog_cache()
+        key = product_detail_key(kwargs['pk'])
+        data = cache.get(key)
+        if data is None:
+            data = super().retrieve(request, *args, **kwargs).data
+            cache.set(key, data)
+        return Response(data)
+
+class CartListAPI(FastReadMixin, generics.RetrieveAPIView):
     serializer_class = CartSerializer
+    authentication_classes = [SessionAuthentication]
     permission_classes = [AllowAny]  # <-- تم تعديلها
 
-    def get_object(self):
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
-        return cart
+    def retrieve(self, request, *args, **kwargs):
+        fieldset = self.get_fieldset()
+        if request.user.is_authenticated:
+            carts = Cart.objects.filter(user=request.user)
+            carts = carts.with_items().with_total() if fieldset is None else fieldset.apply(carts)
+            cart = carts.first()
+            if cart is not None:
+                return Response(self.get_read_serializer(cart).data)
+            items = []
+        else:
+            # الزائر: السلة من الكوكي، ولا يُنشأ أي صف في قاعدة البيانات
+            items = AnonymousCart.from_request(request).items()
+        item_serializer = partial(self.get_read_serializer, serializer_class=CartItemSerializer)
+        return Response(unsaved_cart_data(items, request.user.pk, item_serializer, fieldset))
+
+class CartBatchAPI(FastReadMixin, generics.GenericAPIView):
+    """يطبق عدة تعديلات على السلة في معاملة واحدة (مزامنة السلة من تطبيق الجوال)."""
+    serializer_class = CartBatchSerializer
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart, created = Cart.objects.get_or_create(user=request.user)
+        serializer.save(cart=cart)
+        carts = Cart.objects.filter(pk=cart.pk)
+        fieldset = self.get_fieldset(CartSerializer)
+        cart = (carts.with_items().with_total() if fieldset is None else fieldset.apply(carts)).get()
+        return Response(self.get_read_serializer(cart, serializer_class=CartSerializer).data)
 
-class OrderListCreateAPI(generics.ListCreateAPIView):
+class OrderListCreateAPI(FastReadMixin, generics.ListCreateAPIView):
     serializer_class = OrderSerializer
-    permission_classes = [AllowAny]  # <-- تم تعديلها
+    # طلبات المستخدم نفسه فقط: بلا مصادقة يصل AnonymousUser إلى filter(user=...)
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        return (
+            Order.objects.filter(user=self.request.user)
+            .with_items()
+            .order_by('-created_at')
+        )
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class OrderDetailAPI(generics.RetrieveUpdateDestroyAPIView):
+class OrderDetailAPI(DetailValidatorsMixin, FastReadMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = OrderSerializer
-    permission_classes = [AllowAny]  # <-- تم تعديلها
+    # طلبات المستخدم نفسه فقط: بلا مصادقة يصل AnonymousUser إلى filter(user=...)
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+    # الرد يضم بيانات المنتجات الحالية، فتعديل منتج في الطلب يغيّر الـ ETag أيضاً
+    nested_validators = ('items__product',)
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(user=self.request.user).with_items()
+
+
+# ---------------- Async APIs (ASGI) ----------------
+# نفس ردود الـ APIs أعلاه بايت ببايت، لكن بـ ORM وكاش async: تحت ASGI لا يُحجز
+# thread طوال الطلب، والعميل البطيء لا يشغل worker. تحت WSGI تعمل أيضاً لكن بلا فائدة.
+def api_response(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+class AsyncAPIView(View):
+    """Plain Django async view with DRF's JSON rendering and error format."""
+    fast_read = True  # مثل FastReadMixin
+
+    def get_fieldset(self, serializer_class):
+        return fieldset_for(serializer_class, self.request.GET)
+
+    def serializer(self, serializer_class, *args, **kwargs):
+        fieldset = self.get_fieldset(serializer_class)
+        if fieldset is not None:
+            return fieldset.serializer(*args, **kwargs)
+        return read_serializer_class(serializer_class, self.fast_read)(*args, **kwargs)
+
+    def read_queryset(self, serializer_class, queryset, full=None, also=()):
+        """`queryset` narrowed to ?fields= / ?expand=, or passed through `full` for the whole response."""
+        fieldset = self.get_fieldset(serializer_class)
+        if fieldset is not None:
+            return fieldset.apply(queryset, also=also)
+        return full(queryset) if full else queryset
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except Http404 as exc:
+            return self.handle_exception(NotFound(*exc.args))
+        except APIException as exc:
+            return self.handle_exception(exc)
+
+    @staticmethod
+    def handle_exception(exc):
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        return api_response(data, status=exc.status_code)
+
+    async def get(self, request, *args, **kwargs):
+        return await self.handle(request, *args, **kwargs)
+
+    async def get_user(self, request):
+        user = await request.auser()
+        if not user.is_authenticated:
+            # مثل SessionAuthentication في الـ views المتزامنة: 403 لا 401
+            raise PermissionDenied(NotAuthenticated.default_detail)
+        return user
+
+
+class AsyncProductListAPI(AsyncConditionalGetMixin, AsyncAPIView):
+    pagination_class = ProductCursorPagination
+
+    async def get_queryset(self):
+        form = ProductFilterForm(self.request.GET)
+        if not form.is_valid():
+            raise ValidationError(form.errors)
+        self.filters = form.cleaned_data
+        self.searched = Product.objects.all()
+        query = self.request.GET.get('q')
+        if query:
+            # أول بحث في العملية يفحص وجود جدول FTS5 (استعلام متزامن)، ثم يُحفظ
+            await sync_to_async(search_available)(self.searched.db)
+            self.searched = search_products(self.searched, query)
+        return filter_products(self.searched, self.filters)
+
+    async def get_validators(self):
+        self.queryset = await self.get_queryset()
+        return list_validators(await validators_queryset(self.queryset).aaggregate(**LIST_STATS))
+
+    async def handle(self, request):
+        cache = catalog_cache()
+        key = await aproduct_list_key(request.build_absolute_uri())
+        data = await cache.aget(key)
+        if data is None:
+            pagination = self.pagination_class()
+            queryset = self.read_queryset(ProductSerializer, self.queryset, also=PRODUCT_ORDERING_COLUMNS)
+            page = await pagination.apaginate_queryset(queryset, request)
+            data = pagination.get_paginated_data(self.serializer(ProductSerializer, page, many=True).data)
+            if request.GET.get('facets') in ('1', 'true'):
+                data['facets'] = await sync_to_async(product_facets)(self.searched, self.filters)
+            await cache.aset(key, data)
+        return api_response(data)
+
+
+class AsyncProductDetailAPI(AsyncConditionalGetMixin, AsyncAPIView):
+    async def get_validators(self):
+        pk = self.kwargs['pk']
+        last = await Product.objects.filter(pk=pk).values_list('updated_at', flat=True).afirst()
+        if last is None:
+            return None, None
+        return make_etag(pk, last.isoformat()), last
+
+    async def handle(self, request, pk):
+        if self.get_fieldset(ProductSerializer) is not None:
+            product = await aget_object_or_404(self.read_queryset(ProductSerializer, Product.objects.all()), pk=pk)
+            return api_response(self.serializer(ProductSerializer, product).data)
+        cache = catalog_cache()
+        key = product_detail_key(pk)
+        data = await cache.aget(key)
+        if data is None:
+            data = self.serializer(ProductSerializer, await aget_object_or_404(Product, pk=pk)).data
+            await cache.aset(key, data)
+        return api_response(data)
+
+
+class AsyncCartAPI(AsyncAPIView):
+    async def handle(self, request):
+        user = await request.auser()
+        if user.is_authenticated:
+            carts = self.read_queryset(
+                CartSerializer, Cart.objects.filter(user=user), full=lambda carts: carts.with_items().with_total(),
+            )
+            cart = await carts.afirst()
+            if cart is not None:
+                return api_response(self.serializer(CartSerializer, cart).data)
+            items = []
+        else:
+            items = await AnonymousCart.from_request(request).aitems()
+        item_serializer = partial(self.serializer, CartItemSerializer)
+        return api_response(unsaved_cart_data(items, user.pk, item_serializer, self.get_fieldset(CartSerializer)))
+
+
+class AsyncOrderListAPI(AsyncAPIView):
+    async def handle(self, request):
+        user = await self.get_user(request)
+        orders = self.read_queryset(
+            OrderSerializer, Order.objects.filter(user=user).order_by('-created_at'), full=lambda orders: orders.with_items(),
+        )
+        return api_response(self.serializer(OrderSerializer, [order async for order in orders], many=True).data)